@@ -1,63 +1,298 @@
 #!/usr/bin/env python3
-"""Check if episode has any non-zero actions recorded"""
+"""Check if episode has any non-zero actions recorded
 
+With a single episode file, prints a detailed breakdown. With a directory of
+episode_*.json files or an episodes bundle, scans every episode in parallel
+for broken recordings (no real actions, agents or branches missing) and
+writes a JSON report. Files are read in chunks and each worker stops reading
+as soon as the file is known to be healthy.
+"""
+
+import argparse
+import glob
 import json
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Branches recorded by PartyMemberAgent / BossAgent
+PARTY_BRANCHES = ["movement", "rotation", "attack", "heal", "threat_boost", "class_selection"]
+BOSS_BRANCHES = ["movement", "rotation", "attack", "wall_pickup", "wall_place"]
+
+# class_selection values that mean "no selection"
+INVALID_CLASS_SELECTION = (-1, 4)
+
+READ_CHUNK = 1 << 16
+
+_ACTION_RE = re.compile(r'\{\s*"frame"\s*:\s*(-?\d+)\s*,\s*"agentId"\s*:\s*"((?:[^"\\]|\\.)*)"\s*,'
+                        r'\s*"branch"\s*:\s*"((?:[^"\\]|\\.)*)"\s*,\s*"value"\s*:\s*(-?\d+)[^{}]*\}')
+_ACTIONS_KEY_RE = re.compile(r'"actions"\s*:\s*\[')
+_STRING_LIST_RE = r'"{}"\s*:\s*\[(.*?)\]'
+_FIELD_RE = r'"{}"\s*:\s*("(?:[^"\\]|\\.)*"|-?[\d.eE+-]+)'
+
+
+def is_real_action(branch, value):
+    """Non-zero and not an invalid class_selection"""
+    return value != 0 and not (branch == "class_selection" and value in INVALID_CLASS_SELECTION)
+
+
+def expected_branches(agent_id, agent_class=None):
+    if str(agent_class).lower() == "boss" or "boss" in agent_id.lower():
+        return BOSS_BRANCHES
+    return PARTY_BRANCHES
+
+
+class EpisodeCheck:
+    """Incremental verdict for one episode"""
+
+    def __init__(self, agent_ids, agent_classes):
+        self.agent_ids = list(agent_ids)
+        self.missing = {(a, b) for a, c in zip(self.agent_ids, agent_classes) for b in expected_branches(a, c)}
+        self.seen_agents = set()
+        self.actions = 0
+        self.real_actions = 0
+
+    def add(self, agent_id, branch, value):
+        self.actions += 1
+        self.seen_agents.add(agent_id)
+        self.missing.discard((agent_id, branch))
+        if is_real_action(branch, value):
+            self.real_actions += 1
+
+    @property
+    def healthy(self):
+        """True once nothing can go wrong any more (enables early exit)"""
+        return self.real_actions > 0 and not self.missing and bool(self.agent_ids)
+
+    def issues(self):
+        issues = []
+        if self.actions == 0:
+            issues.append("no_actions")
+        elif self.real_actions == 0:
+            issues.append("no_real_actions")
+        if not self.agent_ids:
+            issues.append("no_agent_ids")
+        missing_agents = sorted(set(self.agent_ids) - self.seen_agents)
+        if missing_agents:
+            issues.append("missing_agents")
+        if any(agent in self.seen_agents for agent, _ in self.missing):
+            issues.append("missing_branches")
+        return issues, missing_agents
+
+    def result(self, **extra):
+        issues, missing_agents = self.issues()
+        result = dict(extra)
+        result.update({
+            "verdict": "broken" if issues else "ok",
+            "issues": issues,
+            "actions_scanned": self.actions,
+            "real_actions": self.real_actions,
+        })
+        if missing_agents:
+            result["missing_agents"] = missing_agents
+        missing_branches = sorted(f"{a}/{b}" for a, b in self.missing if a in self.seen_agents)
+        if missing_branches:
+            result["missing_branches"] = missing_branches
+        return result
+
+
+def _header_field(header, name):
+    match = re.search(_FIELD_RE.format(name), header)
+    return json.loads(match.group(1)) if match else None
+
+
+def _header_list(header, name):
+    match = re.search(_STRING_LIST_RE.format(name), header, re.S)
+    return json.loads(f"[{match.group(1)}]") if match else []
+
+
+def scan_file(path):
+    """Scan one episode file in chunks, stopping as soon as it is known healthy"""
+    started = time.time()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            buffer = ""
+            # Header: everything up to the "actions" array
+            while True:
+                chunk = f.read(READ_CHUNK)
+                buffer += chunk
+                match = _ACTIONS_KEY_RE.search(buffer)
+                if match or not chunk:
+                    break
+            if not match:
+                return {"path": path, "verdict": "broken", "issues": ["no_actions_array"]}
+
+            header, buffer = buffer[:match.start()], buffer[match.end():]
+            check = EpisodeCheck(_header_list(header, "agentIds"), _header_list(header, "agentClassValues"))
+            while True:
+                end = 0
+                for action in _ACTION_RE.finditer(buffer):
+                    check.add(action.group(2), action.group(3), int(action.group(4)))
+                    end = action.end()
+                    if check.healthy:
+                        break
+                if check.healthy:
+                    break
+                buffer = buffer[end:]
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                buffer += chunk
+            return check.result(path=path, episode=_header_field(header, "episode"),
+                                winCondition=_header_field(header, "winCondition"),
+                                early_exit=check.healthy, seconds=round(time.time() - started, 6))
+    except Exception as e:
+        return {"path": path, "verdict": "broken", "issues": ["unreadable"], "error": str(e)}
+
+
+def check_episode(episode, index=None):
+    """Verdict for an already-parsed episode dict (bundle mode)"""
+    check = EpisodeCheck(episode.get("agentIds", []), episode.get("agentClassValues", []))
+    for action in episode.get("actions", []) or []:
+        check.add(action.get("agentId", "unknown"), action.get("branch", "unknown"), action.get("value", 0))
+        if check.healthy:
+            break
+    return check.result(index=index, episode=episode.get("episode"), winCondition=episode.get("winCondition"),
+                        early_exit=check.healthy)
+
+
+def _check_bundle_chunk(args):
+    start, episodes = args
+    return [check_episode(episode, start + i) for i, episode in enumerate(episodes)]
+
+
+def scan_corpus(path, workers=None, chunk_size=64):
+    """
+    Scan a directory of episode files or a bundle; returns one result per episode.
+    Bundles are already parsed in memory, so they only use a pool when workers is given.
+    """
+    if os.path.isdir(path):
+        workers = workers or os.cpu_count() or 1
+        files = sorted(glob.glob(os.path.join(path, "episode_*.json")))
+        if workers == 1:
+            return [scan_file(p) for p in files]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(scan_file, files, chunksize=chunk_size))
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        episodes = data["episodes"] if "episodes" in data else [data]
+    else:
+        episodes = data
+    chunks = [(i, episodes[i:i + chunk_size]) for i in range(0, len(episodes), chunk_size)]
+    if not workers or workers == 1:
+        return [r for chunk in chunks for r in _check_bundle_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [r for part in pool.map(_check_bundle_chunk, chunks) for r in part]
+
+
+def build_report(results, seconds, include_ok=False):
+    by_issue = {}
+    for result in results:
+        for issue in result["issues"]:
+            by_issue[issue] = by_issue.get(issue, 0) + 1
+    broken = [r for r in results if r["verdict"] != "ok"]
+    return {
+        "summary": {
+            "episodes": len(results),
+            "ok": len(results) - len(broken),
+            "broken": len(broken),
+            "early_exits": sum(1 for r in results if r.get("early_exit")),
+            "by_issue": by_issue,
+            "seconds": round(seconds, 3),
+        },
+        "episodes": results if include_ok else broken,
+    }
+
+
+def print_episode_details(episode_file):
+    """Detailed breakdown of one episode file"""
+    with open(episode_file, 'r') as f:
+        data = json.load(f)
+
+    total_actions = len(data['actions'])
+    non_zero_actions = [a for a in data['actions'] if a['value'] != 0]
+
+    # Filter out invalid class_selection values (-1 and 4 are "no selection")
+    real_actions = [a for a in non_zero_actions if is_real_action(a['branch'], a['value'])]
+
+    print(f"Episode: {data['episode']}")
+    print(f"Duration: {data['duration']:.2f}s")
+    print(f"Win Condition: {data['winCondition']}")
+    print(f"\nTotal actions: {total_actions}")
+    print(f"Non-zero actions: {len(non_zero_actions)}")
+    print(f"Real actions (excluding invalid class_selection): {len(real_actions)}")
+    print(f"Zero actions: {total_actions - len(non_zero_actions)}")
+    print(f"Percentage real actions: {len(real_actions) / total_actions * 100:.2f}%")
+
+    if len(real_actions) > 0:
+        print(f"\nFirst 30 real actions:")
+        for i, action in enumerate(real_actions[:30]):
+            print(f"  Frame {action['frame']}: {action['agentId']} - {action['branch']} = {action['value']}")
+
+        # Group by agent
+        print(f"\nReal actions by agent:")
+        by_agent = {}
+        for action in real_actions:
+            agent = action['agentId']
+            if agent not in by_agent:
+                by_agent[agent] = []
+            by_agent[agent].append(action)
+
+        for agent, actions in by_agent.items():
+            print(f"  {agent}: {len(actions)} non-zero actions")
+            # Group by branch
+            by_branch = {}
+            for action in actions:
+                branch = action['branch']
+                if branch not in by_branch:
+                    by_branch[branch] = 0
+                by_branch[branch] += 1
+            for branch, count in by_branch.items():
+                print(f"    {branch}: {count} actions")
+    else:
+        print("\n⚠️  WARNING: No real actions found! The episode only recorded zeros or invalid class selections.")
+        print("This means either:")
+        print("  1. Agents weren't in HeuristicOnly mode")
+        print("  2. Agents weren't selected via ManualControlManager")
+        print("  3. No input was provided during recording")
+        print("  4. Actions were recorded but all were zero (no keys pressed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check episodes for missing or all-zero actions")
+    parser.add_argument("path", help="Episode JSON file, EpisodeData directory, or episodes bundle JSON")
+    parser.add_argument("--report", "-o", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--include-ok", action="store_true", help="List healthy episodes in the report too")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.path):
+        with open(args.path, 'r') as f:
+            head = f.read(READ_CHUNK)
+        if not re.match(r'\s*(\[|\{\s*"episodes"\s*:)', head) and args.report is None:
+            print_episode_details(args.path)
+            return
+
+    started = time.time()
+    results = scan_corpus(args.path, workers=args.workers)
+    report = build_report(results, time.time() - started, include_ok=args.include_ok)
+    summary = report["summary"]
+    print(f"Scanned {summary['episodes']} episodes in {summary['seconds']:.2f}s: "
+          f"{summary['ok']} ok, {summary['broken']} broken {summary['by_issue']}", file=sys.stderr)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.report}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(1 if summary["broken"] else 0)
 
-if len(sys.argv) < 2:
-    print("Usage: python check_episode_actions.py <episode.json>")
-    sys.exit(1)
-
-episode_file = sys.argv[1]
-
-with open(episode_file, 'r') as f:
-    data = json.load(f)
-
-total_actions = len(data['actions'])
-non_zero_actions = [a for a in data['actions'] if a['value'] != 0]
-
-# Filter out invalid class_selection values (-1 and 4 are "no selection")
-real_actions = [a for a in non_zero_actions if not (a['branch'] == 'class_selection' and (a['value'] == -1 or a['value'] == 4))]
-
-print(f"Episode: {data['episode']}")
-print(f"Duration: {data['duration']:.2f}s")
-print(f"Win Condition: {data['winCondition']}")
-print(f"\nTotal actions: {total_actions}")
-print(f"Non-zero actions: {len(non_zero_actions)}")
-print(f"Real actions (excluding invalid class_selection): {len(real_actions)}")
-print(f"Zero actions: {total_actions - len(non_zero_actions)}")
-print(f"Percentage real actions: {len(real_actions) / total_actions * 100:.2f}%")
-
-if len(real_actions) > 0:
-    print(f"\nFirst 30 real actions:")
-    for i, action in enumerate(real_actions[:30]):
-        print(f"  Frame {action['frame']}: {action['agentId']} - {action['branch']} = {action['value']}")
-    
-    # Group by agent
-    print(f"\nReal actions by agent:")
-    by_agent = {}
-    for action in real_actions:
-        agent = action['agentId']
-        if agent not in by_agent:
-            by_agent[agent] = []
-        by_agent[agent].append(action)
-    
-    for agent, actions in by_agent.items():
-        print(f"  {agent}: {len(actions)} non-zero actions")
-        # Group by branch
-        by_branch = {}
-        for action in actions:
-            branch = action['branch']
-            if branch not in by_branch:
-                by_branch[branch] = 0
-            by_branch[branch] += 1
-        for branch, count in by_branch.items():
-            print(f"    {branch}: {count} actions")
-else:
-    print("\n⚠️  WARNING: No real actions found! The episode only recorded zeros or invalid class selections.")
-    print("This means either:")
-    print("  1. Agents weren't in HeuristicOnly mode")
-    print("  2. Agents weren't selected via ManualControlManager")
-    print("  3. No input was provided during recording")
-    print("  4. Actions were recorded but all were zero (no keys pressed)")
 
+if __name__ == "__main__":
+    main()
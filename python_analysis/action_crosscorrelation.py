@@ -0,0 +1,220 @@
+"""
+Lagged cross-correlation of agents' action time series.
+
+Quantifies coordination such as how quickly the Healer heals after the Tank
+attacks, or whether DPS burst after a threat boost. Each episode becomes a
+set of 0/1 indicator series (class x {attack, heal, threat_boost}) over
+frames; all pairs and all lags are computed with one FFT per batch of
+length-sorted, zero-padded episodes and averaged per training window.
+
+corr[i, j, lag] is the Pearson correlation of series i at frame t with
+series j at frame t + lag, so a peak at a positive lag means j follows i.
+coordination_edges() turns the profiles into (source, target, weight,
+"coordination") tuples in the edge format used by the SNA scripts.
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from episode_arrays import (CLASS_NAMES, EncodedEpisodes, encode_episodes, load_episodes,
+                            resolve_classes, window_index)
+
+SIGNAL_BRANCHES = ["attack", "heal", "threat_boost"]
+
+
+@dataclass
+class LagProfiles:
+    """Window-averaged cross-correlation profiles"""
+    correlation: np.ndarray     # (W, C, C, 2 * max_lag + 1) mean correlation
+    episodes: np.ndarray        # (W, C, C) episodes where both series were active
+    max_lag: int                # in frames (after frame_stride)
+    frame_stride: int
+    channel_names: List[str]    # "Class:branch"
+
+    @property
+    def lags(self) -> np.ndarray:
+        return np.arange(-self.max_lag, self.max_lag + 1)
+
+    def peak(self, window: int, source: str, target: str, positive_only: bool = True) -> Tuple[int, float]:
+        """(lag, correlation) of the strongest response of target to source"""
+        i, j = self.channel_names.index(source), self.channel_names.index(target)
+        profile = self.correlation[window, i, j]
+        lags = self.lags
+        if positive_only:
+            profile, lags = profile[self.max_lag + 1:], lags[self.max_lag + 1:]
+        k = int(np.nanargmax(profile)) if np.any(np.isfinite(profile)) else 0
+        return int(lags[k]) * self.frame_stride, float(profile[k]) if len(profile) else 0.0
+
+
+def indicator_batch(enc: EncodedEpisodes, episode_indices: np.ndarray, classes: np.ndarray,
+                    branch_codes: np.ndarray, frame_stride: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (B, C, T) indicator series for a batch of episodes and their true lengths.
+    Channel = class_code * len(branch_codes) + signal index.
+    """
+    num_signals = len(branch_codes)
+    num_channels = len(CLASS_NAMES) * num_signals
+    starts, ends = enc.offsets[episode_indices], enc.offsets[episode_indices + 1]
+    lengths = np.ones(len(episode_indices), dtype=np.int64)
+    rows_per_episode = []
+    for b, (start, end) in enumerate(zip(starts, ends)):
+        frames = enc.action_frame[start:end]
+        if len(frames):
+            lengths[b] = int(frames.max()) // frame_stride + 1
+        rows_per_episode.append(np.arange(start, end))
+
+    series = np.zeros((len(episode_indices), num_channels, int(lengths.max())), dtype=np.float64)
+    rows = np.concatenate(rows_per_episode) if rows_per_episode else np.zeros(0, dtype=np.int64)
+    batch = np.repeat(np.arange(len(episode_indices)), ends - starts)
+    signal = np.full(len(rows), -1)
+    for s, code in enumerate(branch_codes):
+        signal[enc.action_branch[rows] == code] = s
+    keep = (signal >= 0) & (enc.action_value[rows] == 1)
+    rows, batch, signal = rows[keep], batch[keep], signal[keep]
+    cls = np.maximum(classes[enc.action_episode[rows], enc.action_agent[rows]], 0)
+    series[batch, cls * num_signals + signal, enc.action_frame[rows] // frame_stride] = 1.0
+    return series, lengths
+
+
+def batch_crosscorrelation(series: np.ndarray, lengths: np.ndarray, max_lag: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All-pairs lagged Pearson correlation of a padded (B, C, T) batch via FFT.
+    Lags at or beyond an episode's length (no overlapping frames) are NaN.
+    Returns (corr (B, C, C, 2 * max_lag + 1), active (B, C) bool).
+    """
+    num_batch, num_channels, length = series.shape
+    valid = np.arange(length)[None, :] < lengths[:, None]
+    n = lengths[:, None].astype(np.float64)
+    mean = series.sum(axis=2) / n
+    centered = np.where(valid[:, None, :], series - mean[:, :, None], 0.0)
+    std = np.sqrt((centered ** 2).sum(axis=2) / n)
+    active = std > 0
+
+    # Linear (not circular) correlation needs length + max_lag points of padding
+    nfft = 1 << int(np.ceil(np.log2(max(2, length + max_lag))))
+    spectra = np.fft.rfft(centered, n=nfft, axis=2)
+    corr = np.full((num_batch, num_channels, num_channels, 2 * max_lag + 1), np.nan)
+    lag_index = np.r_[nfft - max_lag:nfft, 0:max_lag + 1]
+    channels = np.flatnonzero(active.any(axis=0))
+    for i in channels:
+        raw = np.fft.irfft(np.conj(spectra[:, i:i + 1, :]) * spectra[:, channels, :], n=nfft, axis=2)
+        norm = n[:, :, None] * std[:, i][:, None, None] * std[:, channels][:, :, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr[:, i, channels, :] = raw[:, :, lag_index] / norm
+    pair_active = active[:, :, None] & active[:, None, :]
+    corr[~np.broadcast_to(pair_active[..., None], corr.shape)] = np.nan
+    overlap = np.abs(np.arange(-max_lag, max_lag + 1))[None, :] < lengths[:, None]
+    corr[~np.broadcast_to(overlap[:, None, None, :], corr.shape)] = np.nan
+    return corr, active
+
+
+def lag_profiles(enc: EncodedEpisodes, num_windows: int = 5, max_lag: int = 120, frame_stride: int = 1,
+                 batch_size: int = 64) -> LagProfiles:
+    """Average cross-correlation profiles of every class/signal pair per training window"""
+    branch_codes = np.array([enc.branch_code(b) for b in SIGNAL_BRANCHES])
+    channel_names = [f"{cls}:{branch}" for cls in CLASS_NAMES for branch in SIGNAL_BRANCHES]
+    num_channels = len(channel_names)
+    num_windows = max(1, min(num_windows, max(1, enc.num_episodes)))
+    windows = window_index(enc.num_episodes, num_windows)
+    classes = resolve_classes(enc)
+
+    sums = np.zeros((num_windows, num_channels, num_channels, 2 * max_lag + 1))
+    lag_counts = np.zeros(sums.shape, dtype=np.int64)  # episodes long enough for each lag
+
+    # Sorting by length keeps padding small inside each batch
+    lengths = np.array([enc.action_frame[s:e].max() if e > s else 0
+                        for s, e in zip(enc.offsets[:-1], enc.offsets[1:])])
+    order = np.argsort(lengths, kind="stable")
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        series, true_lengths = indicator_batch(enc, batch, classes, branch_codes, frame_stride)
+        corr, _ = batch_crosscorrelation(series, true_lengths, max_lag)
+        finite = np.isfinite(corr)
+        for w in np.unique(windows[batch]):
+            in_window = windows[batch] == w
+            sums[w] += np.nansum(corr[in_window], axis=0)
+            lag_counts[w] += finite[in_window].sum(axis=0)
+
+    correlation = np.divide(sums, lag_counts, out=np.full(sums.shape, np.nan), where=lag_counts > 0)
+    return LagProfiles(correlation=correlation, episodes=lag_counts[..., max_lag], max_lag=max_lag,
+                       frame_stride=frame_stride, channel_names=channel_names)
+
+
+def coordination_edges(profiles: LagProfiles, window: int, min_correlation: float = 0.05,
+                       skip_same_class: bool = True) -> List[Tuple[str, str, float, str]]:
+    """
+    SNA edges (source_class, target_class, weight, "coordination") for one window.
+    The weight is the peak positive-lag correlation of the target's series
+    after the source's; the best signal pair per class pair is kept.
+    """
+    best = {}
+    for i, source in enumerate(profiles.channel_names):
+        for j, target in enumerate(profiles.channel_names):
+            if profiles.episodes[window, i, j] == 0:
+                continue
+            src_class, tgt_class = source.split(":")[0], target.split(":")[0]
+            if skip_same_class and src_class == tgt_class:
+                continue
+            _, value = profiles.peak(window, source, target)
+            if value >= min_correlation and value > best.get((src_class, tgt_class), 0.0):
+                best[(src_class, tgt_class)] = value
+    return [(src, tgt, weight, "coordination") for (src, tgt), weight in best.items()]
+
+
+def print_profiles(profiles: LagProfiles, pairs: Optional[List[Tuple[str, str]]] = None, seconds_per_frame: float = 1 / 60):
+    """Print peak lag/correlation of selected channel pairs per window"""
+    if pairs is None:
+        pairs = [("Tank:attack", "Healer:heal"), ("Tank:threat_boost", "MeleeDPS:attack"),
+                 ("Tank:threat_boost", "RangedDPS:attack"), ("Boss:attack", "Healer:heal")]
+    print("\n=== Peak Response (positive lags) ===")
+    for source, target in pairs:
+        if source not in profiles.channel_names or target not in profiles.channel_names:
+            continue
+        print(f"\n{source} -> {target}:")
+        for w in range(profiles.correlation.shape[0]):
+            lag, value = profiles.peak(w, source, target)
+            if np.isfinite(value):
+                print(f"  Window {w}: r={value:.3f} at +{lag} frames (~{lag * seconds_per_frame:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FFT cross-correlation of agents' action series")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--windows", "-w", type=int, default=5, help="Number of training windows")
+    parser.add_argument("--max-lag", type=int, default=120, help="Largest lag in (strided) frames")
+    parser.add_argument("--frame-stride", type=int, default=1, help="Downsample frames by this factor")
+    parser.add_argument("--batch-size", type=int, default=64, help="Episodes per FFT batch")
+    parser.add_argument("--output", "-o", default=None, help="Save profiles to this .npz file")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+    enc = encode_episodes(episodes)
+
+    profiles = lag_profiles(enc, num_windows=args.windows, max_lag=args.max_lag,
+                            frame_stride=args.frame_stride, batch_size=args.batch_size)
+    last_frames = np.array([enc.action_frame[s:e].max() if e > s else 0
+                            for s, e in zip(enc.offsets[:-1], enc.offsets[1:])])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        seconds_per_frame = float(np.nanmedian(np.where(last_frames > 0, enc.durations / last_frames, np.nan)))
+    print_profiles(profiles, seconds_per_frame=seconds_per_frame if np.isfinite(seconds_per_frame) else 1 / 60)
+
+    last = profiles.correlation.shape[0] - 1
+    print(f"\n=== Coordination edges (window {last}) ===")
+    for src, tgt, weight, _ in sorted(coordination_edges(profiles, last), key=lambda e: -e[2]):
+        print(f"  {src} -> {tgt}: {weight:.3f}")
+
+    if args.output:
+        np.savez_compressed(args.output, correlation=profiles.correlation, episodes=profiles.episodes,
+                            max_lag=profiles.max_lag, frame_stride=profiles.frame_stride,
+                            channel_names=np.array(profiles.channel_names, dtype=object))
+        print(f"\nSaved lag profiles to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 """
 Analyze ML-Agents episode data
 Loads episode JSONs and analyzes win rates, damage over time, etc.
+
+--fast summarises very large runs in constant memory with mergeable
+sketches (see sketches.py) instead of loading every episode.
 """
 
+import argparse
 import json
 import os
 import glob
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+from episode_arrays import episode_files
+from sketches import CorpusSketches, describe_mask, sketch_files
+
 def load_episode(filepath):
     """Load an episode JSON file"""
     with open(filepath, 'r') as f:
@@ -85,15 +93,71 @@ def analyze_episodes(data_dir="EpisodeData"):
     
     return episodes
 
+def analyze_episodes_fast(data_dir="EpisodeData", workers=1, chunk_size=500):
+    """
+    Sketch-based summary of all episodes in data_dir.
+    Files are split into shards, sketched in worker processes and merged.
+    """
+    files = episode_files(data_dir)
+    if not files:
+        print(f"No episode files found in {data_dir}")
+        return
+
+    workers = max(1, min(workers, len(files)))
+    shards = [files[i::workers] for i in range(workers)]
+    sketches = CorpusSketches()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(sketch_files, shards, [chunk_size] * workers):
+                sketches.merge(part)
+    else:
+        sketches = sketch_files(files, chunk_size)
+
+    print("\n=== Win Rate Analysis ===")
+    total = sketches.episodes
+    for condition, count in sketches.win_conditions.items():
+        print(f"{condition}: {count} ({count / total * 100:.2f}%)")
+
+    quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+    print("\n=== Quantiles (KLL, ~1.65% rank error) ===")
+    for name, sketch in [("Duration (s)", sketches.duration), ("Actions/episode", sketches.actions_per_episode),
+                         ("Event steps/episode", sketches.events_per_episode)]:
+        values = sketch.quantile(quantiles)
+        print(f"{name}: " + ", ".join(f"p{int(q * 100)}={v:.2f}" for q, v in zip(quantiles, values)))
+
+    print("\n=== Action Distribution ===")
+    for branch, count in sketches.branch_counts.most_common():
+        print(f"{branch}: {count}")
+
+    joint = sketches.joint_steps
+    print(f"\n=== Most Frequent Joint Steps (Space-Saving, error <= {joint.n // joint.capacity}) ===")
+    for mask, count, error in joint.top(10):
+        print(f"{describe_mask(mask)}: {count} (+{error})")
+
+    error = sketches.distinct_steps.relative_error * 100
+    print(f"\n=== Distinct Patterns (HyperLogLog, ~{error:.1f}% error) ===")
+    print(f"Joint steps: {sketches.distinct_steps.count():.0f}")
+    print(f"{sketches.shingle_size}-step patterns: {sketches.distinct_patterns.count():.0f}")
+    return sketches
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze ML-Agents episode data")
+    parser.add_argument("data_dir", nargs="?", default=None, help="Path to EpisodeData directory")
+    parser.add_argument("--fast", action="store_true", help="Constant-memory sketch summary for very large runs")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used by --fast")
+    args = parser.parse_args()
+    
     # Default to Unity's persistent data path structure
     # Adjust path as needed
-    data_dir = os.path.join(os.path.expanduser("~"), "AppData", "LocalLow", "DefaultCompany", "bossfight", "EpisodeData")
+    data_dir = args.data_dir or os.path.join(os.path.expanduser("~"), "AppData", "LocalLow", "DefaultCompany", "bossfight", "EpisodeData")
     
     if not os.path.exists(data_dir):
         print(f"Data directory not found: {data_dir}")
         print("Please specify the correct path to EpisodeData directory")
         data_dir = input("Enter path to EpisodeData: ").strip()
     
-    analyze_episodes(data_dir)
+    if args.fast:
+        analyze_episodes_fast(data_dir, workers=args.workers)
+    else:
+        analyze_episodes(data_dir)
 
@@ -0,0 +1,207 @@
+"""
+Bootstrap and Wilson confidence intervals for class performance.
+
+print_class_report() in class_performance.py reports point win rates; early
+in training those swing wildly. This module resamples episodes to put
+intervals on win rate, attacks per episode and duration, per class and
+optionally per training window.
+
+Resamples are drawn as (resamples x episodes) index matrices, turned into
+per-resample episode counts with one flat bincount, and reduced with a single
+matrix product, so 10k resamples over 30k episodes take seconds. Chunks of
+resamples can be spread over a process pool.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from episode_arrays import (CLASS_NAMES, SELECTABLE_CLASSES, WIN_CONDITIONS, EncodedEpisodes,
+                            encode_episodes, load_episodes, resolve_classes, window_index)
+
+_PARTY_WIN = WIN_CONDITIONS.index("party")
+_CLASS_CODES = [CLASS_NAMES.index(c) for c in SELECTABLE_CLASSES]
+
+
+def episode_class_table(enc: EncodedEpisodes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-episode inputs for the interval estimates.
+    Returns (presence (E, C) bool, attacks (E, C) int, party_win (E,) bool, durations (E,))
+    with C = SELECTABLE_CLASSES.
+    """
+    classes = resolve_classes(enc)
+    presence = np.stack([(classes == code).any(axis=1) for code in _CLASS_CODES], axis=1)
+
+    attacks = np.zeros((enc.num_episodes, len(_CLASS_CODES)), dtype=np.int64)
+    attack = enc.branch_code("attack")
+    if attack >= 0:
+        rows = np.flatnonzero((enc.action_branch == attack) & (enc.action_value == 1))
+        ep = enc.action_episode[rows]
+        agent_class = classes[ep, enc.action_agent[rows]]
+        for c, code in enumerate(_CLASS_CODES):
+            attacks[:, c] = np.bincount(ep[agent_class == code], minlength=enc.num_episodes)
+
+    party_win = enc.win_conditions == _PARTY_WIN
+    return presence, attacks, party_win, enc.durations
+
+
+def wilson_interval(successes, trials, z: float = 1.96) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for a binomial proportion (vectorised)"""
+    successes = np.asarray(successes, dtype=np.float64)
+    trials = np.asarray(trials, dtype=np.float64)
+    safe = np.maximum(trials, 1.0)
+    p = successes / safe
+    denom = 1.0 + z ** 2 / safe
+    center = (p + z ** 2 / (2 * safe)) / denom
+    half = z * np.sqrt(p * (1 - p) / safe + z ** 2 / (4 * safe ** 2)) / denom
+    low = np.where(trials > 0, center - half, np.nan)
+    high = np.where(trials > 0, center + half, np.nan)
+    return low, high
+
+
+def resample_counts(rng: np.random.Generator, num_items: int, num_resamples: int) -> np.ndarray:
+    """(R, n) multiplicity of each item in R bootstrap resamples, from an index matrix"""
+    index = rng.integers(0, num_items, size=(num_resamples, num_items), dtype=np.int64)
+    index += np.arange(num_resamples, dtype=np.int64)[:, None] * num_items
+    return np.bincount(index.ravel(), minlength=num_resamples * num_items).reshape(num_resamples, num_items)
+
+
+def _bootstrap_chunk(values: np.ndarray, num_resamples: int, seed) -> np.ndarray:
+    """Weighted column sums for one chunk of resamples (runs in worker processes)"""
+    rng = np.random.default_rng(seed)
+    counts = resample_counts(rng, values.shape[0], num_resamples)
+    return counts @ values
+
+
+def bootstrap_sums(values: np.ndarray, num_resamples: int = 10000, seed: int = 0,
+                   chunk_size: int = 250, workers: int = 1) -> np.ndarray:
+    """
+    Bootstrap column sums of an (n, k) value matrix.
+    Returns (num_resamples, k); ratios of these columns give resampled means.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    chunks = [min(chunk_size, num_resamples - start) for start in range(0, num_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_bootstrap_chunk, [values] * len(chunks), chunks, seeds))
+    else:
+        parts = [_bootstrap_chunk(values, n, s) for n, s in zip(chunks, seeds)]
+    return np.vstack(parts) if parts else np.zeros((0, values.shape[1]))
+
+
+def _percentile_interval(samples: np.ndarray, confidence: float) -> Tuple[np.ndarray, np.ndarray]:
+    alpha = (1.0 - confidence) / 2.0
+    return (np.nanpercentile(samples, 100 * alpha, axis=0),
+            np.nanpercentile(samples, 100 * (1 - alpha), axis=0))
+
+
+def _group_intervals(presence, attacks, party_win, durations, num_resamples, confidence, seed, workers):
+    """Intervals for every class over one group of episodes"""
+    presence = presence.astype(np.float64)
+    # Columns: [present, win & present, attacks, duration & present] per class
+    values = np.hstack([presence, presence * party_win[:, None], attacks, presence * durations[:, None]])
+    num_classes = presence.shape[1]
+
+    sums = bootstrap_sums(values, num_resamples=num_resamples, seed=seed, workers=workers)
+    present, wins, attack_sums, duration_sums = np.split(sums, 4, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        win_rate = wins / present
+        attacks_per_episode = attack_sums / present
+        mean_duration = duration_sums / present
+
+    point = values.sum(axis=0)
+    episodes, win_count, attack_total, duration_total = np.split(point, 4)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    wilson_low, wilson_high = wilson_interval(win_count, episodes, z=z)
+
+    estimates = {
+        "win_rate": (win_rate, win_count),
+        "attacks": (attacks_per_episode, attack_total),
+        "duration": (mean_duration, duration_total),
+    }
+    intervals = {}
+    for name, (samples, total) in estimates.items():
+        low, high = _percentile_interval(samples, confidence)
+        intervals[name] = (total / np.maximum(episodes, 1), low, high)
+    intervals["win_rate_wilson"] = (intervals["win_rate"][0], wilson_low, wilson_high)
+
+    results = {}
+    for c in range(num_classes):
+        stats = {name: tuple(float(v[c]) for v in bounds) for name, bounds in intervals.items()}
+        stats["episodes"] = int(episodes[c])
+        results[SELECTABLE_CLASSES[c]] = stats
+    return results
+
+
+def class_intervals(enc: EncodedEpisodes, num_resamples: int = 10000, confidence: float = 0.95,
+                    num_windows: Optional[int] = None, seed: int = 0, workers: int = 1) -> Dict:
+    """
+    Bootstrap/Wilson intervals per class, overall or per training window.
+
+    Returns {window: {class: {"episodes": n, "win_rate": (estimate, low, high),
+    "win_rate_wilson": (...), "attacks": (...), "duration": (...)}}} where window
+    is "all" or the window index.
+    """
+    presence, attacks, party_win, durations = episode_class_table(enc)
+    groups = {"all": np.arange(enc.num_episodes)}
+    if num_windows:
+        windows = window_index(enc.num_episodes, num_windows)
+        groups = {w: np.flatnonzero(windows == w) for w in range(num_windows)}
+
+    results = {}
+    for i, (window, rows) in enumerate(groups.items()):
+        if len(rows) == 0:
+            continue
+        results[window] = _group_intervals(presence[rows], attacks[rows], party_win[rows], durations[rows],
+                                           num_resamples, confidence, seed + i, workers)
+    return results
+
+
+def print_interval_report(intervals: Dict, confidence: float = 0.95):
+    """Print class intervals grouped by window"""
+    pct = int(round(confidence * 100))
+    for window, by_class in intervals.items():
+        label = "All episodes" if window == "all" else f"Window {window}"
+        print(f"\n=== Class Intervals ({label}, {pct}% CI) ===")
+        for agent_class, stats in by_class.items():
+            if stats["episodes"] == 0:
+                continue
+            rate, low, high = stats["win_rate"]
+            _, w_low, w_high = stats["win_rate_wilson"]
+            print(f"\n{agent_class} ({stats['episodes']} episodes):")
+            print(f"  Win Rate: {rate * 100:.2f}% [bootstrap {low * 100:.2f}-{high * 100:.2f}%, "
+                  f"Wilson {w_low * 100:.2f}-{w_high * 100:.2f}%]")
+            attacks, a_low, a_high = stats["attacks"]
+            print(f"  Attacks/Episode: {attacks:.2f} [{a_low:.2f}-{a_high:.2f}]")
+            duration, d_low, d_high = stats["duration"]
+            print(f"  Duration: {duration:.2f}s [{d_low:.2f}-{d_high:.2f}s]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap confidence intervals for class performance")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--resamples", type=int, default=10000, help="Number of bootstrap resamples")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level")
+    parser.add_argument("--windows", "-w", type=int, default=None, help="Split into N training windows")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for resampling")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+
+    intervals = class_intervals(encode_episodes(episodes), num_resamples=args.resamples,
+                                confidence=args.confidence, num_windows=args.windows,
+                                seed=args.seed, workers=args.workers)
+    print_interval_report(intervals, confidence=args.confidence)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Data-driven training phase boundaries from change-point detection.
+
+The SNA scripts compare hand-picked phases (0-15000 vs 15001-30000, "<500
+early", ">2000 learned"). This module builds per-episode metric series
+(party win, duration, action rates, class mix), standardises them and finds
+mean shifts with binary segmentation (O(n log n) via prefix sums) or PELT.
+Only binary segmentation scales to full training runs: PELT is exact but
+prunes nothing when there are few real changes, so it is O(n^2) there and
+is refused above PELT_MAX_EPISODES episodes.
+
+The result is written as JSON with index ranges for dense_sna.py --phases
+and episode-number ranges for --early-range/--late-range.
+"""
+
+import argparse
+import heapq
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from episode_arrays import (CLASS_NAMES, SELECTABLE_CLASSES, WIN_CONDITIONS, EncodedEpisodes,
+                            encode_episodes, load_episodes, resolve_classes)
+
+RATE_BRANCHES = ["attack", "heal", "threat_boost"]
+
+# Largest corpus pelt() accepts (about 10 s with 8 metrics and no changes)
+PELT_MAX_EPISODES = 10000
+
+
+def episode_metrics(enc: EncodedEpisodes, metrics: Optional[List[str]] = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    (E, M) per-episode metric matrix in episode order.
+    Available metrics: win, duration, <branch>_rate (value==1 actions per second)
+    and <Class>_share (fraction of the party playing that class).
+    """
+    columns = {
+        "win": (enc.win_conditions == WIN_CONDITIONS.index("party")).astype(np.float64),
+        "duration": enc.durations.astype(np.float64),
+    }
+
+    seconds = np.maximum(enc.durations, 1e-6)
+    for branch in RATE_BRANCHES:
+        code = enc.branch_code(branch)
+        if code < 0:
+            continue
+        rows = (enc.action_branch == code) & (enc.action_value == 1)
+        counts = np.bincount(enc.action_episode[rows], minlength=enc.num_episodes)
+        columns[f"{branch}_rate"] = counts / seconds
+
+    classes = resolve_classes(enc)
+    party = np.isin(classes, [CLASS_NAMES.index(c) for c in SELECTABLE_CLASSES])
+    party_size = np.maximum(party.sum(axis=1), 1)
+    for agent_class in SELECTABLE_CLASSES:
+        columns[f"{agent_class}_share"] = (classes == CLASS_NAMES.index(agent_class)).sum(axis=1) / party_size
+
+    names = metrics or list(columns)
+    unknown = [m for m in names if m not in columns]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {unknown} (available: {list(columns)})")
+    return np.column_stack([columns[m] for m in names]), names
+
+
+def standardize(values: np.ndarray) -> np.ndarray:
+    """Z-score each column; constant columns become zero"""
+    std = values.std(axis=0)
+    return np.divide(values - values.mean(axis=0), std, out=np.zeros(values.shape), where=std > 0)
+
+
+class _SegmentCost:
+    """L2 (mean-shift) cost of any segment [a, b) in O(1) from prefix sums"""
+
+    def __init__(self, values: np.ndarray):
+        zero = np.zeros((1, values.shape[1]))
+        self.s1 = np.vstack([zero, np.cumsum(values, axis=0)])
+        self.s2 = np.vstack([zero, np.cumsum(values ** 2, axis=0)])
+
+    def cost(self, a, b):
+        """Works elementwise when a or b are arrays"""
+        n = np.asarray(b - a, dtype=np.float64)
+        s1 = self.s1[b] - self.s1[a]
+        s2 = self.s2[b] - self.s2[a]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 0, (s2 - s1 ** 2 / np.maximum(n, 1)[..., None]).sum(axis=-1), 0.0)
+
+
+def binary_segmentation(values: np.ndarray, penalty: float, min_size: int = 50,
+                        max_changes: Optional[int] = None) -> List[int]:
+    """
+    Greedy binary segmentation: repeatedly split the segment with the largest
+    cost reduction while it exceeds the penalty. Each segment is scanned once
+    with vectorised prefix-sum costs. Returns sorted change indices.
+    """
+    n = len(values)
+    cost = _SegmentCost(values)
+
+    def best_split(a, b):
+        if b - a < 2 * min_size:
+            return None
+        t = np.arange(a + min_size, b - min_size + 1)
+        gain = cost.cost(a, b) - cost.cost(a, t) - cost.cost(t, b)
+        k = int(np.argmax(gain))
+        return float(gain[k]), int(t[k])
+
+    heap = []
+    split = best_split(0, n)
+    if split:
+        heapq.heappush(heap, (-split[0], split[1], 0, n))
+    changes = []
+    while heap and (max_changes is None or len(changes) < max_changes):
+        neg_gain, t, a, b = heapq.heappop(heap)
+        if -neg_gain <= penalty:
+            break
+        changes.append(t)
+        for segment in ((a, t), (t, b)):
+            split = best_split(*segment)
+            if split:
+                heapq.heappush(heap, (-split[0], split[1], *segment))
+    return sorted(changes)
+
+
+def pelt(values: np.ndarray, penalty: float, min_size: int = 50) -> List[int]:
+    """
+    Pruned Exact Linear Time optimal partitioning (Killick et al. 2012).
+    Linear when the number of changes grows with n, but quadratic when there
+    are few changes (splitting a segment never raises the L2 cost, so no
+    candidate is pruned). Raises ValueError above PELT_MAX_EPISODES.
+    """
+    n = len(values)
+    if n > PELT_MAX_EPISODES:
+        raise ValueError(f"pelt is O(n^2) without changes; {n} episodes exceeds PELT_MAX_EPISODES "
+                         f"({PELT_MAX_EPISODES}), use binseg")
+    cost = _SegmentCost(values)
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    previous = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0], dtype=np.int64)
+
+    for t in range(min_size, n + 1):
+        totals = best[candidates] + cost.cost(candidates, t) + penalty
+        k = int(np.argmin(totals))
+        best[t], previous[t] = totals[k], candidates[k]
+        # Prune candidates that can never be optimal again
+        candidates = candidates[totals - penalty <= best[t]]
+        if t + 1 - min_size >= min_size:
+            candidates = np.append(candidates, t + 1 - min_size)
+
+    changes = []
+    t = n
+    while t > 0:
+        t = int(previous[t])
+        if t > 0:
+            changes.append(t)
+    return sorted(changes)
+
+
+def detect_phases(enc: EncodedEpisodes, metrics: Optional[List[str]] = None, method: str = "binseg",
+                  penalty: Optional[float] = None, min_size: int = 50, max_changes: Optional[int] = None) -> Dict:
+    """
+    Phase boundaries for a corpus.
+    The default penalty is BIC-like: 2 * metrics * log(n) on standardised data.
+    """
+    values, names = episode_metrics(enc, metrics)
+    z = standardize(values)
+    n = len(z)
+    penalty = penalty if penalty is not None else 2.0 * z.shape[1] * np.log(max(n, 2))
+    min_size = max(1, min(min_size, n // 2 or 1))
+
+    if method == "binseg":
+        changes = binary_segmentation(z, penalty, min_size=min_size, max_changes=max_changes)
+    elif method == "pelt":
+        changes = pelt(z, penalty, min_size=min_size)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    bounds = [0] + changes + [n]
+    ranges = [[bounds[i], bounds[i + 1] - 1] for i in range(len(bounds) - 1)]
+    episode_ranges = [[int(enc.episode_numbers[a]), int(enc.episode_numbers[b])] for a, b in ranges]
+    phase_means = [{name: float(values[a:b + 1, m].mean()) for m, name in enumerate(names)} for a, b in ranges]
+
+    return {
+        "method": method,
+        "metrics": names,
+        "penalty": float(penalty),
+        "num_episodes": n,
+        "boundaries": changes,
+        "ranges": ranges,
+        "episode_ranges": episode_ranges,
+        "early_range": episode_ranges[0],
+        "late_range": episode_ranges[-1],
+        "phase_means": phase_means,
+    }
+
+
+def print_phases(result: Dict):
+    """Print phases and ready-to-use SNA arguments"""
+    print(f"\n=== Training Phases ({result['method']}, penalty {result['penalty']:.1f}) ===")
+    for i, ((a, b), (ea, eb), means) in enumerate(zip(result["ranges"], result["episode_ranges"],
+                                                       result["phase_means"])):
+        summary = ", ".join(f"{k}={v:.3f}" for k, v in means.items()
+                            if k in ("win", "duration", "attack_rate", "heal_rate"))
+        print(f"Phase {i}: index {a}-{b} (episodes {ea}-{eb}, {b - a + 1} episodes) {summary}")
+
+    early, late = result["early_range"], result["late_range"]
+    print("\nSNA arguments:")
+    print(f"  --early-range {early[0]} {early[1]} --late-range {late[0]} {late[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect training phase boundaries with change-point detection")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--method", choices=["binseg", "pelt"], default="binseg",
+                        help=f"Segmentation algorithm (pelt is exact but O(n^2) with few phases, "
+                             f"up to {PELT_MAX_EPISODES} episodes)")
+    parser.add_argument("--metrics", nargs="+", default=None, help="Metric columns to use (default: all)")
+    parser.add_argument("--penalty", type=float, default=None, help="Cost penalty per change (default: BIC-like)")
+    parser.add_argument("--min-size", type=int, default=50, help="Minimum episodes per phase")
+    parser.add_argument("--max-changes", type=int, default=None, help="Cap on the number of boundaries (binseg)")
+    parser.add_argument("--output", "-o", default=None, help="Write phases JSON (for dense_sna.py --phases)")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+    if args.method == "pelt" and len(episodes) > PELT_MAX_EPISODES:
+        parser.error(f"pelt is limited to {PELT_MAX_EPISODES} episodes; use --method binseg")
+
+    result = detect_phases(encode_episodes(episodes), metrics=args.metrics, method=args.method,
+                           penalty=args.penalty, min_size=args.min_size, max_changes=args.max_changes)
+    print_phases(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved phases to {args.output}")
+        print(f"  dense_sna.py --phases {args.output}")
+
+
+if __name__ == "__main__":
+    main()
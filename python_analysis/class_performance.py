@@ -2,69 +2,48 @@
 Analyze class selection and performance
 """
 
-import json
 import os
-import glob
-from collections import defaultdict
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-def load_episode(filepath):
-    """Load an episode JSON file"""
-    with open(filepath, 'r') as f:
-        return json.load(f)
+from bootstrap_intervals import class_intervals, episode_class_table
+from episode_arrays import CLASS_NAMES, SELECTABLE_CLASSES, encode_episodes, load_episodes, resolve_classes
+from permutation_tests import class_effect_tests, print_permutation_report
 
-def analyze_class_performance(episodes):
-    """Analyze performance by class"""
-    class_stats = defaultdict(lambda: {
-        'episodes': 0,
-        'wins': 0,
-        'attacks': 0,
-        'heals': 0,
-        'threat_boosts': 0
-    })
-    
-    for episode in episodes:
-        win_condition = episode.get('winCondition', '')
-        # Handle both dict and list formats
-        agent_classes = episode.get('agentClasses', {})
-        if isinstance(agent_classes, list):
-            agent_ids = episode.get('agentIds', [])
-            agent_class_values = episode.get('agentClassValues', [])
-            agent_classes = dict(zip(agent_ids, agent_class_values))
-        actions = episode.get('actions', [])
-        
-        # Track which classes were in this episode
-        episode_classes = set(agent_classes.values())
-        
-        for agent_class in episode_classes:
-            if agent_class == 'Boss':
-                continue
-            
-            class_stats[agent_class]['episodes'] += 1
-            
-            # Check if party won (this class was on winning team)
-            if win_condition == 'party':
-                class_stats[agent_class]['wins'] += 1
-        
-        # Count actions by class
-        for action in actions:
-            agent_id = action.get('agentId', '')
-            agent_class = agent_classes.get(agent_id, 'Unknown')
-            
-            if agent_class == 'Boss':
-                continue
-            
-            branch = action.get('branch', '')
-            value = action.get('value', 0)
-            
-            if branch == 'attack' and value == 1:
-                class_stats[agent_class]['attacks'] += 1
-            elif branch == 'heal' and value == 1:
-                class_stats[agent_class]['heals'] += 1
-            elif branch == 'threat_boost' and value == 1:
-                class_stats[agent_class]['threat_boosts'] += 1
-    
+CONFIDENCE = 0.95
+
+def encoded_class_stats(enc):
+    """Per-class episode, win and action counts, keyed by resolve_classes() classes
+
+    Recorded agentClasses are usually "None" for party members, so this uses the
+    class_selection-resolved classes that the interval and permutation estimates use.
+    """
+    classes = resolve_classes(enc)
+    presence, _, party_win, _ = episode_class_table(enc)
+    codes = np.full(len(CLASS_NAMES), -1)
+    for c, name in enumerate(SELECTABLE_CLASSES):
+        codes[CLASS_NAMES.index(name)] = c
+
+    counts = {}
+    for branch, key in [("attack", "attacks"), ("heal", "heals"), ("threat_boost", "threat_boosts")]:
+        counts[key] = np.zeros(len(SELECTABLE_CLASSES), dtype=np.int64)
+        code = enc.branch_code(branch)
+        if code < 0:
+            continue
+        rows = np.flatnonzero((enc.action_branch == code) & (enc.action_value == 1))
+        agent_class = codes[classes[enc.action_episode[rows], enc.action_agent[rows]]]
+        counts[key] = np.bincount(agent_class[agent_class >= 0], minlength=len(SELECTABLE_CLASSES))
+
+    class_stats = {}
+    for c, name in enumerate(SELECTABLE_CLASSES):
+        if not presence[:, c].any():
+            continue
+        class_stats[name] = {
+            'episodes': int(presence[:, c].sum()),
+            'wins': int((presence[:, c] & party_win).sum()),
+            **{key: int(values[c]) for key, values in counts.items()},
+        }
     return class_stats
 
 def plot_class_performance(class_stats, output_file="class_performance.png"):
@@ -108,8 +87,15 @@ def plot_class_performance(class_stats, output_file="class_performance.png"):
     print(f"Saved plot to {output_file}")
     plt.show()
 
-def print_class_report(class_stats):
-    """Print a text report of class performance"""
+def print_class_report(class_stats, intervals=None, presence_tests=None, confidence=CONFIDENCE):
+    """Print a text report of class performance
+
+    intervals: optional {class: stats} from bootstrap_intervals.class_intervals(...)["all"]
+    presence_tests: optional {class: row} from permutation_tests.class_effect_tests(...)["presence"]
+    Both are keyed by resolved class, so pass class_stats from encoded_class_stats() with them.
+    """
+    intervals = intervals or {}
+    presence_tests = presence_tests or {}
     print("\n=== Class Performance Report ===")
     
     for agent_class, stats in sorted(class_stats.items()):
@@ -119,6 +105,14 @@ def print_class_report(class_stats):
         if stats['episodes'] > 0:
             win_rate = (stats['wins'] / stats['episodes']) * 100
             print(f"  Win Rate: {win_rate:.2f}%")
+        if agent_class in intervals:
+            _, low, high = intervals[agent_class]["win_rate"]
+            _, w_low, w_high = intervals[agent_class]["win_rate_wilson"]
+            print(f"  Win Rate {confidence * 100:g}% CI: bootstrap {low * 100:.2f}-{high * 100:.2f}%, Wilson {w_low * 100:.2f}-{w_high * 100:.2f}%")
+        if agent_class in presence_tests:
+            test = presence_tests[agent_class]
+            print(f"  Win Rate vs parties without {agent_class}: {test['difference'] * 100:+.2f} pp "
+                  f"(Cohen's h {test['cohens_h']:+.3f}, permutation p={test['p_value']:.4f}, family p={test['p_family']:.4f})")
         print(f"  Total Attacks: {stats['attacks']}")
         print(f"  Total Heals: {stats['heals']}")
         print(f"  Total Threat Boosts: {stats['threat_boosts']}")
@@ -129,18 +123,16 @@ if __name__ == "__main__":
     if not os.path.exists(data_dir):
         data_dir = input("Enter path to EpisodeData: ").strip()
     
-    episode_files = glob.glob(os.path.join(data_dir, "episode_*.json"))
-    episodes = []
-    
-    for filepath in episode_files:
-        try:
-            episodes.append(load_episode(filepath))
-        except Exception as e:
-            print(f"Error loading {filepath}: {e}")
+    # Sorted by episode number, so the window tests see training order
+    episodes = load_episodes(data_dir)
     
     if episodes:
-        class_stats = analyze_class_performance(episodes)
-        print_class_report(class_stats)
+        encoded = encode_episodes(episodes)
+        class_stats = encoded_class_stats(encoded)
+        intervals = class_intervals(encoded, num_resamples=2000, confidence=CONFIDENCE)["all"]
+        tests = class_effect_tests(encoded, num_permutations=10000)
+        print_class_report(class_stats, intervals, tests.get("presence"), CONFIDENCE)
+        print_permutation_report({k: v for k, v in tests.items() if k != "presence"}, 10000)
         plot_class_performance(class_stats)
     else:
         print("No episodes loaded")
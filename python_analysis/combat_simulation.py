@@ -0,0 +1,357 @@
+"""
+Batch combat re-simulation from recorded actions.
+
+Replays the attack/heal/threat_boost actions of many episodes at once against
+the combat constants of the Unity scripts and reconstructs per-frame health,
+damage dealt and healing done for every agent. Unlike visualize_damage.py,
+which counts attacks as a proxy, this gives actual damage/heal amounts and
+cheap DPS/HPS series over a whole training run.
+
+Episodes are simulated in batches as padded (episode x step x agent) arrays,
+where a step is a recorded frame. Targets that the recorder does not store
+are resolved the same way the game would pick them:
+  - party attacks always hit the boss (the only valid target)
+  - boss attacks hit the alive party member with the highest threat
+    (ThreatSystem.GetHighestThreatPlayer), unless the action has a targetId
+  - heals go to the most injured alive party member, unless targetId is set
+"""
+
+import argparse
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from episode_arrays import (BOSS_CLASS, CLASS_NAMES, EncodedEpisodes, encode_episodes,
+                            load_episodes, resolve_classes)
+
+# ============================================================================
+# COMBAT CONSTANTS - mirror the serialized defaults of the Unity scripts
+# ============================================================================
+
+# PlayerClassSystem
+CLASS_DAMAGE = {"Tank": 2.0, "Healer": 2.0, "RangedDPS": 5.0, "MeleeDPS": 10.0}
+TANK_DAMAGE_REDUCTION = 0.4
+HEAL_AMOUNT = 10.0
+HEAL_COOLDOWN = 3.0
+THREAT_BOOST_COOLDOWN = 5.0
+
+# PlayerAttackSystem / BossAttackSystem
+PLAYER_ATTACK_COOLDOWN = 1.0
+BOSS_ATTACK_DAMAGE = 100.0
+BOSS_ATTACK_COOLDOWN = 1.0
+
+# HealthSystem
+MAX_HEALTH = 100.0
+LAVA_DAMAGE_PER_TICK = 8.0
+LAVA_TICK_INTERVAL = 1.0
+BURN_DAMAGE_PER_TICK = 3.0
+BURN_TICK_INTERVAL = 1.0
+BURN_DURATION = 5.0
+
+# ThreatSystem (heal and threat boost use RangedDPS damage as the base)
+HEAL_THREAT = CLASS_DAMAGE["RangedDPS"] * 3.0
+THREAT_BOOST_THREAT = CLASS_DAMAGE["RangedDPS"] * 5.0
+
+# Used when an episode has no usable duration
+DEFAULT_SECONDS_PER_FRAME = 1.0 / 60.0
+
+_TANK = CLASS_NAMES.index("Tank")
+_HEALER = CLASS_NAMES.index("Healer")
+
+_CLASS_DAMAGE_BY_CODE = np.zeros(len(CLASS_NAMES), dtype=np.float64)
+for _name, _damage in CLASS_DAMAGE.items():
+    _CLASS_DAMAGE_BY_CODE[CLASS_NAMES.index(_name)] = _damage
+
+
+@dataclass
+class CombatSimulation:
+    """
+    Dense result of simulate_batch for B episodes, S steps and A agents.
+
+    Steps beyond an episode's last recorded frame are padding (step_valid is
+    False) and hold the final state. Damage is the amount actually removed
+    from the target's health (after Tank reduction, capped at remaining health).
+    """
+    step_frame: np.ndarray      # (B, S) int32 recorded frame of each step
+    step_time: np.ndarray       # (B, S) float64 seconds since episode start
+    step_valid: np.ndarray      # (B, S) bool
+    health: np.ndarray          # (B, S, A) float32 health after the step
+    damage_dealt: np.ndarray    # (B, S, A) float32 damage dealt by the agent during the step
+    damage_taken: np.ndarray    # (B, S, A) float32 damage received (attacks, lava and burn)
+    healing_done: np.ndarray    # (B, S, A) float32 effective healing done by the agent
+    threat: np.ndarray          # (B, S, A) float32 cumulative threat after the step
+    classes: np.ndarray         # (B, A) int8 resolved class codes
+    agent_names: list
+
+
+def _step_grid(enc: EncodedEpisodes):
+    """Map every action row to a per-episode step index (rank of its frame)"""
+    num_episodes = enc.num_episodes
+    max_frame = int(enc.action_frame.max()) + 1 if enc.num_actions else 1
+    key = enc.action_episode.astype(np.int64) * max_frame + enc.action_frame
+    unique_keys, row_step = np.unique(key, return_inverse=True)
+    unique_episode = unique_keys // max_frame
+    steps_per_episode = np.bincount(unique_episode, minlength=num_episodes)
+    first_step = np.zeros(num_episodes + 1, dtype=np.int64)
+    np.cumsum(steps_per_episode, out=first_step[1:])
+    row_step = row_step - first_step[enc.action_episode]
+
+    num_steps = max(1, int(steps_per_episode.max()) if num_episodes else 1)
+    step_frame = np.zeros((num_episodes, num_steps), dtype=np.int32)
+    step_valid = np.zeros((num_episodes, num_steps), dtype=bool)
+    local = np.arange(len(unique_keys)) - first_step[unique_episode]
+    step_frame[unique_episode, local] = unique_keys % max_frame
+    step_valid[unique_episode, local] = True
+    # Padding steps repeat the last frame so time stays monotone
+    last = np.maximum(steps_per_episode - 1, 0)
+    pad_frame = step_frame[np.arange(num_episodes), last]
+    step_frame = np.where(step_valid, step_frame, pad_frame[:, None])
+    return row_step, step_frame, step_valid
+
+
+def _intent(enc: EncodedEpisodes, row_step, shape, branch: str, with_target: bool = False):
+    """(B, S, A) bool of value==1 actions on a branch, plus their targetIds"""
+    intent = np.zeros(shape, dtype=bool)
+    target = np.full(shape, -1, dtype=np.int16) if with_target else None
+    code = enc.branch_code(branch)
+    if code < 0:
+        return intent, target
+    rows = np.flatnonzero((enc.action_branch == code) & (enc.action_value == 1))
+    index = (enc.action_episode[rows], row_step[rows], enc.action_agent[rows])
+    intent[index] = True
+    if with_target:
+        target[index] = enc.action_target[rows]
+    return intent, target
+
+
+def simulate_batch(enc: EncodedEpisodes, lava: Optional[np.ndarray] = None) -> CombatSimulation:
+    """
+    Re-simulate every episode of enc at once.
+
+    lava: optional (B, S, A) bool mask of agents standing in lava at each step.
+    Positions are not recorded, so lava/burn ticks only apply when provided.
+    """
+    num_episodes, num_agents = enc.num_episodes, enc.num_agents
+    row_step, step_frame, step_valid = _step_grid(enc)
+    num_steps = step_frame.shape[1]
+    shape = (num_episodes, num_steps, num_agents)
+
+    last_frame = np.maximum(step_frame[:, -1], 1)
+    seconds_per_frame = np.where(enc.durations > 0, enc.durations / last_frame, DEFAULT_SECONDS_PER_FRAME)
+    step_time = step_frame * seconds_per_frame[:, None]
+
+    attack, attack_target = _intent(enc, row_step, shape, "attack", with_target=True)
+    heal, heal_target = _intent(enc, row_step, shape, "heal", with_target=True)
+    threat_boost, _ = _intent(enc, row_step, shape, "threat_boost")
+
+    classes = resolve_classes(enc)
+    present = classes >= 0
+    boss = present & ((classes == BOSS_CLASS) | enc.boss_mask()[None, :])
+    party = present & ~boss
+    is_tank = party & (classes == _TANK)
+    is_healer = party & (classes == _HEALER)
+    attack_damage = np.where(party, _CLASS_DAMAGE_BY_CODE[np.maximum(classes, 0)], 0.0)
+    damage_taken_scale = np.where(is_tank, 1.0 - TANK_DAMAGE_REDUCTION, 1.0)
+
+    has_boss = boss.any(axis=1)
+    boss_col = np.argmax(boss, axis=1)
+    rows = np.arange(num_episodes)
+
+    health = np.where(present, MAX_HEALTH, 0.0)
+    threat = np.zeros((num_episodes, num_agents))
+    never = -np.inf
+    last_attack = np.full((num_episodes, num_agents), never)
+    last_heal = np.full((num_episodes, num_agents), never)
+    last_boost = np.full((num_episodes, num_agents), never)
+    lava_timer = np.zeros((num_episodes, num_agents))
+    burn_timer = np.zeros((num_episodes, num_agents))
+    burn_tick_timer = np.zeros((num_episodes, num_agents))
+    was_in_lava = np.zeros((num_episodes, num_agents), dtype=bool)
+
+    out_health = np.zeros(shape, dtype=np.float32)
+    out_dealt = np.zeros(shape, dtype=np.float32)
+    out_taken = np.zeros(shape, dtype=np.float32)
+    out_healing = np.zeros(shape, dtype=np.float32)
+    out_threat = np.zeros(shape, dtype=np.float32)
+
+    prev_time = step_time[:, 0].copy()
+    for s in range(num_steps):
+        t = step_time[:, s]
+        valid = step_valid[:, s][:, None]
+        dt = (t - prev_time)[:, None]
+        prev_time = t
+        alive = present & (health > 0) & valid
+        dealt = np.zeros((num_episodes, num_agents))
+        taken = np.zeros((num_episodes, num_agents))
+        healed = np.zeros((num_episodes, num_agents))
+
+        # Lava and burn ticks (HealthSystem.Update)
+        if lava is not None:
+            in_lava = lava[:, s, :] & alive
+            lava_timer = np.where(in_lava, lava_timer + dt, 0.0)
+            lava_tick = in_lava & (lava_timer >= LAVA_TICK_INTERVAL)
+            lava_timer[lava_tick] = 0.0
+            left_lava = was_in_lava & ~in_lava & alive
+            burn_timer = np.where(left_lava, BURN_DURATION, np.where(in_lava, 0.0, burn_timer))
+            burning = (burn_timer > 0) & ~in_lava & alive
+            burn_tick_timer = np.where(burning & ~left_lava, burn_tick_timer + dt, 0.0)
+            burn_tick = burning & (burn_tick_timer >= BURN_TICK_INTERVAL)
+            burn_tick_timer[burn_tick] = 0.0
+            burn_timer = np.where(burning & ~left_lava, burn_timer - dt, burn_timer)
+            was_in_lava = in_lava
+            environment = (lava_tick * LAVA_DAMAGE_PER_TICK + burn_tick * BURN_DAMAGE_PER_TICK) * damage_taken_scale
+            environment = np.minimum(environment, health)
+            health -= environment
+            taken += environment
+            alive &= health > 0
+
+        # Party attacks on the boss
+        boss_alive = has_boss & alive[rows, boss_col]
+        hits = attack[:, s, :] & alive & party & (attack_damage > 0) & boss_alive[:, None] \
+            & (t[:, None] >= last_attack + PLAYER_ATTACK_COOLDOWN)
+        requested = np.where(hits, attack_damage, 0.0)
+        total = requested.sum(axis=1)
+        applied = np.minimum(total, np.where(boss_alive, health[rows, boss_col], 0.0))
+        share = np.divide(applied, total, out=np.zeros_like(total), where=total > 0)
+        dealt += requested * share[:, None]
+        threat += requested
+        health[rows, boss_col] -= applied
+        taken[rows, boss_col] += applied
+        last_attack = np.where(hits, t[:, None], last_attack)
+
+        # Heals: explicit targetId, otherwise the most injured alive party member
+        healers = heal[:, s, :] & alive & is_healer & (t[:, None] >= last_heal + HEAL_COOLDOWN)
+        injured = alive & party & (health < MAX_HEALTH)
+        fallback_target = np.argmin(np.where(injured, health, np.inf), axis=1)
+        for a in np.flatnonzero(healers.any(axis=0)):
+            who = healers[:, a]
+            target = np.where(heal_target[:, s, a] >= 0, heal_target[:, s, a], fallback_target)
+            ok = who & injured[rows, target]
+            amount = np.where(ok, np.minimum(HEAL_AMOUNT, MAX_HEALTH - health[rows, target]), 0.0)
+            health[rows, target] += amount
+            healed[:, a] += amount
+            threat[:, a] += np.where(ok, HEAL_THREAT, 0.0)
+            last_heal[:, a] = np.where(ok, t, last_heal[:, a])
+            injured = alive & party & (health < MAX_HEALTH)
+
+        # Tank threat boost
+        boosts = threat_boost[:, s, :] & alive & is_tank & (t[:, None] >= last_boost + THREAT_BOOST_COOLDOWN)
+        threat += boosts * THREAT_BOOST_THREAT
+        last_boost = np.where(boosts, t[:, None], last_boost)
+
+        # Boss attack on the highest-threat alive party member
+        targets_alive = alive & party
+        boss_swing = boss_alive & attack[rows, s, boss_col] & targets_alive.any(axis=1) \
+            & (t >= last_attack[rows, boss_col] + BOSS_ATTACK_COOLDOWN)
+        explicit = attack_target[rows, s, boss_col]
+        by_threat = np.argmax(np.where(targets_alive, threat, -np.inf), axis=1)
+        target = np.where(explicit >= 0, explicit, by_threat)
+        boss_swing &= targets_alive[rows, target]
+        damage = np.where(boss_swing, BOSS_ATTACK_DAMAGE * damage_taken_scale[rows, target], 0.0)
+        damage = np.minimum(damage, health[rows, target])
+        health[rows, target] -= damage
+        taken[rows, target] += damage
+        dealt[rows, boss_col] += damage
+        last_attack[rows, boss_col] = np.where(boss_swing, t, last_attack[rows, boss_col])
+
+        out_health[:, s, :] = health
+        out_dealt[:, s, :] = dealt
+        out_taken[:, s, :] = taken
+        out_healing[:, s, :] = healed
+        out_threat[:, s, :] = threat
+
+    return CombatSimulation(
+        step_frame=step_frame,
+        step_time=step_time,
+        step_valid=step_valid,
+        health=out_health,
+        damage_dealt=out_dealt,
+        damage_taken=out_taken,
+        healing_done=out_healing,
+        threat=out_threat,
+        classes=classes,
+        agent_names=enc.agent_names,
+    )
+
+
+def simulate_corpus(enc: EncodedEpisodes, batch_size: int = 256) -> dict:
+    """
+    Simulate the whole corpus in batches and keep per-episode totals.
+    Returns {name: (E, A) array} with damage_dealt, damage_taken, healing_done,
+    final_health, dps, hps and the resolved classes.
+    """
+    num_episodes, num_agents = enc.num_episodes, enc.num_agents
+    totals = {name: np.zeros((num_episodes, num_agents))
+              for name in ("damage_dealt", "damage_taken", "healing_done", "final_health")}
+    classes = np.full((num_episodes, num_agents), -1, dtype=np.int8)
+
+    for start in range(0, num_episodes, batch_size):
+        batch = np.arange(start, min(start + batch_size, num_episodes))
+        sim = simulate_batch(enc.select(batch))
+        totals["damage_dealt"][batch] = sim.damage_dealt.sum(axis=1)
+        totals["damage_taken"][batch] = sim.damage_taken.sum(axis=1)
+        totals["healing_done"][batch] = sim.healing_done.sum(axis=1)
+        totals["final_health"][batch] = sim.health[:, -1, :]
+        classes[batch] = sim.classes
+
+    durations = np.where(enc.durations > 0, enc.durations, np.nan)[:, None]
+    totals["dps"] = totals["damage_dealt"] / durations
+    totals["hps"] = totals["healing_done"] / durations
+    totals["classes"] = classes
+    return totals
+
+
+def per_second_series(sim: CombatSimulation, values: np.ndarray, bin_seconds: float = 1.0) -> np.ndarray:
+    """Bin a (B, S, A) per-step array into (B, T, A) per-second rates"""
+    bins = np.floor(sim.step_time / bin_seconds).astype(np.int64)
+    num_bins = int(bins.max()) + 1 if bins.size else 1
+    series = np.zeros((values.shape[0], num_bins, values.shape[2]))
+    episode = np.broadcast_to(np.arange(values.shape[0])[:, None], bins.shape)
+    np.add.at(series, (episode[sim.step_valid], bins[sim.step_valid]), values[sim.step_valid])
+    return series / bin_seconds
+
+
+def corpus_table(enc: EncodedEpisodes, totals: dict) -> pd.DataFrame:
+    """One row per (episode, agent) with the simulated totals"""
+    ep, ag = np.nonzero(totals["classes"] >= 0)
+    return pd.DataFrame({
+        "episode": enc.episode_numbers[ep],
+        "agent": np.asarray(enc.agent_names, dtype=object)[ag],
+        "class": np.asarray(CLASS_NAMES, dtype=object)[totals["classes"][ep, ag]],
+        "damage_dealt": totals["damage_dealt"][ep, ag],
+        "damage_taken": totals["damage_taken"][ep, ag],
+        "healing_done": totals["healing_done"][ep, ag],
+        "final_health": totals["final_health"][ep, ag],
+        "dps": totals["dps"][ep, ag],
+        "hps": totals["hps"][ep, ag],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-simulate combat (health, damage, healing) from recorded actions")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--output", "-o", default="combat_simulation.csv", help="Per-episode, per-agent CSV output")
+    parser.add_argument("--batch-size", type=int, default=256, help="Episodes simulated per batch")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+
+    enc = encode_episodes(episodes)
+    totals = simulate_corpus(enc, batch_size=args.batch_size)
+    df = corpus_table(enc, totals)
+    df.to_csv(args.output, index=False)
+
+    print("\n=== Simulated Combat by Class ===")
+    summary = df.groupby("class")[["damage_dealt", "healing_done", "damage_taken", "dps", "hps"]].mean()
+    print(summary.to_string(float_format=lambda v: f"{v:.2f}"))
+    print(f"\nSaved per-agent totals to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Streaming empirical action entropy per branch and training window.
+
+Policy entropy is only visible in TensorBoard, per behaviour. This tracker
+keeps value counters for every (window, agent, branch), and the same per
+class and per winCondition, and turns them into Shannon entropy on demand.
+Episodes are folded in one at a time, windows are fixed blocks of
+window_size episodes in arrival order, and the counters can be saved and
+resumed, so a live EpisodeData folder can be followed without rescanning
+history. Trackers built on separate shards can be merged.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from episode_arrays import (CLASS_NAMES, WIN_CONDITIONS, encode_episodes, episode_files, load_episode,
+                            load_episodes, resolve_classes)
+from episode_ingest import content_hash
+
+SCOPES = ["agent", "class", "winCondition"]
+
+
+class EntropyTracker:
+    """Incremental per-window action value counters"""
+
+    def __init__(self, window_size: int = 500):
+        self.window_size = window_size
+        self.episodes_seen = 0
+        # Files already read: absolute path -> [size, mtime], and content hashes of the episodes folded in.
+        # EpisodeRecorder reuses episode_N.json names every session, so names alone cannot identify episodes.
+        self.sources: Dict[str, List[float]] = {}
+        self.episode_hashes: Set[str] = set()
+        # scope -> (window, group, branch) -> Counter(value -> count)
+        self.counts: Dict[str, Dict[tuple, Counter]] = {scope: defaultdict(Counter) for scope in SCOPES}
+
+    def update(self, episode: dict):
+        """Fold one episode into the counters"""
+        window = self.episodes_seen // self.window_size
+        self.episodes_seen += 1
+        enc = encode_episodes([episode])
+        if enc.num_actions == 0:
+            return
+
+        classes = resolve_classes(enc)[0]
+        win = enc.win_conditions[0]
+        outcome = WIN_CONDITIONS[win] if win >= 0 else "unknown"
+
+        # One np.unique over (agent, branch, value) instead of a dict update per action
+        value_offset = int(enc.action_value.min())
+        span = int(enc.action_value.max()) - value_offset + 1
+        key = (enc.action_agent.astype(np.int64) * len(enc.branch_names) + enc.action_branch) * span \
+            + (enc.action_value - value_offset)
+        unique, counts = np.unique(key, return_counts=True)
+        for k, n in zip(unique.tolist(), counts.tolist()):
+            rest, value = divmod(k, span)
+            agent, branch = divmod(rest, len(enc.branch_names))
+            branch_name = enc.branch_names[branch]
+            value += value_offset
+            agent_class = CLASS_NAMES[classes[agent]] if classes[agent] >= 0 else "Unknown"
+            self.counts["agent"][(window, enc.agent_names[agent], branch_name)][value] += n
+            self.counts["class"][(window, agent_class, branch_name)][value] += n
+            self.counts["winCondition"][(window, outcome, branch_name)][value] += n
+
+    def update_many(self, episodes: Iterable[dict]):
+        for episode in episodes:
+            self.update(episode)
+
+    def merge(self, other: "EntropyTracker"):
+        """
+        Add another tracker's counters (e.g. from a parallel shard).
+        Windows are matched by index, so shards should cover the same episode order.
+        """
+        for scope in SCOPES:
+            for key, counter in other.counts[scope].items():
+                self.counts[scope][key].update(counter)
+        self.episodes_seen = max(self.episodes_seen, other.episodes_seen)
+        self.sources.update(other.sources)
+        self.episode_hashes |= other.episode_hashes
+
+    def entropy(self, scope: str = "agent") -> pd.DataFrame:
+        """
+        Entropy (bits) of each (window, group, branch) value distribution.
+        normalized divides by log2 of the number of distinct values seen.
+        """
+        rows = []
+        for (window, group, branch), counter in self.counts[scope].items():
+            counts = np.array(list(counter.values()), dtype=np.float64)
+            total = counts.sum()
+            p = counts / total
+            bits = float(-(p * np.log2(p)).sum())
+            distinct = len(counts)
+            rows.append({
+                "window": window,
+                scope: group,
+                "branch": branch,
+                "entropy": bits,
+                "normalized": bits / np.log2(distinct) if distinct > 1 else 0.0,
+                "distinct_values": distinct,
+                "samples": int(total),
+            })
+        columns = ["window", scope, "branch", "entropy", "normalized", "distinct_values", "samples"]
+        return pd.DataFrame(rows, columns=columns).sort_values(["window", scope, "branch"]).reset_index(drop=True)
+
+    def save(self, path: str):
+        """Persist counters so a later run can resume without rescanning"""
+        state = {
+            "window_size": self.window_size,
+            "episodes_seen": self.episodes_seen,
+            "sources": self.sources,
+            "episode_hashes": sorted(self.episode_hashes),
+            "counts": [[scope, window, group, branch, value, n]
+                       for scope in SCOPES
+                       for (window, group, branch), counter in self.counts[scope].items()
+                       for value, n in counter.items()],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    @classmethod
+    def load(cls, path: str) -> "EntropyTracker":
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        tracker = cls(window_size=state["window_size"])
+        tracker.episodes_seen = state["episodes_seen"]
+        tracker.sources = state["sources"]
+        tracker.episode_hashes = set(state["episode_hashes"])
+        for scope, window, group, branch, value, n in state["counts"]:
+            tracker.counts[scope][(window, group, branch)][value] += n
+        return tracker
+
+
+def ingest_directory(tracker: EntropyTracker, data_dir: str) -> int:
+    """
+    Fold in episode files that are new or rewritten since they were last read
+    (by path, size and mtime), skipping episodes whose content was already
+    counted. Returns how many episodes were added.
+    """
+    added = 0
+    for filepath in episode_files(data_dir):
+        stat = os.stat(filepath)
+        source = os.path.abspath(filepath)
+        fingerprint = [stat.st_size, stat.st_mtime]
+        if tracker.sources.get(source) == fingerprint:
+            continue
+        try:
+            episode = load_episode(filepath)
+        except Exception as e:
+            print(f"Error loading {filepath}: {e}")
+            continue
+        tracker.sources[source] = fingerprint
+        digest = content_hash(episode)
+        if digest in tracker.episode_hashes:
+            continue
+        tracker.update(episode)
+        tracker.episode_hashes.add(digest)
+        added += 1
+    return added
+
+
+def print_entropy_report(tracker: EntropyTracker, scope: str = "class", branches: Optional[List[str]] = None):
+    """Print entropy per window for one scope as a wide table"""
+    table = tracker.entropy(scope)
+    if branches:
+        table = table[table["branch"].isin(branches)]
+    if table.empty:
+        print("No actions recorded yet")
+        return
+    wide = table.pivot_table(index=[scope, "branch"], columns="window", values="entropy")
+    print(f"\n=== Action Entropy (bits) by {scope} and window of {tracker.window_size} episodes ===")
+    print(wide.round(3).to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming empirical action entropy per branch and window")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--window-size", type=int, default=500, help="Episodes per window")
+    parser.add_argument("--scope", choices=SCOPES, default="class", help="Grouping to report")
+    parser.add_argument("--branches", nargs="+", default=None, help="Only report these branches")
+    parser.add_argument("--state", default=None, help="Counter state JSON to resume from and update")
+    parser.add_argument("--follow", type=float, default=None, metavar="SECONDS",
+                        help="Keep polling the directory for new episodes every SECONDS")
+    parser.add_argument("--output", "-o", default=None, help="Optional CSV of the full entropy table")
+    args = parser.parse_args()
+
+    if args.state and os.path.exists(args.state):
+        tracker = EntropyTracker.load(args.state)
+        print(f"Resumed from {args.state} ({tracker.episodes_seen} episodes)")
+    else:
+        tracker = EntropyTracker(window_size=args.window_size)
+
+    if os.path.isdir(args.input):
+        added = ingest_directory(tracker, args.input)
+    else:
+        episodes = load_episodes(args.input)
+        tracker.update_many(episodes)
+        added = len(episodes)
+    print(f"Added {added} episodes")
+    print_entropy_report(tracker, scope=args.scope, branches=args.branches)
+
+    try:
+        while args.follow and os.path.isdir(args.input):
+            time.sleep(args.follow)
+            added = ingest_directory(tracker, args.input)
+            if added:
+                print(f"\nAdded {added} episodes (total {tracker.episodes_seen})")
+                print_entropy_report(tracker, scope=args.scope, branches=args.branches)
+                if args.state:
+                    tracker.save(args.state)
+    except KeyboardInterrupt:
+        pass
+
+    if args.state:
+        tracker.save(args.state)
+        print(f"\nSaved counters to {args.state}")
+    if args.output:
+        tracker.entropy(args.scope).to_csv(args.output, index=False)
+        print(f"Saved entropy table to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
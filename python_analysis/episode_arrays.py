@@ -0,0 +1,305 @@
+"""
+Columnar NumPy encoding of EpisodeRecorder JSON.
+
+Loads episode files (a directory of episode_*.json or a bundle JSON with an
+"episodes" array) and flattens every action into parallel integer arrays so
+corpus-wide analyses can run as array operations instead of per-dict loops.
+"""
+
+import glob
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# Branch names as recorded by PartyMemberAgent / BossAgent
+PARTY_BRANCHES = ["movement", "rotation", "attack", "heal", "threat_boost", "class_selection"]
+BOSS_BRANCHES = ["movement", "rotation", "attack", "wall_pickup", "wall_place"]
+BRANCHES = PARTY_BRANCHES + ["wall_pickup", "wall_place"]
+
+# class_selection value -> class (PartyMemberAgent: 0=Tank, 1=Healer, 2=RangedDPS, 3=MeleeDPS)
+SELECTABLE_CLASSES = ["Tank", "Healer", "RangedDPS", "MeleeDPS"]
+CLASS_NAMES = ["None", "Tank", "Healer", "RangedDPS", "MeleeDPS", "Boss", "Unknown"]
+WIN_CONDITIONS = ["party", "boss", "timeout", "manual_stop"]
+
+NO_CLASS = CLASS_NAMES.index("None")
+BOSS_CLASS = CLASS_NAMES.index("Boss")
+UNKNOWN_CLASS = CLASS_NAMES.index("Unknown")
+
+
+def load_episode(filepath: str) -> dict:
+    """Load an episode JSON file"""
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def episode_files(data_dir: str) -> List[str]:
+    """Return episode_*.json files in data_dir, ordered by episode number"""
+    def sort_key(path):
+        match = re.search(r"episode_(\d+)\.json$", path)
+        return (int(match.group(1)) if match else -1, path)
+
+    return sorted(glob.glob(os.path.join(data_dir, "episode_*.json")), key=sort_key)
+
+
+def load_episodes(path: str) -> List[dict]:
+    """Load episodes from an EpisodeData directory or a bundle JSON file"""
+    if os.path.isdir(path):
+        episodes = []
+        for filepath in episode_files(path):
+            try:
+                episodes.append(load_episode(filepath))
+            except Exception as e:
+                print(f"Error loading {filepath}: {e}")
+        return episodes
+
+    data = load_episode(path)
+    if isinstance(data, dict) and "episodes" in data:
+        return data["episodes"]
+    elif isinstance(data, list):
+        return data
+    else:
+        return [data]
+
+
+def iter_episode_chunks(path: str, chunk_size: int = 2000) -> Iterator[List[dict]]:
+    """
+    Yield episodes in lists of at most chunk_size, in recorded order.
+    Directories are read lazily so corpora larger than memory can be streamed.
+    """
+    if not os.path.isdir(path):
+        episodes = load_episodes(path)
+        for start in range(0, len(episodes), chunk_size):
+            yield episodes[start:start + chunk_size]
+        return
+
+    chunk = []
+    for filepath in episode_files(path):
+        try:
+            chunk.append(load_episode(filepath))
+        except Exception as e:
+            print(f"Error loading {filepath}: {e}")
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_agent_classes(episode: dict) -> Dict[str, str]:
+    """Return {agentId: class} handling both dict and list formats"""
+    agent_classes = episode.get("agentClasses", {})
+    if isinstance(agent_classes, list) or not agent_classes:
+        agent_ids = episode.get("agentIds", [])
+        agent_class_values = episode.get("agentClassValues", [])
+        agent_classes = dict(zip(agent_ids, agent_class_values))
+    return agent_classes
+
+
+def is_boss(agent_id: str, agent_class: Optional[str] = None) -> bool:
+    """Boss detection shared with the SNA scripts (class first, then name)"""
+    if agent_class is not None and str(agent_class).lower() == "boss":
+        return True
+    return "boss" in str(agent_id).lower()
+
+
+@dataclass
+class EncodedEpisodes:
+    """
+    Flattened episode corpus.
+
+    Per-episode arrays have length E, per-action arrays have length N and are
+    grouped by episode in recording order (offsets[e]:offsets[e + 1]).
+    Agents, branches and classes are integer codes into the name lists.
+    """
+    episode_numbers: np.ndarray   # (E,) int64, the recorded "episode" counter
+    win_conditions: np.ndarray    # (E,) int8 into WIN_CONDITIONS, -1 if unknown
+    durations: np.ndarray         # (E,) float64 seconds
+    agent_classes: np.ndarray     # (E, A) int8 into CLASS_NAMES, -1 if agent absent
+    offsets: np.ndarray           # (E + 1,) int64 action offsets
+    action_episode: np.ndarray    # (N,) int32 episode index
+    action_frame: np.ndarray      # (N,) int32
+    action_agent: np.ndarray      # (N,) int16 into agent_names
+    action_branch: np.ndarray     # (N,) int8 into branch_names
+    action_value: np.ndarray      # (N,) int16
+    action_target: np.ndarray     # (N,) int16 into agent_names, -1 if no targetId
+    agent_names: List[str]
+    branch_names: List[str]
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episode_numbers)
+
+    @property
+    def num_agents(self) -> int:
+        return len(self.agent_names)
+
+    @property
+    def num_actions(self) -> int:
+        return len(self.action_frame)
+
+    def boss_mask(self) -> np.ndarray:
+        """(A,) bool, True for agents that are the boss in any episode"""
+        by_class = (self.agent_classes == BOSS_CLASS).any(axis=0)
+        by_name = np.array([is_boss(name) for name in self.agent_names], dtype=bool)
+        return by_class | by_name
+
+    def branch_code(self, branch: str) -> int:
+        """Code of a branch name, -1 if it never occurs"""
+        return self.branch_names.index(branch) if branch in self.branch_names else -1
+
+    def select(self, episode_indices) -> "EncodedEpisodes":
+        """Subset of episodes (keeps the agent/branch vocabularies)"""
+        episode_indices = np.asarray(episode_indices, dtype=np.int64)
+        counts = np.diff(self.offsets)[episode_indices]
+        starts = self.offsets[episode_indices]
+        new_offsets = np.zeros(len(episode_indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_offsets[1:])
+        # Action positions of every selected episode, concatenated in order
+        rows = np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+        return EncodedEpisodes(
+            episode_numbers=self.episode_numbers[episode_indices],
+            win_conditions=self.win_conditions[episode_indices],
+            durations=self.durations[episode_indices],
+            agent_classes=self.agent_classes[episode_indices],
+            offsets=new_offsets,
+            action_episode=np.repeat(np.arange(len(episode_indices), dtype=np.int32), counts),
+            action_frame=self.action_frame[rows],
+            action_agent=self.action_agent[rows],
+            action_branch=self.action_branch[rows],
+            action_value=self.action_value[rows],
+            action_target=self.action_target[rows],
+            agent_names=self.agent_names,
+            branch_names=self.branch_names,
+        )
+
+
+def _class_code(agent_id: str, agent_class) -> int:
+    if agent_class in CLASS_NAMES:
+        return CLASS_NAMES.index(agent_class)
+    if is_boss(agent_id, agent_class):
+        return BOSS_CLASS
+    return UNKNOWN_CLASS
+
+
+def encode_episodes(episodes: List[dict], agent_names: Optional[List[str]] = None,
+                    branch_names: Optional[List[str]] = None,
+                    only_branches: Optional[Sequence[str]] = None) -> EncodedEpisodes:
+    """Encode episode dicts into an EncodedEpisodes corpus (only actions on only_branches if given)"""
+    agent_names = list(agent_names) if agent_names else []
+    branch_names = list(branch_names) if branch_names else list(BRANCHES)
+    agent_index = {name: i for i, name in enumerate(agent_names)}
+    branch_index = {name: i for i, name in enumerate(branch_names)}
+
+    def agent_code(name):
+        if name not in agent_index:
+            agent_index[name] = len(agent_names)
+            agent_names.append(name)
+        return agent_index[name]
+
+    def branch_code(name):
+        if name not in branch_index:
+            branch_index[name] = len(branch_names)
+            branch_names.append(name)
+        return branch_index[name]
+
+    num_episodes = len(episodes)
+    episode_numbers = np.zeros(num_episodes, dtype=np.int64)
+    win_conditions = np.full(num_episodes, -1, dtype=np.int8)
+    durations = np.zeros(num_episodes, dtype=np.float64)
+    offsets = np.zeros(num_episodes + 1, dtype=np.int64)
+    class_rows = []
+
+    frames, agents, branches, values, targets = [], [], [], [], []
+    for e, episode in enumerate(episodes):
+        episode_numbers[e] = episode.get("episode", e)
+        win = episode.get("winCondition", "")
+        if win in WIN_CONDITIONS:
+            win_conditions[e] = WIN_CONDITIONS.index(win)
+        durations[e] = float(episode.get("duration", 0.0) or 0.0)
+
+        class_rows.append({agent_code(a_id): _class_code(a_id, a_cls)
+                           for a_id, a_cls in get_agent_classes(episode).items()})
+
+        actions = episode.get("actions", []) or []
+        if only_branches is not None:
+            actions = [act for act in actions if act.get("branch", "unknown") in only_branches]
+        for act in actions:
+            frames.append(act.get("frame", 0))
+            agents.append(agent_code(act.get("agentId", "unknown")))
+            branches.append(branch_code(act.get("branch", "unknown")))
+            values.append(act.get("value", 0))
+            target = act.get("targetId")
+            targets.append(agent_code(target) if target else -1)
+        offsets[e + 1] = offsets[e] + len(actions)
+
+    agent_classes = np.full((num_episodes, len(agent_names)), -1, dtype=np.int8)
+    for e, row in enumerate(class_rows):
+        for a, code in row.items():
+            agent_classes[e, a] = code
+
+    counts = np.diff(offsets)
+    return EncodedEpisodes(
+        episode_numbers=episode_numbers,
+        win_conditions=win_conditions,
+        durations=durations,
+        agent_classes=agent_classes,
+        offsets=offsets,
+        action_episode=np.repeat(np.arange(num_episodes, dtype=np.int32), counts),
+        action_frame=np.asarray(frames, dtype=np.int32),
+        action_agent=np.asarray(agents, dtype=np.int16),
+        action_branch=np.asarray(branches, dtype=np.int8),
+        action_value=np.asarray(values, dtype=np.int16),
+        action_target=np.asarray(targets, dtype=np.int16),
+        agent_names=agent_names,
+        branch_names=branch_names,
+    )
+
+
+def resolve_classes(enc: EncodedEpisodes) -> np.ndarray:
+    """
+    (E, A) class codes with "None" replaced by the first valid class_selection.
+
+    EpisodeRecorder snapshots classes when the episode starts, before agents
+    pick one, so party members are usually recorded as "None". The class is
+    locked by the first class_selection value in 0..3.
+    """
+    classes = enc.agent_classes.copy()
+    branch = enc.branch_code("class_selection")
+    if branch < 0:
+        return classes
+
+    mask = (enc.action_branch == branch) & (enc.action_value >= 0) & (enc.action_value < len(SELECTABLE_CLASSES))
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0:
+        return classes
+
+    # Rows are in recording order, so the first row per (episode, agent) wins
+    key = enc.action_episode[rows].astype(np.int64) * enc.num_agents + enc.action_agent[rows]
+    _, first = np.unique(key, return_index=True)
+    rows = rows[first]
+    ep = enc.action_episode[rows]
+    ag = enc.action_agent[rows]
+    selected = (enc.action_value[rows] + 1).astype(np.int8)  # +1 because None is 0
+
+    current = classes[ep, ag]
+    replace = (current == NO_CLASS) | (current == UNKNOWN_CLASS) | (current == -1)
+    classes[ep[replace], ag[replace]] = selected[replace]
+    return classes
+
+
+def window_index(num_episodes: int, num_windows: int) -> np.ndarray:
+    """(E,) window of each episode index, same split as dense_sna (last window takes the remainder)"""
+    window_size = max(1, num_episodes // max(1, num_windows))
+    return np.minimum(np.arange(num_episodes) // window_size, num_windows - 1)
+
+
+def mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finaliser: well-mixed, stable 64-bit hashes of integer arrays (wrapping arithmetic)"""
+    x = np.asarray(x).astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
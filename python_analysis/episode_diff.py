@@ -0,0 +1,194 @@
+"""
+Diff two recordings of an episode, e.g. an original and its EpisodeReplay
+re-recording, to check replay determinism.
+
+Actions are encoded as integer keys (frame, agent, branch, occurrence) and
+joined with a sort-merge (np.intersect1d on sorted keys), so 100k-row
+episodes diff in milliseconds. The report gives the first divergence, the
+divergence rate per frame bin, and mismatch counts per agent and branch.
+With two directories, episode_N.json files are paired by name.
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from episode_arrays import EncodedEpisodes, encode_episodes, episode_files, load_episode
+
+
+def _action_codes(enc: EncodedEpisodes, align_start: bool = False):
+    """
+    (frame, agent, branch) code and occurrence of every action row. Codes
+    sort by frame first; occurrence numbers repeated (frame, agent, branch)
+    rows so duplicates pair up in recording order.
+    """
+    frame = enc.action_frame.astype(np.int64)
+    if align_start and len(frame):
+        frame = frame - frame.min()
+    num_agents, num_branches = max(1, enc.num_agents), max(1, len(enc.branch_names))
+    base = (frame * num_agents + enc.action_agent) * num_branches + enc.action_branch
+    order = np.lexsort((np.arange(len(base)), base))
+    sorted_base = base[order]
+    starts = np.r_[0, np.flatnonzero(sorted_base[1:] != sorted_base[:-1]) + 1]
+    occurrence = np.empty(len(base), dtype=np.int64)
+    occurrence[order] = np.arange(len(base)) - np.repeat(starts, np.diff(np.r_[starts, len(base)]))
+    return base, occurrence
+
+
+def _action_keys(base: np.ndarray, occurrence: np.ndarray, slots: int) -> np.ndarray:
+    """int64 key (frame, agent, branch, occurrence); slots must exceed every occurrence"""
+    if len(base) and int(base.max()) >= (np.iinfo(np.int64).max - slots) // slots:
+        raise ValueError(f"Action keys overflow int64 with {slots} occurrence slots")
+    return base * slots + occurrence
+
+
+def _decode(keys: np.ndarray, num_agents: int, num_branches: int, slots: int):
+    rest = keys // slots
+    branch = rest % num_branches
+    rest //= num_branches
+    return rest // num_agents, rest % num_agents, branch
+
+
+def diff_episodes(episode_a: dict, episode_b: dict, bin_frames: int = 60, align_start: bool = False) -> Dict:
+    """Compare two episode dicts action by action"""
+    # One corpus so both episodes share the agent/branch code tables
+    enc = encode_episodes([episode_a, episode_b])
+    enc_a, enc_b = enc.select([0]), enc.select([1])
+    num_agents, num_branches = max(1, enc.num_agents), max(1, len(enc.branch_names))
+    base_a, occurrence_a = _action_codes(enc_a, align_start)
+    base_b, occurrence_b = _action_codes(enc_b, align_start)
+    # Occurrence field wide enough for the most repeated (frame, agent, branch) in either recording
+    slots = int(max(occurrence_a.max(initial=0), occurrence_b.max(initial=0))) + 1
+    keys_a, keys_b = _action_keys(base_a, occurrence_a, slots), _action_keys(base_b, occurrence_b, slots)
+
+    order_a, order_b = np.argsort(keys_a, kind="stable"), np.argsort(keys_b, kind="stable")
+    sorted_a, sorted_b = keys_a[order_a], keys_b[order_b]
+    common, ia, ib = np.intersect1d(sorted_a, sorted_b, assume_unique=True, return_indices=True)
+    value_a, value_b = enc_a.action_value[order_a][ia], enc_b.action_value[order_b][ib]
+    changed = value_a != value_b
+
+    only_a = np.setdiff1d(sorted_a, common, assume_unique=True)
+    only_b = np.setdiff1d(sorted_b, common, assume_unique=True)
+    mismatched = np.concatenate([common[changed], only_a, only_b])
+    kind = np.concatenate([np.zeros(changed.sum(), dtype=np.int8), np.ones(len(only_a), dtype=np.int8),
+                           np.full(len(only_b), 2, dtype=np.int8)])
+    frame, agent, branch = _decode(mismatched, num_agents, num_branches, slots)
+    all_frame, _, _ = _decode(np.union1d(sorted_a, sorted_b), num_agents, num_branches, slots)
+
+    report = {
+        "actions_a": int(len(keys_a)),
+        "actions_b": int(len(keys_b)),
+        "matched": int(len(common) - changed.sum()),
+        "value_mismatches": int(changed.sum()),
+        "only_in_a": int(len(only_a)),
+        "only_in_b": int(len(only_b)),
+        "identical": bool(len(mismatched) == 0),
+        "first_divergence": None,
+    }
+    total = len(all_frame)
+    report["divergence_rate"] = len(mismatched) / total if total else 0.0
+
+    if len(mismatched):
+        first = int(np.argmin(mismatched))
+        detail = {
+            "frame": int(frame[first]),
+            "agent": enc.agent_names[agent[first]],
+            "branch": enc.branch_names[branch[first]],
+            "kind": ["value", "only_in_a", "only_in_b"][kind[first]],
+        }
+        if kind[first] == 0:
+            k = np.flatnonzero(changed)[np.searchsorted(common[changed], mismatched[first])]
+            detail["value_a"], detail["value_b"] = int(value_a[k]), int(value_b[k])
+        report["first_divergence"] = detail
+
+        bins = max(1, int(all_frame.max()) // bin_frames + 1)
+        totals = np.bincount(all_frame // bin_frames, minlength=bins)
+        errors = np.bincount(frame // bin_frames, minlength=bins)
+        report["divergence_over_time"] = [
+            {"start_frame": int(i * bin_frames), "actions": int(t), "mismatches": int(e),
+             "rate": float(e / t) if t else 0.0}
+            for i, (t, e) in enumerate(zip(totals, errors)) if t]
+
+        pair = agent * num_branches + branch
+        counts = np.bincount(pair, minlength=num_agents * num_branches)
+        report["mismatches_by_agent_branch"] = {
+            f"{enc.agent_names[p // num_branches]}/{enc.branch_names[p % num_branches]}": int(counts[p])
+            for p in np.flatnonzero(counts)}
+    return report
+
+
+def diff_directories(dir_a: str, dir_b: str, bin_frames: int = 60, align_start: bool = False) -> pd.DataFrame:
+    """Diff every episode_N.json present in both directories"""
+    files_b = {os.path.basename(p): p for p in episode_files(dir_b)}
+    rows = []
+    for path_a in episode_files(dir_a):
+        name = os.path.basename(path_a)
+        if name not in files_b:
+            continue
+        report = diff_episodes(load_episode(path_a), load_episode(files_b[name]), bin_frames, align_start)
+        first = report["first_divergence"] or {}
+        rows.append({
+            "file": name,
+            "identical": report["identical"],
+            "divergence_rate": report["divergence_rate"],
+            "value_mismatches": report["value_mismatches"],
+            "only_in_a": report["only_in_a"],
+            "only_in_b": report["only_in_b"],
+            "first_frame": first.get("frame"),
+            "first_agent": first.get("agent"),
+            "first_branch": first.get("branch"),
+        })
+    return pd.DataFrame(rows)
+
+
+def print_report(report: Dict, top: Optional[int] = 10):
+    print(f"\nActions: {report['actions_a']} vs {report['actions_b']}, matched {report['matched']}")
+    if report["identical"]:
+        print("Episodes are identical")
+        return
+    print(f"Value mismatches: {report['value_mismatches']}, only in A: {report['only_in_a']}, "
+          f"only in B: {report['only_in_b']} (divergence rate {report['divergence_rate'] * 100:.2f}%)")
+    first = report["first_divergence"]
+    values = f" ({first['value_a']} vs {first['value_b']})" if "value_a" in first else ""
+    print(f"First divergence: frame {first['frame']}, {first['agent']} / {first['branch']} [{first['kind']}]{values}")
+    print("\nMismatches by agent/branch:")
+    for name, count in sorted(report["mismatches_by_agent_branch"].items(), key=lambda x: -x[1])[:top]:
+        print(f"  {name}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two episode recordings (replay determinism check)")
+    parser.add_argument("a", help="Original episode JSON or EpisodeData directory")
+    parser.add_argument("b", help="Replayed episode JSON or EpisodeData directory")
+    parser.add_argument("--bin-frames", type=int, default=60, help="Frames per divergence-rate bin")
+    parser.add_argument("--align-start", action="store_true", help="Compare frames relative to each recording's first frame")
+    parser.add_argument("--output", "-o", default=None, help="JSON report (file pair) or CSV (directory pair)")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.a) and os.path.isdir(args.b):
+        table = diff_directories(args.a, args.b, args.bin_frames, args.align_start)
+        if table.empty:
+            raise SystemExit("No episode files present in both directories")
+        print(f"Compared {len(table)} episode pairs: {int(table['identical'].sum())} identical")
+        diverged = table[~table["identical"]].sort_values("divergence_rate", ascending=False)
+        if not diverged.empty:
+            print(diverged.head(20).to_string(index=False))
+        if args.output:
+            table.to_csv(args.output, index=False)
+            print(f"\nSaved diff table to {args.output}")
+        return
+
+    report = diff_episodes(load_episode(args.a), load_episode(args.b), args.bin_frames, args.align_start)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved diff report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Ingest EpisodeData folders into a de-duplicated, session-aware store.
+
+EpisodeRecorder restarts episodeCount at 0 every session and OnDisable saves
+a partial "manual_stop" episode, so EpisodeData directories end up mixing
+sessions, overwritten numbers and duplicate copies. Ingest walks episode
+files in recording order (modification time, then episode number), and:
+
+  - content-hashes each episode (canonical JSON), storing identical payloads once
+  - starts a new session when the counter does not increase or after a
+    manual_stop episode
+  - assigns a stable global key "s<session>-e<episode>" and a global index
+
+The store is objects/<hash>.json plus manifest.json. Re-running ingest only
+parses files whose (path, size, mtime) is new, and sessions continue where
+the manifest left off. iter_store_episodes()/--bundle give downstream tools
+the unique episodes in global order.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Optional
+
+from episode_arrays import episode_files, load_episode
+
+MANIFEST = "manifest.json"
+
+
+def content_hash(episode: dict) -> str:
+    """sha256 of the canonical JSON of an episode (whitespace and key order independent)"""
+    canonical = json.dumps(episode, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_manifest(store_dir: str) -> Dict:
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"entries": [], "sources": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(store_dir: str, manifest: Dict):
+    path = os.path.join(store_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _object_path(store_dir: str, digest: str) -> str:
+    return os.path.join(store_dir, "objects", digest[:2], f"{digest}.json")
+
+
+def _source_files(inputs: List[str]) -> List[str]:
+    """Episode files from all inputs in recording order"""
+    files = []
+    for path in inputs:
+        files.extend(episode_files(path) if os.path.isdir(path) else [path])
+
+    def order(path):
+        match = re.search(r"episode_(\d+)\.json$", path)
+        return (os.path.getmtime(path), int(match.group(1)) if match else -1, path)
+
+    return sorted(set(files), key=order)
+
+
+def ingest(inputs: List[str], store_dir: str) -> Dict[str, int]:
+    """
+    Add episode files to the store. Returns counts of new, duplicate,
+    unchanged (already ingested) and failed files.
+    """
+    os.makedirs(os.path.join(store_dir, "objects"), exist_ok=True)
+    manifest = load_manifest(store_dir)
+    entries, sources = manifest["entries"], manifest["sources"]
+    # Duplicates point at their canonical entry, so only unique entries are lookup targets
+    by_hash = {e["hash"]: e for e in entries if e["duplicate_of"] is None}
+
+    unique = [e for e in entries if e["duplicate_of"] is None]
+    session = unique[-1]["session"] if unique else -1
+    previous_episode = unique[-1]["episode"] if unique else None
+    after_stop = bool(unique) and unique[-1]["winCondition"] == "manual_stop"
+    next_index = len(unique)
+
+    stats = {"new": 0, "duplicate": 0, "unchanged": 0, "failed": 0, "sessions": 0}
+    for path in _source_files(inputs):
+        stat = os.stat(path)
+        source = os.path.abspath(path)
+        fingerprint = [stat.st_size, stat.st_mtime]
+        if sources.get(source) == fingerprint:
+            stats["unchanged"] += 1
+            continue
+        try:
+            episode = load_episode(path)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+            stats["failed"] += 1
+            continue
+        sources[source] = fingerprint
+
+        digest = content_hash(episode)
+        number = int(episode.get("episode", -1))
+        entry = {
+            "hash": digest,
+            "source": source,
+            "mtime": stat.st_mtime,
+            "episode": number,
+            "winCondition": episode.get("winCondition", "unknown"),
+            "duplicate_of": None,
+        }
+        if digest in by_hash:
+            # Same payload seen before: keep the record, not another copy, and leave sessions alone
+            entry.update(session=None, key=None, index=None, duplicate_of=by_hash[digest]["key"])
+            entries.append(entry)
+            stats["duplicate"] += 1
+            continue
+
+        if previous_episode is None or number <= previous_episode or after_stop:
+            session += 1
+            stats["sessions"] += 1
+        previous_episode, after_stop = number, entry["winCondition"] == "manual_stop"
+
+        entry.update(session=session, key=f"s{session:04d}-e{number:06d}", index=next_index)
+        next_index += 1
+        object_path = _object_path(store_dir, digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        with open(object_path, "w", encoding="utf-8") as f:
+            json.dump(episode, f, separators=(",", ":"))
+        entries.append(entry)
+        by_hash[digest] = entry
+        stats["new"] += 1
+
+    save_manifest(store_dir, manifest)
+    return stats
+
+
+def iter_store_episodes(store_dir: str, with_key: bool = True) -> Iterator[dict]:
+    """Unique episodes in global order; with_key adds "session" and "globalKey" fields"""
+    manifest = load_manifest(store_dir)
+    for entry in sorted((e for e in manifest["entries"] if e["duplicate_of"] is None), key=lambda e: e["index"]):
+        episode = load_episode(_object_path(store_dir, entry["hash"]))
+        if with_key:
+            episode["session"] = entry["session"]
+            episode["globalKey"] = entry["key"]
+        yield episode
+
+
+def print_summary(store_dir: str, stats: Optional[Dict[str, int]] = None):
+    manifest = load_manifest(store_dir)
+    unique = [e for e in manifest["entries"] if e["duplicate_of"] is None]
+    if stats:
+        print(f"Ingested: {stats['new']} new, {stats['duplicate']} duplicates, "
+              f"{stats['unchanged']} already ingested, {stats['failed']} failed, {stats['sessions']} new sessions")
+    sessions = {}
+    for e in unique:
+        s = sessions.setdefault(e["session"], {"episodes": 0, "first": e["episode"], "last": e["episode"], "manual_stop": 0})
+        s["episodes"] += 1
+        s["last"] = e["episode"]
+        s["manual_stop"] += e["winCondition"] == "manual_stop"
+    print(f"\nStore {store_dir}: {len(unique)} unique episodes in {len(sessions)} sessions")
+    for session, s in sessions.items():
+        print(f"  Session {session}: episodes {s['first']}-{s['last']} ({s['episodes']} stored, "
+              f"{s['manual_stop']} manual_stop)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="De-duplicate episode files and assign stable (session, episode) keys")
+    parser.add_argument("inputs", nargs="*", help="EpisodeData directories or episode files to ingest")
+    parser.add_argument("--store", "-s", required=True, help="Store directory (objects + manifest.json)")
+    parser.add_argument("--bundle", default=None, help="Also write the unique episodes as a bundle JSON")
+    args = parser.parse_args()
+
+    stats = ingest(args.inputs, args.store) if args.inputs else None
+    print_summary(args.store, stats)
+
+    if args.bundle:
+        episodes = list(iter_store_episodes(args.store))
+        with open(args.bundle, "w", encoding="utf-8") as f:
+            json.dump({"episodes": episodes}, f)
+        print(f"\nWrote {len(episodes)} episodes to {args.bundle}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Near-duplicate detection and strategy clustering of episodes with MinHash/LSH.
+
+Late in training thousands of episodes play out almost identically. Each
+episode is reduced to the set of its k-step shingles of joint actions (every
+action recorded on one frame, keyed by class rather than agent id), hashed
+into a MinHash signature, and indexed with LSH bands. Episodes that share a
+band bucket and whose signatures agree above a Jaccard threshold are joined
+with a vectorised union-find, giving strategy families in sub-quadratic
+time. One representative per family can then be sent to the expensive SNA
+and replay renders.
+
+Directories are streamed in chunks, so only the (episodes x num_perm)
+signature matrix is held in memory.
+"""
+
+import argparse
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from episode_arrays import (WIN_CONDITIONS, EncodedEpisodes, encode_episodes, iter_episode_chunks, mix64,
+                            resolve_classes)
+
+# Largest prime below 2**32: (a * x + b) stays inside uint64 for 32-bit a, b, x
+_PRIME = np.uint64(4294967291)
+_EMPTY = np.uint64(_PRIME)
+
+
+def step_tokens(enc: EncodedEpisodes, branches: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One uint64 token per (episode, frame) for the joint action of that step.
+    The token is an order-independent sum of per-action hashes of
+    (class, branch name, value). Returns (tokens, step_episode) in episode/frame order.
+    """
+    classes = resolve_classes(enc)
+    branch_hash = np.array([zlib.crc32(name.encode("utf-8")) for name in enc.branch_names], dtype=np.uint64)
+    rows = np.arange(enc.num_actions)
+    if branches:
+        codes = [enc.branch_code(b) for b in branches]
+        rows = np.flatnonzero(np.isin(enc.action_branch, [c for c in codes if c >= 0]))
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+
+    episode = enc.action_episode[rows].astype(np.int64)
+    agent_class = classes[episode, enc.action_agent[rows]].astype(np.int64) + 1
+    code = (branch_hash[enc.action_branch[rows]] << np.uint64(24)) \
+        ^ (agent_class.astype(np.uint64) << np.uint64(16)) \
+        ^ (enc.action_value[rows].astype(np.int64) & 0xFFFF).astype(np.uint64)
+    action_hash = mix64(code)
+
+    order = np.lexsort((enc.action_frame[rows], episode))
+    episode, frame, action_hash = episode[order], enc.action_frame[rows][order], action_hash[order]
+    new_step = np.ones(len(order), dtype=bool)
+    new_step[1:] = (episode[1:] != episode[:-1]) | (frame[1:] != frame[:-1])
+    starts = np.flatnonzero(new_step)
+    return np.add.reduceat(action_hash, starts), episode[starts]
+
+
+def shingles(tokens: np.ndarray, step_episode: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distinct k-step shingles per episode as values in [0, _PRIME).
+    Returns (shingle, shingle_episode) sorted by episode.
+    """
+    count = len(tokens) - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    hashes = tokens[:count].copy()
+    for j in range(1, k):
+        hashes = hashes * np.uint64(0x100000001B3) + tokens[j:count + j]
+    valid = step_episode[:count] == step_episode[k - 1:]
+    values = mix64(hashes[valid]) % _PRIME
+    episode = step_episode[:count][valid]
+
+    # Set semantics: drop repeated shingles inside an episode
+    keyed = np.unique(episode.astype(np.uint64) << np.uint64(32) | values)
+    return keyed & np.uint64(0xFFFFFFFF), (keyed >> np.uint64(32)).astype(np.int64)
+
+
+def minhash_signatures(shingle_values: np.ndarray, shingle_episode: np.ndarray, num_episodes: int,
+                       num_perm: int = 128, seed: int = 0, chunk_size: int = 1 << 16) -> np.ndarray:
+    """
+    (num_episodes, num_perm) MinHash signatures from episode-sorted shingles.
+    Episodes without shingles keep the sentinel _PRIME in every slot.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    signatures = np.full((num_perm, num_episodes), _EMPTY, dtype=np.uint64)
+
+    for start in range(0, len(shingle_values), chunk_size):
+        values = shingle_values[start:start + chunk_size]
+        episode = shingle_episode[start:start + chunk_size]
+        hashed = (a[:, None] * values[None, :] + b[:, None]) % _PRIME
+        starts = np.flatnonzero(np.r_[True, episode[1:] != episode[:-1]])
+        minima = np.minimum.reduceat(hashed, starts, axis=1)
+        # An episode can straddle two chunks, so merge instead of assigning
+        ep = episode[starts]
+        signatures[:, ep] = np.minimum(signatures[:, ep], minima)
+    return signatures.T.astype(np.uint32, copy=False) if num_episodes else np.zeros((0, num_perm), np.uint32)
+
+
+def lsh_candidates(signatures: np.ndarray, bands: int = 16) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Candidate pairs from LSH banding: episodes sharing any band bucket.
+    Each bucket contributes (first member, other member) pairs only, which
+    is enough for connectivity and keeps the pair count linear.
+    """
+    num_episodes, num_perm = signatures.shape
+    rows = num_perm // bands
+    non_empty = np.flatnonzero(signatures[:, 0] != np.uint32(_EMPTY))
+    sources, targets = [], []
+    for band in range(bands):
+        block = signatures[non_empty, band * rows:(band + 1) * rows].astype(np.uint64)
+        key = np.zeros(len(non_empty), dtype=np.uint64)
+        for r in range(rows):
+            key = mix64(key ^ block[:, r])
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        head = np.repeat(first, np.diff(np.r_[first, len(key)]))
+        pair = np.flatnonzero(head != np.arange(len(key)))
+        sources.append(non_empty[order[head[pair]]])
+        targets.append(non_empty[order[pair]])
+
+    if not sources:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pairs = np.unique(np.stack([np.concatenate(sources), np.concatenate(targets)], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def estimated_jaccard(signatures: np.ndarray, a: np.ndarray, b: np.ndarray, chunk_size: int = 1 << 15) -> np.ndarray:
+    """Fraction of agreeing MinHash slots for each (a, b) pair"""
+    similarity = np.zeros(len(a))
+    for start in range(0, len(a), chunk_size):
+        sa, sb = signatures[a[start:start + chunk_size]], signatures[b[start:start + chunk_size]]
+        similarity[start:start + chunk_size] = (sa == sb).mean(axis=1)
+    return similarity
+
+
+def connected_components(num_nodes: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Union-find by min-label propagation with pointer jumping; label = smallest member index"""
+    labels = np.arange(num_nodes)
+    if len(a) == 0:
+        return labels
+    while True:
+        lowest = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, lowest)
+        np.minimum.at(updated, b, lowest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_episodes(signatures: np.ndarray, bands: int = 16, threshold: float = 0.8) -> Dict[str, np.ndarray]:
+    """
+    Strategy families from LSH candidates verified against the threshold.
+    Returns {"cluster": (E,) dense ids by size, "size": (E,), "representative": (E,) bool}.
+    The representative is the member with the most verified near-duplicates.
+    """
+    num_episodes = signatures.shape[0]
+    a, b = lsh_candidates(signatures, bands=bands)
+    keep = estimated_jaccard(signatures, a, b) >= threshold
+    a, b = a[keep], b[keep]
+    labels = connected_components(num_episodes, a, b)
+
+    _, cluster, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    # Renumber so cluster 0 is the largest family
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    cluster = rank[cluster]
+
+    degree = np.bincount(np.concatenate([a, b]), minlength=num_episodes)
+    order = np.lexsort((-degree, cluster))
+    representative = np.zeros(num_episodes, dtype=bool)
+    representative[order[np.r_[True, cluster[order][1:] != cluster[order][:-1]]]] = True
+    return {"cluster": cluster, "size": np.bincount(cluster)[cluster], "representative": representative}
+
+
+def corpus_signatures(path: str, shingle_size: int = 3, num_perm: int = 128, branches: Optional[List[str]] = None,
+                      chunk_size: int = 2000, seed: int = 0) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Stream episodes from path and return (signatures, per-episode metadata)"""
+    signatures, frames = [], []
+    offset = 0
+    for chunk in iter_episode_chunks(path, chunk_size):
+        enc = encode_episodes(chunk)
+        tokens, step_episode = step_tokens(enc, branches)
+        values, shingle_episode = shingles(tokens, step_episode, shingle_size)
+        signatures.append(minhash_signatures(values, shingle_episode, enc.num_episodes,
+                                             num_perm=num_perm, seed=seed))
+        frames.append(pd.DataFrame({
+            "index": np.arange(offset, offset + enc.num_episodes),
+            "episode": enc.episode_numbers,
+            "winCondition": [WIN_CONDITIONS[w] if w >= 0 else "unknown" for w in enc.win_conditions],
+            "shingles": np.bincount(shingle_episode, minlength=enc.num_episodes),
+        }))
+        offset += enc.num_episodes
+    if not signatures:
+        return np.zeros((0, num_perm), dtype=np.uint32), pd.DataFrame()
+    return np.vstack(signatures), pd.concat(frames, ignore_index=True)
+
+
+def print_cluster_summary(table: pd.DataFrame, top: int = 10):
+    """Print the largest strategy families and their outcome mix"""
+    num_clusters = table["cluster"].nunique()
+    duplicates = int((table["size"] > 1).sum())
+    print("\n=== Strategy Families ===")
+    print(f"Clusters: {num_clusters} ({duplicates} of {len(table)} episodes have near-duplicates)")
+
+    families = table[table["size"] > 1].groupby("cluster")
+    for cluster, members in list(families)[:top]:
+        rep = members[members["representative"]].iloc[0]
+        outcomes = members["winCondition"].value_counts().to_dict()
+        print(f"\nCluster {cluster}: {len(members)} episodes, representative index {rep['index']} "
+              f"(episode {rep['episode']})")
+        print(f"  Episode range: {members['index'].min()}-{members['index'].max()}")
+        print(f"  Outcomes: {outcomes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate detection and strategy clustering")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--shingle-size", "-k", type=int, default=3, help="Joint steps per shingle")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash signature length")
+    parser.add_argument("--bands", type=int, default=16, help="LSH bands (num-perm must be divisible)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard needed to join a family")
+    parser.add_argument("--branches", nargs="+", default=None, help="Only shingle these branches (default: all)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Episodes encoded per chunk")
+    parser.add_argument("--output", "-o", default=None, help="Optional CSV with the cluster of every episode")
+    parser.add_argument("--signatures", default=None, help="Optional .npz to save the signature matrix")
+    parser.add_argument("--top", type=int, default=10, help="Families to print")
+    args = parser.parse_args()
+
+    if args.num_perm % args.bands:
+        raise SystemExit("--num-perm must be divisible by --bands")
+
+    signatures, table = corpus_signatures(args.input, shingle_size=args.shingle_size, num_perm=args.num_perm,
+                                          branches=args.branches, chunk_size=args.chunk_size)
+    if len(table) == 0:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Signed {len(table)} episodes ({args.num_perm} hashes, {args.bands} bands)")
+
+    clusters = cluster_episodes(signatures, bands=args.bands, threshold=args.threshold)
+    for name, values in clusters.items():
+        table[name] = values
+    print_cluster_summary(table, top=args.top)
+
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"\nSaved clusters to {args.output}")
+    if args.signatures:
+        np.savez_compressed(args.signatures, signatures=signatures, index=table["index"].to_numpy(),
+                            episode=table["episode"].to_numpy())
+        print(f"Saved signatures to {args.signatures}")
+
+
+if __name__ == "__main__":
+    main()
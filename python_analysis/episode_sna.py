@@ -13,10 +13,11 @@ Assumed JSON formats (first match wins):
      "agentClassValues": [...],
      "actions": [{"frame":0,"agentId":"party_0","branch":"attack","value":1}, ...]
    }
-   - In this fallback we infer edges:
-     * Party attack actions -> edge to "Boss" (or "boss" if present)
-     * Boss attack actions -> edge to "Party" (aggregated target)
-     * Heal actions -> edge to "Heals" placeholder (targets unknown)
+   - In this fallback edges come from the sparse SNA tensor's "placeholder" rules
+     (sna_visualization/sna_tensor.py):
+     * Party attack actions -> edge to the boss
+     * Boss attack actions -> one edge per party member, weight split evenly
+     * Heal / threat_boost actions -> edge to a "Heals" / "Threat" placeholder (targets unknown)
 
 Output: PNG image of the SNA graph.
 """
@@ -24,12 +25,20 @@ Output: PNG image of the SNA graph.
 import argparse
 import json
 import os
-from collections import defaultdict
+import sys
 from typing import Dict, List, Tuple
 
 import matplotlib.pyplot as plt
 import networkx as nx
 
+# centrality service lives in sna_visualization/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "sna_visualization"))
+from centrality import compute_centrality  # noqa: E402
+from edge_geometry import grouped_edge_paths  # noqa: E402
+from layout_cache import cached_layout  # noqa: E402
+from sna_tensor import agent_nodes, encode_interactions, interaction_tensor  # noqa: E402
+from webgl_render import RENDER_MODES, EdgeLOD, add_edge_trace, scatter_class, use_webgl, write_html  # noqa: E402
+
 
 def load_episode(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
@@ -61,75 +70,13 @@ def infer_edges_from_events(events: List[dict]) -> Tuple[List[Tuple[str, str, fl
 
 
 def infer_edges_from_actions(data: dict) -> Tuple[List[Tuple[str, str, float, str]], set]:
-    """Fallback when no per-target events exist. Creates more detailed network."""
-    actions = data.get("actions", [])
-    agent_classes = {}
-    if "agentIds" in data and "agentClassValues" in data:
-        for a_id, a_cls in zip(data["agentIds"], data["agentClassValues"]):
-            agent_classes[a_id] = a_cls
-
-    boss_ids = {aid for aid, cls in agent_classes.items() if str(cls).lower() == "boss"}
-    boss_id = next(iter(boss_ids), "Boss")
-    
-    # Separate party members from boss
-    party_members = [aid for aid in agent_classes.keys() if aid not in boss_ids]
-
-    edges = defaultdict(lambda: defaultdict(float))  # src -> tgt -> weight
-    nodes = set(agent_classes.keys())
-
-    # Track action frequencies per agent for better visualization
-    action_counts = defaultdict(lambda: defaultdict(int))
-    
-    for act in actions:
-        branch = act.get("branch")
-        val = act.get("value", 0)
-        agent = act.get("agentId", "unknown")
-        
-        if branch == "attack" and val == 1:
-            action_counts[agent]["attack"] += 1
-            if agent in boss_ids or agent.lower() == "boss":
-                # Boss attacks all party members (distribute threat)
-                for pm in party_members:
-                    edges[agent][pm] += 1.0 / len(party_members) if party_members else 1.0
-                    nodes.update([agent, pm])
-            else:
-                # Party member attacks boss
-                tgt = boss_id
-                edges[agent][tgt] += 1.0
-                nodes.update([agent, tgt])
-        elif branch == "heal" and val == 1:
-            action_counts[agent]["heal"] += 1
-            # Heal could target any party member, create placeholder
-            tgt = "Heals"
-            edges[agent][tgt] += 1.0
-            nodes.update([agent, tgt])
-        elif branch == "threat_boost" and val == 1:
-            action_counts[agent]["threat_boost"] += 1
-            tgt = "Threat"
-            edges[agent][tgt] += 1.0
-            nodes.update([agent, tgt])
-        elif branch == "movement" and val > 0:
-            action_counts[agent]["movement"] += 1
-        elif branch == "rotation" and val > 0:
-            action_counts[agent]["rotation"] += 1
-
-    # Create edges with weights based on action frequency
-    edge_list: List[Tuple[str, str, float, str]] = []
-    for src, tgts in edges.items():
-        for tgt, w in tgts.items():
-            edge_type = "heal" if tgt == "Heals" else "damage"
-            if tgt == "Threat":
-                edge_type = "threat"
-            edge_list.append((src, tgt, w, edge_type))
-    
-    # Add self-loops or activity indicators for high-activity agents
-    for agent, counts in action_counts.items():
-        total_actions = sum(counts.values())
-        if total_actions > 100:  # High activity threshold
-            # Could add self-loop or special node, but skip for now
-            pass
-    
-    return edge_list, nodes
+    """Fallback when no per-target events exist, using the sparse tensor's placeholder rules."""
+    enc = encode_interactions([data])
+    node_of_agent, nodes, roles = agent_nodes(enc)
+    tensor = interaction_tensor(enc, node_of_agent, nodes, agent_role_names=roles, rules="placeholder")
+    edge_list = tensor.edge_list()
+    listed = {name for name, cls in zip(enc.agent_names, enc.agent_classes[0]) if cls >= 0}
+    return edge_list, listed | {n for src, tgt, _, _ in edge_list for n in (src, tgt)}
 
 
 def build_graph(edge_list: List[Tuple[str, str, float, str]]) -> nx.DiGraph:
@@ -174,10 +121,10 @@ def draw_graph_matplotlib(G: nx.DiGraph, output_path: str, title: str):
     plt.close()
 
 
-def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type: str = "kamada_kawai", use_3d: bool = False):
+def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type: str = "kamada_kawai", use_3d: bool = False,
+                      betweenness_k="auto", render: str = "auto", use_layout_cache: bool = True):
     try:
         import plotly.graph_objects as go
-        import numpy as np
     except ImportError:
         raise SystemExit("plotly is not installed. Install with: pip install plotly")
 
@@ -186,22 +133,18 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
     in_strength = {n: sum(d["weight"] for _, _, d in G.in_edges(n, data=True)) for n in G.nodes()}
     total_strength = {n: out_strength.get(n, 0) + in_strength.get(n, 0) for n in G.nodes()}
     
-    # Centrality metrics
-    try:
-        degree_centrality = nx.degree_centrality(G.to_undirected())
-        betweenness = nx.betweenness_centrality(G.to_undirected())
-        closeness = nx.closeness_centrality(G.to_undirected())
-    except:
-        degree_centrality = {n: 0.0 for n in G.nodes()}
-        betweenness = {n: 0.0 for n in G.nodes()}
-        closeness = {n: 0.0 for n in G.nodes()}
+    # Centrality metrics (one undirected conversion, cached by graph topology)
+    centrality = compute_centrality(G, k=betweenness_k)
+    degree_centrality = centrality["degree"]
+    betweenness = centrality["betweenness"]
+    closeness = centrality["closeness"]
     
     # Choose layout algorithm
     if layout_type == "kamada_kawai":
         try:
-            pos = nx.kamada_kawai_layout(G.to_undirected())
+            pos = cached_layout(G.to_undirected(), "kamada_kawai", kind="episode_sna", use_cache=use_layout_cache)
         except:
-            pos = nx.spring_layout(G, k=3, iterations=100, seed=42)
+            pos = cached_layout(G, "spring", k=3, iterations=100, seed=42, kind="episode_sna", use_cache=use_layout_cache)
     elif layout_type == "circular":
         pos = nx.circular_layout(G)
     elif layout_type == "shell":
@@ -210,9 +153,9 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
         try:
             pos = nx.spectral_layout(G.to_undirected())
         except:
-            pos = nx.spring_layout(G, k=3, iterations=100, seed=42)
+            pos = cached_layout(G, "spring", k=3, iterations=100, seed=42, kind="episode_sna", use_cache=use_layout_cache)
     else:  # spring or default
-        pos = nx.spring_layout(G, k=3, iterations=100, seed=42)
+        pos = cached_layout(G, "spring", k=3, iterations=100, seed=42, kind="episode_sna", use_cache=use_layout_cache)
     
     # Normalize positions
     if pos:
@@ -239,54 +182,25 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
         else:
             return "#FFD93D"  # Yellow
     
-    # Prepare edge traces with curved paths
-    edge_traces = {"damage": [], "heal": [], "threat": []}
-    
-    for u, v, data in G.edges(data=True):
-        x0, y0 = pos[u]
-        x1, y1 = pos[v]
-        w = data.get("weight", 1.0)
-        ev_type = data.get("ev_type", "damage")
-        
-        # Create curved edge path
-        mid_x, mid_y = (x0 + x1) / 2, (y0 + y1) / 2
-        # Perpendicular offset for curve
-        dx, dy = x1 - x0, y1 - y0
-        perp_x, perp_y = -dy * 0.3, dx * 0.3
-        curve_x = mid_x + perp_x
-        curve_y = mid_y + perp_y
-        
-        edge_traces[ev_type].append((x0, y0, curve_x, curve_y, x1, y1, w))
+    # Curved edge paths (quadratic Bezier), one NaN-separated array per edge type
+    edge_paths = grouped_edge_paths(G, pos, curvature=0.3, num_points=20)
     
     fig = go.Figure()
+    webgl = use_webgl(G.number_of_edges(), render)
+    lod = EdgeLOD()
     
     # Add edges with curved paths
-    for ev_type, edges in edge_traces.items():
-        if not edges:
+    for ev_type in ["damage", "heal", "threat"]:
+        if ev_type not in edge_paths:
             continue
-        
-        x_edges = []
-        y_edges = []
-        edge_hover = []
-        edge_widths = []
-        
-        for x0, y0, cx, cy, x1, y1, w in edges:
-            # Create smooth curve using quadratic bezier
-            t_values = np.linspace(0, 1, 20)
-            for t in t_values:
-                x = (1-t)**2 * x0 + 2*(1-t)*t * cx + t**2 * x1
-                y = (1-t)**2 * y0 + 2*(1-t)*t * cy + t**2 * y1
-                x_edges.append(x)
-                y_edges.append(y)
-            x_edges.append(None)
-            y_edges.append(None)
-            edge_hover.append(f"{ev_type.capitalize()}: {w:.1f}")
-            edge_widths.append(max(1, min(8, 1 + 3 * w)))
+        paths = edge_paths[ev_type]
+        edges = paths["edges"]
         
         color = "#FF6B6B" if ev_type == "damage" else ("#51CF66" if ev_type == "heal" else "#4DABF7")
         
-        fig.add_trace(go.Scatter(
-            x=x_edges, y=y_edges,
+        add_edge_trace(
+            fig, webgl, lod, paths["x"], paths["y"], num_points=20,
+            weights=[d.get("weight", 1.0) for _, _, d in edges],
             mode='lines',
             line=dict(width=2, color=color),
             hoverinfo='skip',
@@ -294,7 +208,7 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
             name=f"{ev_type.capitalize()} ({len(edges)} edges)",
             legendgroup=ev_type,
             opacity=0.6
-        ))
+        )
     
     # Add nodes with rich information
     node_x = [pos[node][0] for node in G.nodes()]
@@ -319,7 +233,7 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
         info += f"Closeness: {closeness.get(node, 0):.3f}"
         node_info.append(info)
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(scatter_class(webgl)(
         x=node_x, y=node_y,
         mode='markers+text',
         marker=dict(
@@ -381,7 +295,7 @@ def draw_graph_plotly(G: nx.DiGraph, output_path: str, title: str, layout_type:
         height=800
     )
     
-    fig.write_html(output_path)
+    write_html(fig, output_path, lod)
 
 
 def main():
@@ -393,6 +307,12 @@ def main():
     parser.add_argument("--layout", choices=["spring", "kamada_kawai", "circular", "shell", "spectral"], 
                        default="kamada_kawai", help="Layout algorithm for network graph")
     parser.add_argument("--3d", dest="use_3d", action="store_true", help="Use 3D visualization (experimental)")
+    parser.add_argument("--betweenness-k", type=int, default=None,
+                       help="Sample k source nodes for approximate betweenness (default: exact on small graphs)")
+    parser.add_argument("--render", choices=RENDER_MODES, default="auto",
+                       help="Plotly renderer: svg, webgl, or auto (WebGL above a size threshold)")
+    parser.add_argument("--no-layout-cache", dest="layout_cache", action="store_false",
+                       help="Compute layouts from scratch instead of reusing/warm-starting cached ones (reproducible)")
     args = parser.parse_args()
 
     data = load_episode(args.input)
@@ -411,7 +331,9 @@ def main():
     G = build_graph(edge_list)
     if args.plotly:
         draw_graph_plotly(G, args.output, f"{args.title} [{mode}]", 
-                         layout_type=args.layout, use_3d=args.use_3d)
+                         layout_type=args.layout, use_3d=args.use_3d,
+                         betweenness_k=args.betweenness_k or "auto", render=args.render,
+                         use_layout_cache=args.layout_cache)
     else:
         draw_graph_matplotlib(G, args.output, f"{args.title} [{mode}]")
 
@@ -0,0 +1,241 @@
+"""
+Permutation tests for class and composition effects on episode outcomes.
+
+Answers questions like "do parties with a MeleeDPS really win more?" by
+comparing the observed win-rate difference with its distribution when the
+outcomes are shuffled across episodes. Three groupings are tested:
+
+  presence     each class present vs absent (overlapping groups, with a
+               max-statistic family-wise p-value across classes)
+  composition  party compositions (class multisets) against each other
+  window       training windows against each other
+
+Permutations are generated in chunks and evaluated as matrix products, and
+chunks can be spread over a process pool. For a binary outcome, episodes
+with the same group-membership row are exchangeable, so each permutation
+reduces to a multivariate hypergeometric draw of wins over those cells. It
+is the same distribution as shuffling, but costs O(cells) per permutation
+instead of O(episodes). That keeps 100k permutations over 30k episodes
+under a minute. Continuous outcomes (e.g. duration) use shuffled
+(permutations x episodes) matrices.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bootstrap_intervals import episode_class_table
+from episode_arrays import (CLASS_NAMES, SELECTABLE_CLASSES, EncodedEpisodes, encode_episodes, load_episodes,
+                            resolve_classes, window_index)
+
+
+def _group_statistics(sums: np.ndarray, sizes: np.ndarray, total: float, num_items: int):
+    """
+    Mean in group minus mean outside for every column, and the between-group
+    sum of squares (monotone in the one-way ANOVA F for a partition).
+    sums: (R, K) outcome sums per group, sizes: (K,)
+    """
+    inside = sums / np.maximum(sizes, 1)
+    outside = (total - sums) / np.maximum(num_items - sizes, 1)
+    between = (sums ** 2 / np.maximum(sizes, 1)).sum(axis=1) - total ** 2 / num_items
+    return inside - outside, between
+
+
+def _permutation_chunk(cells: np.ndarray, cell_sizes: np.ndarray, outcome, num_permutations: int, seed,
+                       observed: np.ndarray, observed_between: float, binary: bool) -> np.ndarray:
+    """
+    Exceedance counts for one chunk of permutations (runs in worker processes).
+    Returns [per-column |diff| >= observed ..., max |diff| >= observed ..., between >= observed].
+    """
+    rng = np.random.default_rng(seed)
+    sizes = cell_sizes @ cells
+    if binary:
+        # outcome is the total number of successes: a shuffle only decides which cells they land in
+        draws = rng.multivariate_hypergeometric(cell_sizes, int(outcome), size=num_permutations, method="marginals")
+        sums = draws.astype(np.float64) @ cells
+        total = float(outcome)
+    else:
+        # outcome is the per-episode value vector, cells the per-episode membership rows
+        shuffled = rng.permuted(np.broadcast_to(outcome, (num_permutations, len(outcome))), axis=1)
+        sums = shuffled @ cells
+        total = float(outcome.sum())
+    diff, between = _group_statistics(sums, sizes, total, int(cell_sizes.sum()))
+
+    absolute = np.abs(diff)
+    threshold = np.abs(observed) - 1e-12
+    exceed = (absolute >= threshold).sum(axis=0)
+    exceed_max = (absolute.max(axis=1)[:, None] >= threshold).sum(axis=0)
+    exceed_between = (between >= observed_between - 1e-12).sum()
+    return np.concatenate([exceed, exceed_max, [exceed_between]])
+
+
+def permutation_test(outcome: np.ndarray, groups: np.ndarray, num_permutations: int = 10000, seed: int = 0,
+                     chunk_size: int = 5000, workers: int = 1) -> Dict:
+    """
+    Two-sided permutation test of outcome differences between groups.
+
+    outcome: (E,) per-episode values (bool/0-1 outcomes use the fast cell path)
+    groups: (E, K) bool membership; columns may overlap (presence) or partition (composition/window)
+    Returns {"difference", "p_value", "p_family", "between", "p_between", "sizes", "means", "permutations"}
+    with per-column arrays; p-values use the (exceed + 1) / (R + 1) correction.
+    """
+    outcome = np.asarray(outcome, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.float64)
+    num_items = len(outcome)
+    binary = bool(np.isin(outcome, (0.0, 1.0)).all())
+
+    sizes = groups.sum(axis=0)
+    sums = outcome @ groups
+    observed, observed_between = _group_statistics(sums[None, :], sizes, outcome.sum(), num_items)
+    observed, observed_between = observed[0], float(observed_between[0])
+
+    if binary:
+        cells, cell_index = np.unique(groups, axis=0, return_inverse=True)
+        cell_sizes = np.bincount(cell_index.ravel(), minlength=len(cells)).astype(np.int64)
+        payload = (cells, cell_sizes, int(outcome.sum()))
+    else:
+        payload = (groups, np.ones(num_items, dtype=np.int64), outcome)
+        # Shuffled matrices are (chunk x episodes); keep each around 128 MB
+        chunk_size = max(1, min(chunk_size, (1 << 24) // max(1, num_items)))
+
+    chunks = [min(chunk_size, num_permutations - start) for start in range(0, num_permutations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [payload + (n, s, observed, observed_between, binary) for n, s in zip(chunks, seeds)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_permutation_chunk, *zip(*args)))
+    else:
+        parts = [_permutation_chunk(*a) for a in args]
+
+    num_groups = groups.shape[1]
+    exceed = np.sum(parts, axis=0) if parts else np.zeros(2 * num_groups + 1)
+    p = (exceed + 1) / (num_permutations + 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(sizes > 0, sums / np.maximum(sizes, 1), np.nan)
+    return {
+        "difference": observed,
+        "p_value": p[:num_groups],
+        "p_family": p[num_groups:2 * num_groups],
+        "between": observed_between,
+        "p_between": float(p[-1]),
+        "sizes": sizes.astype(np.int64),
+        "means": means,
+        "permutations": num_permutations,
+    }
+
+
+def cohens_h(p1, p2) -> np.ndarray:
+    """Effect size for a difference between two proportions"""
+    return 2 * np.arcsin(np.sqrt(np.clip(p1, 0, 1))) - 2 * np.arcsin(np.sqrt(np.clip(p2, 0, 1)))
+
+
+def composition_labels(enc: EncodedEpisodes) -> List[str]:
+    """Party composition per episode, e.g. "Tank+Tank+Healer+MeleeDPS" ("None" if nobody chose)"""
+    classes = resolve_classes(enc)
+    codes = [CLASS_NAMES.index(c) for c in SELECTABLE_CLASSES]
+    counts = np.stack([(classes == code).sum(axis=1) for code in codes], axis=1)
+    unique, inverse = np.unique(counts, axis=0, return_inverse=True)
+    names = ["+".join(c for c, n in zip(SELECTABLE_CLASSES, row) for _ in range(n)) or "None" for row in unique]
+    return [names[i] for i in inverse.ravel()]
+
+
+def _effects(result: Dict, outcome: np.ndarray, groups: np.ndarray, names: List[str]) -> Dict:
+    """Per-group rows: size, mean, difference vs the rest, Cohen's h, p-values"""
+    rest = (outcome.sum() - outcome @ groups) / np.maximum(len(outcome) - result["sizes"], 1)
+    h = cohens_h(result["means"], rest)
+    rows = {}
+    for k, name in enumerate(names):
+        rows[name] = {
+            "episodes": int(result["sizes"][k]),
+            "win_rate": float(result["means"][k]),
+            "rest_win_rate": float(rest[k]),
+            "difference": float(result["difference"][k]),
+            "cohens_h": float(h[k]),
+            "p_value": float(result["p_value"][k]),
+            "p_family": float(result["p_family"][k]),
+        }
+    return rows
+
+
+def class_effect_tests(enc: EncodedEpisodes, num_permutations: int = 10000, num_windows: Optional[int] = 5,
+                       min_episodes: int = 20, seed: int = 0, workers: int = 1) -> Dict:
+    """
+    Win-rate permutation tests by class presence, composition and training window.
+
+    Returns {"presence": {class: row}, "composition": {"groups": {label: row}, "p_between": p},
+    "window": {...}} where row has episodes, win_rate, rest_win_rate, difference,
+    cohens_h, p_value and p_family (max-statistic family-wise p-value).
+    Compositions with fewer than min_episodes episodes are pooled as "Other".
+    """
+    presence, _, party_win, _ = episode_class_table(enc)
+    outcome = party_win.astype(np.float64)
+    results = {}
+
+    keep = presence.sum(axis=0) > 0
+    if keep.any():
+        names = [c for c, k in zip(SELECTABLE_CLASSES, keep) if k]
+        groups = presence[:, keep]
+        result = permutation_test(outcome, groups, num_permutations, seed, workers=workers)
+        results["presence"] = _effects(result, outcome, groups, names)
+
+    labels = np.array(composition_labels(enc))
+    names, counts = np.unique(labels, return_counts=True)
+    labels = np.where(np.isin(labels, names[counts < min_episodes]), "Other", labels)
+    names = list(np.unique(labels))
+    if len(names) > 1:
+        groups = labels[:, None] == np.array(names)[None, :]
+        result = permutation_test(outcome, groups, num_permutations, seed + 1, workers=workers)
+        results["composition"] = {"groups": _effects(result, outcome, groups, names),
+                                  "p_between": result["p_between"]}
+
+    if num_windows and num_windows > 1 and enc.num_episodes >= num_windows:
+        windows = window_index(enc.num_episodes, num_windows)
+        groups = windows[:, None] == np.arange(num_windows)[None, :]
+        result = permutation_test(outcome, groups, num_permutations, seed + 2, workers=workers)
+        results["window"] = {"groups": _effects(result, outcome, groups, [f"window_{w}" for w in range(num_windows)]),
+                             "p_between": result["p_between"]}
+    return results
+
+
+def print_permutation_report(tests: Dict, num_permutations: Optional[int] = None):
+    """Print composition and window tests (presence is printed by class_performance.print_class_report)"""
+    suffix = f", {num_permutations} permutations" if num_permutations else ""
+    for key, title in [("presence", "Class Presence"), ("composition", "Party Composition"), ("window", "Training Window")]:
+        if key not in tests:
+            continue
+        test = tests[key]
+        rows = test if key == "presence" else test["groups"]
+        header = f"\n=== Win Rate Permutation Test: {title}{suffix} ==="
+        if key != "presence":
+            header += f"\nGroups differ overall: p={test['p_between']:.4f}"
+        print(header)
+        for name, row in sorted(rows.items(), key=lambda x: x[1]["p_value"]):
+            print(f"  {name} ({row['episodes']} episodes): {row['win_rate'] * 100:.2f}% vs "
+                  f"{row['rest_win_rate'] * 100:.2f}% ({row['difference'] * 100:+.2f} pp, h={row['cohens_h']:+.3f}) "
+                  f"p={row['p_value']:.4f}, family p={row['p_family']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Permutation tests for class and composition effects on win rate")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--permutations", "-n", type=int, default=10000, help="Number of permutations")
+    parser.add_argument("--windows", "-w", type=int, default=5, help="Training windows to compare (0 to skip)")
+    parser.add_argument("--min-episodes", type=int, default=20, help="Pool compositions rarer than this as Other")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for permutations")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+
+    tests = class_effect_tests(encode_episodes(episodes), args.permutations, args.windows, args.min_episodes,
+                               args.seed, args.workers)
+    print_permutation_report(tests, args.permutations)
+
+
+if __name__ == "__main__":
+    main()
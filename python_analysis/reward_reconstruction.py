@@ -0,0 +1,200 @@
+"""
+Offline reward reconstruction and alternative-reward evaluation.
+
+EpisodeManager.DistributeRewards() gives terminal rewards only (party win:
++1 party / -1 boss, boss win: the reverse, timeout: 0), and the episode
+JSON does not record returns. This module rebuilds each agent's return from
+winCondition and, using combat_simulation.py, extracts per-agent reward
+features (damage dealt/taken, healing, seconds holding boss aggro,
+survival). A grid of alternative reward functions is then evaluated for the
+whole corpus as one (agent-episodes x features) @ (features x grid) product,
+so reward designs can be compared offline instead of by retraining.
+
+With gamma < 1 every feature is discounted by gamma ** step, matching how
+the trainer would see it (ml-agents.yaml uses gamma 0.99).
+"""
+
+import argparse
+import itertools
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from combat_simulation import simulate_batch
+from episode_arrays import (BOSS_CLASS, CLASS_NAMES, WIN_CONDITIONS, EncodedEpisodes, encode_episodes,
+                            load_episodes)
+
+FEATURES = ["terminal", "damage_dealt", "damage_taken", "healing_done", "threat_held", "survived"]
+
+# Terminal rewards from EpisodeManager.DistributeRewards: (party, boss)
+TERMINAL_REWARDS = {"party": (1.0, -1.0), "boss": (-1.0, 1.0), "timeout": (0.0, 0.0)}
+
+# Weight per feature; every combination is evaluated
+DEFAULT_GRID = {
+    "terminal": [1.0],
+    "damage_dealt": [0.0, 0.001, 0.005],
+    "damage_taken": [0.0, -0.001],
+    "healing_done": [0.0, 0.005, 0.02],
+    "threat_held": [0.0, 0.01, 0.05],
+    "survived": [0.0, 0.25],
+}
+
+
+def reward_features(enc: EncodedEpisodes, gamma: float = 1.0, batch_size: int = 256) -> Dict[str, np.ndarray]:
+    """
+    Per-(episode, agent) reward features, discounted by gamma ** step.
+    Returns {"features": (E, A, F), "classes": (E, A), "boss": (E, A) bool}.
+    Agents absent from an episode have class -1.
+    """
+    num_episodes, num_agents = enc.num_episodes, enc.num_agents
+    features = np.zeros((num_episodes, num_agents, len(FEATURES)))
+    classes = np.full((num_episodes, num_agents), -1, dtype=np.int8)
+    boss = np.zeros((num_episodes, num_agents), dtype=bool)
+
+    for start in range(0, num_episodes, batch_size):
+        batch = np.arange(start, min(start + batch_size, num_episodes))
+        sub = enc.select(batch)
+        sim = simulate_batch(sub)
+        num_batch, num_steps, _ = sim.health.shape
+        rows = np.arange(num_batch)
+
+        present = sim.classes >= 0
+        is_boss = present & ((sim.classes == BOSS_CLASS) | sub.boss_mask()[None, :])
+        party = present & ~is_boss
+
+        discount = np.where(sim.step_valid, gamma ** np.arange(num_steps)[None, :], 0.0)
+        last_step = np.maximum(sim.step_valid.sum(axis=1) - 1, 0)
+        terminal_discount = gamma ** last_step
+
+        # Seconds each party member spent as the boss's highest-threat target
+        dt = np.diff(sim.step_time, axis=1, prepend=sim.step_time[:, :1])
+        alive = (sim.health > 0) & party[:, None, :]
+        top = np.argmax(np.where(alive, sim.threat, -np.inf), axis=2)
+        holds = np.zeros(sim.threat.shape, dtype=bool)
+        holds[rows[:, None], np.arange(num_steps)[None, :], top] = alive.any(axis=2)
+        holds &= alive
+
+        party_reward = np.zeros(num_batch)
+        boss_reward = np.zeros(num_batch)
+        for name, (party_value, boss_value) in TERMINAL_REWARDS.items():
+            hit = sub.win_conditions == WIN_CONDITIONS.index(name)
+            party_reward[hit], boss_reward[hit] = party_value, boss_value
+        terminal = np.where(is_boss, boss_reward[:, None], np.where(party, party_reward[:, None], 0.0))
+
+        f = features[batch]
+        f[..., 0] = terminal * terminal_discount[:, None]
+        f[..., 1] = np.einsum("bs,bsa->ba", discount, sim.damage_dealt)
+        f[..., 2] = np.einsum("bs,bsa->ba", discount, sim.damage_taken)
+        f[..., 3] = np.einsum("bs,bsa->ba", discount, sim.healing_done)
+        f[..., 4] = np.einsum("bs,bsa->ba", discount * dt, holds)
+        f[..., 5] = (sim.health[rows, last_step] > 0) * present * terminal_discount[:, None]
+        features[batch] = f
+        classes[batch] = sim.classes
+        boss[batch] = is_boss
+
+    return {"features": features, "classes": classes, "boss": boss}
+
+
+def reward_grid(grid: Optional[Dict[str, List[float]]] = None) -> np.ndarray:
+    """(G, F) weight matrix for every combination in grid (missing features weigh 0)"""
+    grid = grid or DEFAULT_GRID
+    unknown = [name for name in grid if name not in FEATURES]
+    if unknown:
+        raise ValueError(f"Unknown reward features: {unknown} (available: {FEATURES})")
+    axes = [grid.get(name, [0.0]) for name in FEATURES]
+    return np.array(list(itertools.product(*axes)), dtype=np.float64)
+
+
+def evaluate_rewards(enc: EncodedEpisodes, feats: Dict[str, np.ndarray], weights: np.ndarray) -> pd.DataFrame:
+    """
+    Score each reward function (row of weights) over the corpus.
+
+    win_alignment is the correlation between a party member's return and the
+    party winning: shaping that rewards behaviour unrelated to winning drives
+    it down. shaping_share is the fraction of |return| not coming from the
+    terminal reward. Episodes stopped manually are left out.
+    """
+    keep = (enc.win_conditions >= 0) & (enc.win_conditions != WIN_CONDITIONS.index("manual_stop"))
+    present = (feats["classes"] >= 0) & keep[:, None]
+    ep, ag = np.nonzero(present)
+    x = feats["features"][ep, ag]                   # (N, F)
+    returns = x @ weights.T                         # (N, G)
+    terminal = x[:, :1] * weights[:, 0][None, :]
+
+    table = pd.DataFrame(weights, columns=[f"w_{name}" for name in FEATURES])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["shaping_share"] = np.abs(returns - terminal).sum(axis=0) / np.abs(returns).sum(axis=0)
+
+    party = ~feats["boss"][ep, ag]
+    win = (enc.win_conditions[ep] == WIN_CONDITIONS.index("party")).astype(np.float64)
+    if party.any():
+        r = returns[party] - returns[party].mean(axis=0)
+        w = win[party] - win[party].mean()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            table["win_alignment"] = (r * w[:, None]).sum(axis=0) / np.sqrt((r ** 2).sum(axis=0) * (w ** 2).sum())
+
+    agent_class = feats["classes"][ep, ag]
+    for code in np.unique(agent_class):
+        mask = agent_class == code
+        table[f"mean_{CLASS_NAMES[code]}"] = returns[mask].mean(axis=0)
+    return table
+
+
+def returns_table(enc: EncodedEpisodes, feats: Dict[str, np.ndarray], weights: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """One row per (episode, agent) with features and the return under weights (default: terminal only)"""
+    weights = weights if weights is not None else np.eye(len(FEATURES))[0]
+    ep, ag = np.nonzero(feats["classes"] >= 0)
+    x = feats["features"][ep, ag]
+    table = pd.DataFrame(x, columns=FEATURES)
+    table.insert(0, "episode", enc.episode_numbers[ep])
+    table.insert(1, "agent", np.asarray(enc.agent_names, dtype=object)[ag])
+    table.insert(2, "class", np.asarray(CLASS_NAMES, dtype=object)[feats["classes"][ep, ag]])
+    table["return"] = x @ weights
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruct returns and evaluate alternative reward functions")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--gamma", type=float, default=1.0, help="Discount per recorded step (1.0 = undiscounted)")
+    parser.add_argument("--grid", default=None, help='JSON file {"feature": [weights, ...]} (default: built-in grid)')
+    parser.add_argument("--batch-size", type=int, default=256, help="Episodes simulated per batch")
+    parser.add_argument("--returns", default=None, help="Optional CSV of reconstructed per-agent returns")
+    parser.add_argument("--output", "-o", default=None, help="Optional CSV of the reward grid evaluation")
+    parser.add_argument("--top", type=int, default=10, help="Reward functions to print")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+    enc = encode_episodes(episodes)
+
+    grid = None
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+    weights = reward_grid(grid)
+
+    feats = reward_features(enc, gamma=args.gamma, batch_size=args.batch_size)
+    returns = returns_table(enc, feats)
+    print("\n=== Reconstructed Returns (terminal reward) ===")
+    print(returns.groupby("class")["return"].agg(["count", "mean", "std"]).round(3).to_string())
+
+    table = evaluate_rewards(enc, feats, weights)
+    print(f"\n=== Reward Grid ({len(weights)} functions, most win-aligned first) ===")
+    sort_by = "win_alignment" if "win_alignment" in table.columns else "shaping_share"
+    print(table.sort_values(sort_by, ascending=False).head(args.top).round(4).to_string(index=False))
+
+    if args.returns:
+        returns.to_csv(args.returns, index=False)
+        print(f"\nSaved returns to {args.returns}")
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Saved reward grid to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Vectorised schema validation and repair for EpisodeRecorder JSON.
+
+The corpus is streamed in chunks and encoded with episode_arrays, so every
+action-level check is a NumPy operation over the whole chunk instead of a
+per-row loop. Checks:
+
+  episode level: missing fields, agentClasses dict/list format, agentIds /
+                 agentClassValues length mismatch, unknown winCondition,
+                 negative duration
+  action level:  unknown branch, branch not valid for the agent type (boss vs
+                 party), value outside the branch range, frames going
+                 backwards, agentId not listed in the episode, agent class vs
+                 id mismatch, class_selection conflicting with the recorded class
+
+With --repair, normalised episodes are written: agentIds/agentClassValues
+lists (no agentClasses), every acting agent listed, invalid rows dropped and
+actions ordered by frame, so downstream readers need no defensive code.
+They are written as an EpisodeRecorder folder (episode_<index>.json, index
+being the position in the validated corpus), which every loader reads.
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from episode_arrays import (BOSS_BRANCHES, BOSS_CLASS, CLASS_NAMES, NO_CLASS, PARTY_BRANCHES, SELECTABLE_CLASSES,
+                            UNKNOWN_CLASS, WIN_CONDITIONS, EncodedEpisodes, encode_episodes, get_agent_classes,
+                            is_boss, iter_episode_chunks)
+
+# Inclusive value ranges per branch (BranchSizes in SampleScene.unity: party 3,3,2,2,2,4 and boss 3,3,2,2,2).
+# class_selection is also recorded as -1 before an agent has chosen.
+BRANCH_RANGES = {
+    "movement": (0, 2),
+    "rotation": (0, 2),
+    "attack": (0, 1),
+    "heal": (0, 1),
+    "threat_boost": (0, 1),
+    "class_selection": (-1, 4),
+    "wall_pickup": (0, 1),
+    "wall_place": (0, 1),
+}
+
+REQUIRED_FIELDS = ["episode", "winCondition", "duration", "actions"]
+
+EPISODE_CHECKS = ["missing_fields", "agent_classes_dict", "agent_list_mismatch", "unknown_win_condition",
+                  "negative_duration"]
+ACTION_CHECKS = ["unknown_branch", "wrong_branch_for_agent", "value_out_of_range", "frame_not_monotonic",
+                 "unlisted_agent", "class_id_mismatch", "class_selection_conflict"]
+
+# Rows dropped by --repair (the other checks are fixed in place or only reported)
+DROP_CHECKS = ["unknown_branch", "wrong_branch_for_agent", "value_out_of_range"]
+
+
+def episode_level_checks(episodes: List[dict]) -> Dict[str, np.ndarray]:
+    """(E,) bool per episode-level check; these look at a handful of header fields only"""
+    num_episodes = len(episodes)
+    flags = {name: np.zeros(num_episodes, dtype=bool) for name in EPISODE_CHECKS}
+    for e, episode in enumerate(episodes):
+        flags["missing_fields"][e] = any(field not in episode for field in REQUIRED_FIELDS) or (
+            "agentIds" not in episode and "agentClasses" not in episode)
+        flags["agent_classes_dict"][e] = isinstance(episode.get("agentClasses"), dict)
+        flags["agent_list_mismatch"][e] = len(episode.get("agentIds", []) or []) != len(
+            episode.get("agentClassValues", []) or []) and "agentClasses" not in episode
+        flags["unknown_win_condition"][e] = episode.get("winCondition") not in WIN_CONDITIONS
+        flags["negative_duration"][e] = float(episode.get("duration", 0.0) or 0.0) < 0
+    return flags
+
+
+def action_level_checks(enc: EncodedEpisodes) -> Dict[str, np.ndarray]:
+    """(N,) bool per action-level check"""
+    branch_names = enc.branch_names
+    known = np.array([b in BRANCH_RANGES for b in branch_names], dtype=bool)
+    party_only = np.array([b in PARTY_BRANCHES and b not in BOSS_BRANCHES for b in branch_names], dtype=bool)
+    boss_only = np.array([b in BOSS_BRANCHES and b not in PARTY_BRANCHES for b in branch_names], dtype=bool)
+    low = np.array([BRANCH_RANGES.get(b, (0, 0))[0] for b in branch_names], dtype=np.int64)
+    high = np.array([BRANCH_RANGES.get(b, (0, 0))[1] for b in branch_names], dtype=np.int64)
+
+    ep, agent, branch = enc.action_episode, enc.action_agent, enc.action_branch
+    value = enc.action_value.astype(np.int64)
+    recorded = enc.agent_classes[ep, agent]
+    name_boss = np.array([is_boss(name) for name in enc.agent_names], dtype=bool)
+    boss = (recorded == BOSS_CLASS) | name_boss[agent]
+
+    # Frames must not decrease within an episode (rows are in recording order)
+    backwards = np.zeros(enc.num_actions, dtype=bool)
+    backwards[1:] = (np.diff(enc.action_frame) < 0) & (ep[1:] == ep[:-1])
+
+    # Recorded class names a boss for a party id, or a party class for a boss id
+    party_class = (recorded >= 0) & (recorded != BOSS_CLASS) & (recorded != NO_CLASS) & (recorded != UNKNOWN_CLASS)
+    mismatch = ((recorded == BOSS_CLASS) & ~name_boss[agent]) | (party_class & name_boss[agent])
+
+    # A valid class_selection that differs from an already recorded class
+    selection = branch == enc.branch_code("class_selection")
+    valid = selection & (value >= 0) & (value < len(SELECTABLE_CLASSES))
+    conflict = valid & party_class & (recorded != value + 1)
+
+    return {
+        "unknown_branch": ~known[branch],
+        "wrong_branch_for_agent": (boss & party_only[branch]) | (~boss & boss_only[branch]),
+        "value_out_of_range": known[branch] & ((value < low[branch]) | (value > high[branch])),
+        "frame_not_monotonic": backwards,
+        "unlisted_agent": recorded < 0,
+        "class_id_mismatch": mismatch,
+        "class_selection_conflict": conflict,
+    }
+
+
+def repair_chunk(episodes: List[dict], enc: EncodedEpisodes, action_flags: Dict[str, np.ndarray]) -> List[dict]:
+    """Normalised copies of a chunk of episodes"""
+    keep = ~np.logical_or.reduce([action_flags[name] for name in DROP_CHECKS])
+    # Stable sort by (episode, frame) restores frame order without reshuffling same-frame rows
+    rows = np.flatnonzero(keep)
+    rows = rows[np.lexsort((rows, enc.action_frame[rows], enc.action_episode[rows]))]
+    counts = np.bincount(enc.action_episode[rows], minlength=enc.num_episodes)
+    offsets = np.r_[0, np.cumsum(counts)]
+
+    frames = enc.action_frame[rows].tolist()
+    agents = enc.action_agent[rows].tolist()
+    branches = enc.action_branch[rows].tolist()
+    values = enc.action_value[rows].tolist()
+    targets = enc.action_target[rows].tolist()
+    acting = defaultdict(set)
+    for e, a in zip(enc.action_episode[rows].tolist(), agents):
+        acting[e].add(a)
+
+    repaired = []
+    for e, episode in enumerate(episodes):
+        agent_classes = {str(k): str(v) for k, v in get_agent_classes(episode).items()}
+        for a in sorted(acting[e]):
+            name = enc.agent_names[a]
+            if name not in agent_classes:
+                agent_classes[name] = "Boss" if is_boss(name) else CLASS_NAMES[NO_CLASS]
+
+        actions = []
+        for i in range(offsets[e], offsets[e + 1]):
+            action = {"frame": frames[i], "agentId": enc.agent_names[agents[i]],
+                      "branch": enc.branch_names[branches[i]], "value": values[i]}
+            if targets[i] >= 0:
+                action["targetId"] = enc.agent_names[targets[i]]
+            actions.append(action)
+
+        win = episode.get("winCondition")
+        repaired.append({
+            "episode": int(enc.episode_numbers[e]),
+            "winCondition": win if win in WIN_CONDITIONS else "unknown",
+            "duration": max(0.0, float(enc.durations[e])),
+            "agentIds": list(agent_classes.keys()),
+            "agentClassValues": list(agent_classes.values()),
+            "actions": actions,
+        })
+    return repaired
+
+
+def validate_corpus(path: str, chunk_size: int = 2000, repair_dir: Optional[str] = None,
+                    max_examples: int = 5) -> Dict:
+    """Validate (and optionally repair) every episode under path; returns the report dict"""
+    totals = {name: 0 for name in EPISODE_CHECKS + ACTION_CHECKS}
+    affected = {name: 0 for name in EPISODE_CHECKS + ACTION_CHECKS}
+    examples = defaultdict(list)
+    by_branch = defaultdict(lambda: defaultdict(int))
+    num_episodes = num_actions = num_bad = 0
+    repaired = []
+
+    if repair_dir:
+        os.makedirs(repair_dir, exist_ok=True)
+
+    for chunk in iter_episode_chunks(path, chunk_size):
+        enc = encode_episodes(chunk)
+        episode_flags = episode_level_checks(chunk)
+        action_flags = action_level_checks(enc)
+
+        bad = np.zeros(enc.num_episodes, dtype=bool)
+        for name, flags in episode_flags.items():
+            totals[name] += int(flags.sum())
+            affected[name] += int(flags.sum())
+            bad |= flags
+            for e in np.flatnonzero(flags)[:max_examples - len(examples[name])]:
+                examples[name].append(int(enc.episode_numbers[e]))
+
+        for name, flags in action_flags.items():
+            rows = np.flatnonzero(flags)
+            totals[name] += len(rows)
+            hit = np.unique(enc.action_episode[rows])
+            affected[name] += len(hit)
+            bad[hit] = True
+            for e in hit[:max_examples - len(examples[name])]:
+                examples[name].append(int(enc.episode_numbers[e]))
+            if len(rows):
+                counts = np.bincount(enc.action_branch[rows], minlength=len(enc.branch_names))
+                for b in np.flatnonzero(counts):
+                    by_branch[name][enc.branch_names[b]] += int(counts[b])
+
+        num_episodes += enc.num_episodes
+        num_actions += enc.num_actions
+        num_bad += int(bad.sum())
+
+        if repair_dir:
+            # Name by corpus position: recorded episode numbers restart per session and would collide
+            for episode in repair_chunk(chunk, enc, action_flags):
+                filepath = os.path.join(repair_dir, f"episode_{len(repaired)}.json")
+                with open(filepath, "w", encoding="utf-8") as f:
+                    json.dump(episode, f)
+                repaired.append(filepath)
+
+    return {
+        "episodes": num_episodes,
+        "actions": num_actions,
+        "episodes_with_violations": num_bad,
+        "violations": {name: {"count": totals[name], "episodes": affected[name],
+                              "examples": examples[name], "by_branch": dict(by_branch.get(name, {}))}
+                       for name in EPISODE_CHECKS + ACTION_CHECKS if totals[name]},
+        "repaired_files": repaired,
+    }
+
+
+def print_report(report: Dict):
+    print(f"\nValidated {report['episodes']} episodes, {report['actions']} actions: "
+          f"{report['episodes_with_violations']} episodes with violations")
+    if not report["violations"]:
+        print("No schema violations found")
+    for name, info in report["violations"].items():
+        unit = "episodes" if name in EPISODE_CHECKS else "rows"
+        print(f"  {name}: {info['count']} {unit} in {info['episodes']} episodes (e.g. episodes {info['examples']})")
+        for branch, count in sorted(info["by_branch"].items(), key=lambda x: -x[1]):
+            print(f"      {branch}: {count}")
+    if report["repaired_files"]:
+        print(f"\nWrote {len(report['repaired_files'])} repaired episode files to "
+              f"{os.path.dirname(report['repaired_files'][0])} (dropped rows: {', '.join(DROP_CHECKS)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate episode JSON schema and optionally write repaired episodes")
+    parser.add_argument("path", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Episodes encoded per chunk")
+    parser.add_argument("--repair", default=None, help="Write normalised episode_N.json files to this directory")
+    parser.add_argument("--output", "-o", default=None, help="Save the report as JSON")
+    args = parser.parse_args()
+
+    report = validate_corpus(args.path, args.chunk_size, args.repair)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Action n-gram and gapped sequence pattern mining.
+
+Finds short action sequences that distinguish outcomes, e.g.
+Tank:threat_boost -> MeleeDPS:attack bursts in party wins. Actions are
+turned into integer tokens (class x branch) and laid out as one flat array
+of sequences, either per agent or as the joint stream of the whole party.
+n-grams are counted with an exact polynomial rolling hash over the token
+array (one vectorised pass per n, for any n with len(vocabulary) ** n
+<= 2 ** 63), gapped pairs (a ... b within k events)
+with the same machinery, and each pattern gets support and lift per
+winCondition.
+"""
+
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from episode_arrays import (CLASS_NAMES, WIN_CONDITIONS, EncodedEpisodes, encode_episodes,
+                            load_episodes, resolve_classes)
+
+# Branches whose value==1 actions become tokens
+EVENT_BRANCHES = ["attack", "heal", "threat_boost"]
+
+
+def build_sequences(enc: EncodedEpisodes, mode: str = "joint", branches: Optional[List[str]] = None,
+                    collapse_runs: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """
+    Integer-encoded action sequences.
+
+    mode "joint": one sequence per episode with every agent's events in frame order.
+    mode "agent": one sequence per (episode, agent).
+    collapse_runs merges consecutive identical tokens (held attack keys record
+    the same action every step).
+
+    Returns (tokens (M,), sequence_id (M,), sequence_episode (S,), vocabulary)
+    where tokens are sorted by sequence.
+    """
+    branches = branches or EVENT_BRANCHES
+    codes = [enc.branch_code(b) for b in branches]
+    codes = np.array([c for c in codes if c >= 0], dtype=np.int64)
+    num_branches = len(enc.branch_names)
+    vocabulary = [f"{cls}:{branch}" for cls in CLASS_NAMES for branch in enc.branch_names]
+
+    classes = resolve_classes(enc)
+    rows = np.flatnonzero(np.isin(enc.action_branch, codes) & (enc.action_value == 1))
+    episode = enc.action_episode[rows].astype(np.int64)
+    agent = enc.action_agent[rows].astype(np.int64)
+    agent_class = np.maximum(classes[episode, agent], 0).astype(np.int64)
+    tokens = agent_class * num_branches + enc.action_branch[rows]
+
+    if mode == "agent":
+        sequence_key = episode * enc.num_agents + agent
+    elif mode == "joint":
+        sequence_key = episode
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    # Stable sort keeps recording order inside a sequence and frame
+    order = np.lexsort((enc.action_frame[rows], sequence_key))
+    tokens, sequence_key, episode = tokens[order], sequence_key[order], episode[order]
+
+    if collapse_runs and len(tokens):
+        keep = np.ones(len(tokens), dtype=bool)
+        keep[1:] = (tokens[1:] != tokens[:-1]) | (sequence_key[1:] != sequence_key[:-1])
+        tokens, sequence_key, episode = tokens[keep], sequence_key[keep], episode[keep]
+
+    _, first, sequence_id = np.unique(sequence_key, return_index=True, return_inverse=True)
+    return tokens, sequence_id, episode[first], vocabulary
+
+
+def ngram_hashes(tokens: np.ndarray, sequence_id: np.ndarray, n: int,
+                 base: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling polynomial hash of every n-gram that stays inside one sequence.
+    Exact (collision free) while base ** n <= 2 ** 63, base being the
+    vocabulary size; n beyond that raises ValueError.
+    Returns (hashes, start positions).
+    """
+    if base ** n > 2 ** 63:
+        raise ValueError(f"{n}-grams over a vocabulary of {base} tokens overflow int64 hashes "
+                         f"({base}^{n} > 2^63); use a smaller n")
+    count = len(tokens) - n + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    hashes = tokens[:count].astype(np.int64)
+    for j in range(1, n):
+        hashes = hashes * base + tokens[j:count + j]
+    start = np.arange(count)
+    valid = sequence_id[:count] == sequence_id[n - 1:]
+    return hashes[valid], start[valid]
+
+
+def decode_hash(value: int, n: int, base: int) -> List[int]:
+    """Tokens of an n-gram hash, first token first"""
+    tokens = []
+    for _ in range(n):
+        value, token = divmod(int(value), base)
+        tokens.append(token)
+    return tokens[::-1]
+
+
+def _pattern_table(keys: np.ndarray, key_episode: np.ndarray, win_conditions: np.ndarray,
+                   num_episodes: int) -> pd.DataFrame:
+    """Occurrences, support and per-winCondition support/lift for encoded patterns"""
+    patterns, occurrences = np.unique(keys, return_counts=True)
+    if len(patterns) == 0:
+        return pd.DataFrame(columns=["key", "occurrences", "episodes", "support"])
+
+    # Episode-level presence: dedupe (pattern, episode) pairs
+    pattern_index = np.searchsorted(patterns, keys)
+    pairs = np.unique(pattern_index * np.int64(num_episodes) + key_episode)
+    pair_pattern, pair_episode = pairs // num_episodes, pairs % num_episodes
+
+    episodes_with = np.bincount(pair_pattern, minlength=len(patterns))
+    table = {
+        "key": patterns,
+        "occurrences": occurrences,
+        "episodes": episodes_with,
+        "support": episodes_with / max(1, num_episodes),
+    }
+    for code, name in enumerate(WIN_CONDITIONS):
+        in_group = win_conditions == code
+        group_size = int(in_group.sum())
+        if group_size == 0:
+            continue
+        hits = np.bincount(pair_pattern[in_group[pair_episode]], minlength=len(patterns))
+        support = hits / group_size
+        table[f"support_{name}"] = support
+        table[f"lift_{name}"] = np.divide(support, table["support"], out=np.zeros(len(patterns)),
+                                          where=table["support"] > 0)
+    return pd.DataFrame(table)
+
+
+def mine_ngrams(enc: EncodedEpisodes, n_values=(2, 3), mode: str = "joint", min_support: float = 0.01,
+                collapse_runs: bool = True) -> pd.DataFrame:
+    """Frequent n-grams with support and lift per winCondition"""
+    tokens, sequence_id, sequence_episode, vocabulary = build_sequences(enc, mode=mode,
+                                                                         collapse_runs=collapse_runs)
+    base = len(vocabulary)
+    frames = []
+    for n in n_values:
+        hashes, start = ngram_hashes(tokens, sequence_id, n, base)
+        table = _pattern_table(hashes, sequence_episode[sequence_id[start]], enc.win_conditions,
+                               enc.num_episodes)
+        table = table[table["support"] >= min_support]
+        table.insert(0, "pattern", [" -> ".join(vocabulary[t] for t in decode_hash(k, n, base))
+                                    for k in table["key"]])
+        table.insert(1, "n", n)
+        frames.append(table.drop(columns="key"))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def mine_gapped_pairs(enc: EncodedEpisodes, max_gap: int = 5, mode: str = "joint",
+                      min_support: float = 0.01, collapse_runs: bool = True) -> pd.DataFrame:
+    """Gapped patterns "a ... b" where b follows a within max_gap events"""
+    tokens, sequence_id, sequence_episode, vocabulary = build_sequences(enc, mode=mode,
+                                                                         collapse_runs=collapse_runs)
+    base = len(vocabulary)
+    keys, key_episode = [], []
+    for gap in range(1, max_gap + 1):
+        if len(tokens) <= gap:
+            break
+        valid = sequence_id[:-gap] == sequence_id[gap:]
+        keys.append((tokens[:-gap] * base + tokens[gap:])[valid])
+        key_episode.append(sequence_episode[sequence_id[:-gap][valid]])
+    if not keys:
+        return pd.DataFrame()
+
+    table = _pattern_table(np.concatenate(keys), np.concatenate(key_episode), enc.win_conditions,
+                           enc.num_episodes)
+    table = table[table["support"] >= min_support]
+    table.insert(0, "pattern", [f"{vocabulary[k // base]} ... {vocabulary[k % base]}" for k in table["key"]])
+    table.insert(1, "max_gap", max_gap)
+    return table.drop(columns="key").reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine action n-grams that distinguish outcomes")
+    parser.add_argument("input", help="EpisodeData directory or episodes bundle JSON")
+    parser.add_argument("--mode", choices=["joint", "agent"], default="joint", help="Joint party stream or per-agent streams")
+    parser.add_argument("--n", type=int, nargs="+", default=[2, 3], help="n-gram lengths")
+    parser.add_argument("--max-gap", type=int, default=5, help="Largest gap for gapped pairs (0 to skip)")
+    parser.add_argument("--min-support", type=float, default=0.01, help="Minimum fraction of episodes containing a pattern")
+    parser.add_argument("--keep-runs", action="store_true", help="Do not collapse repeated identical actions")
+    parser.add_argument("--output", "-o", default=None, help="Optional CSV output")
+    parser.add_argument("--top", type=int, default=15, help="Patterns to print")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    if not episodes:
+        raise SystemExit(f"No episodes found in {args.input}")
+    print(f"Loaded {len(episodes)} episodes")
+    enc = encode_episodes(episodes)
+
+    collapse = not args.keep_runs
+    ngrams = mine_ngrams(enc, n_values=args.n, mode=args.mode, min_support=args.min_support, collapse_runs=collapse)
+    tables = [ngrams]
+    if args.max_gap > 0:
+        tables.append(mine_gapped_pairs(enc, max_gap=args.max_gap, mode=args.mode,
+                                        min_support=args.min_support, collapse_runs=collapse))
+    patterns = pd.concat(tables, ignore_index=True)
+
+    if "lift_party" in patterns.columns:
+        print("\n=== Patterns Most Associated with Party Wins ===")
+        top = patterns.sort_values(["lift_party", "support"], ascending=False).head(args.top)
+        print(top[["pattern", "support", "support_party", "lift_party"]].to_string(index=False))
+
+    if args.output:
+        patterns.to_csv(args.output, index=False)
+        print(f"\nSaved {len(patterns)} patterns to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Constant-memory, mergeable streaming summaries for very large runs.
+
+- KLLSketch: quantiles (duration, actions per episode). With k=200 the
+  normalised rank error is about 1.65% with 99% confidence, independent of n.
+- SpaceSaving: heavy hitters (joint step actions). Each reported count
+  over-estimates the true count by at most its error column, and that error
+  never exceeds n / capacity. Any item with true frequency > n / capacity is
+  guaranteed to be reported.
+- HyperLogLog: distinct counts (action patterns). Relative standard error
+  is 1.04 / sqrt(2 ** p), i.e. about 0.8% for p=14 (16 KB of registers).
+
+All three support merge(), so shards can be summarised in separate
+processes and combined; CorpusSketches bundles them for analyze_episodes.py
+--fast.
+"""
+
+import hashlib
+import math
+import random
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from episode_arrays import (CLASS_NAMES, WIN_CONDITIONS, EncodedEpisodes, encode_episodes, load_episode,
+                            mix64, resolve_classes)
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang, Liberty 2016)"""
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.compactors: List[np.ndarray] = [np.zeros(0)]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.zeros(0))
+                items = np.sort(items)
+                # An odd item stays behind; the rest halve with a random offset
+                keep = items[len(items) - 1:] if len(items) % 2 else items[:0]
+                items = items[:len(items) - len(keep)]
+                promoted = items[self._rng.randint(0, 1)::2]
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+            level += 1
+
+    def update(self, value: float):
+        self.update_many([value])
+
+    def update_many(self, values: Iterable[float]):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.n += len(values)
+        # Blocks of k keep compactions frequent enough for the error bound
+        # without one Python-level compress per value
+        for start in range(0, len(values), self.k):
+            self.compactors[0] = np.concatenate([self.compactors[0], values[start:start + self.k]])
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.zeros(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.n += other.n
+        self._compress()
+
+    def _weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2.0 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate value at quantile(s) q in [0, 1]"""
+        items, cumulative = self._weighted()
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        target = np.asarray(q) * cumulative[-1]
+        index = np.minimum(np.searchsorted(cumulative, target, side="left"), len(items) - 1)
+        return items[index] if np.ndim(q) else float(items[index])
+
+    def rank(self, value: float) -> float:
+        """Approximate fraction of values <= value"""
+        items, cumulative = self._weighted()
+        if len(items) == 0:
+            return float("nan")
+        i = np.searchsorted(items, value, side="right")
+        return float(cumulative[i - 1] / cumulative[-1]) if i > 0 else 0.0
+
+    def size(self) -> int:
+        """Items retained (memory footprint)"""
+        return sum(len(c) for c in self.compactors)
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters (Metwally et al. 2005) with mergeable summaries"""
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.n = 0
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+
+    def _floor(self) -> int:
+        """Count an unmonitored item may already have had"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def update(self, item: Hashable, weight: int = 1):
+        self.n += weight
+        if item in self.counts:
+            self.counts[item] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            return
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim)
+        self.counts[item] = floor + weight
+        self.errors[item] = floor
+
+    def update_counts(self, counts: Dict[Hashable, int]):
+        """Fold in exact counts of a batch (e.g. from np.unique) as one merge"""
+        batch = SpaceSaving(self.capacity)
+        batch.n = int(sum(counts.values()))
+        # Kept counts are exact; dropped items are bounded by the batch's smallest kept count
+        for item, count in Counter(counts).most_common(self.capacity):
+            batch.counts[item] = int(count)
+            batch.errors[item] = 0
+        self.merge(batch)
+
+    def merge(self, other: "SpaceSaving"):
+        floor_a, floor_b = self._floor(), other._floor()
+        counts, errors = {}, {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, floor_a) + other.counts.get(item, floor_b)
+            errors[item] = self.errors.get(item, floor_a) + other.errors.get(item, floor_b)
+        keep = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in keep}
+        self.errors = {item: errors[item] for item in keep}
+        self.n += other.n
+
+    def top(self, n: int = 10) -> List[Tuple[Hashable, int, int]]:
+        """(item, estimated count, max over-estimate), largest first"""
+        items = sorted(self.counts, key=self.counts.get, reverse=True)[:n]
+        return [(item, self.counts[item], self.errors[item]) for item in items]
+
+
+def hash64(values) -> np.ndarray:
+    """Stable uint64 hashes: integer arrays via mix64, anything else via blake2b of str()"""
+    array = np.asarray(values)
+    if array.dtype.kind in "iub":
+        return mix64(array.ravel())
+    return np.array([int.from_bytes(hashlib.blake2b(str(v).encode("utf-8"), digest_size=8).digest(), "little")
+                     for v in array.ravel()], dtype=np.uint64)
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Exact bit length of uint64 values (frexp on 32-bit halves is exact)"""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1]).astype(np.int64)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter (Flajolet et al. 2007) over 64-bit hashes"""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update_hashes(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if hashes.size == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        rho = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rho.astype(np.uint8))
+
+    def update(self, values):
+        self.update_hashes(hash64(values))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> float:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return float(estimate)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+# Event branches folded into joint step masks (bit = class * len + branch)
+EVENT_BRANCHES = ["attack", "heal", "threat_boost"]
+
+
+def joint_step_masks(enc: EncodedEpisodes) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Joint action of every step that has at least one event, as a bitmask of
+    (class, event branch) pairs. Returns (masks, step_episode) in episode/frame order.
+    """
+    codes = np.array([enc.branch_code(b) for b in EVENT_BRANCHES])
+    signal = np.full(enc.num_actions, -1)
+    for s, code in enumerate(codes):
+        if code >= 0:
+            signal[enc.action_branch == code] = s
+    rows = np.flatnonzero((signal >= 0) & (enc.action_value == 1))
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    classes = resolve_classes(enc)
+    episode = enc.action_episode[rows].astype(np.int64)
+    agent_class = np.maximum(classes[episode, enc.action_agent[rows]], 0).astype(np.int64)
+    bits = np.left_shift(1, agent_class * len(EVENT_BRANCHES) + signal[rows])
+
+    frame = enc.action_frame[rows]
+    order = np.lexsort((frame, episode))
+    episode, frame, bits = episode[order], frame[order], bits[order]
+    starts = np.flatnonzero(np.r_[True, (episode[1:] != episode[:-1]) | (frame[1:] != frame[:-1])])
+    return np.bitwise_or.reduceat(bits, starts), episode[starts]
+
+
+def describe_mask(mask: int) -> str:
+    """Readable label of a joint step mask, e.g. "Tank:attack + Healer:heal" """
+    parts = []
+    for bit in range(len(CLASS_NAMES) * len(EVENT_BRANCHES)):
+        if mask >> bit & 1:
+            cls, branch = divmod(bit, len(EVENT_BRANCHES))
+            parts.append(f"{CLASS_NAMES[cls]}:{EVENT_BRANCHES[branch]}")
+    return " + ".join(parts)
+
+
+class CorpusSketches:
+    """All summaries analyze_episodes.py --fast needs, mergeable across shards"""
+
+    def __init__(self, k: int = 200, capacity: int = 1000, p: int = 14, shingle_size: int = 3):
+        self.episodes = 0
+        self.win_conditions: Counter = Counter()
+        self.branch_counts: Counter = Counter()
+        self.duration = KLLSketch(k)
+        self.actions_per_episode = KLLSketch(k)
+        self.events_per_episode = KLLSketch(k)
+        self.joint_steps = SpaceSaving(capacity)
+        self.distinct_steps = HyperLogLog(p)
+        self.distinct_patterns = HyperLogLog(p)
+        self.shingle_size = shingle_size
+
+    def update(self, episodes: List[dict]):
+        """Fold a chunk of episode dicts into the sketches"""
+        if not episodes:
+            return
+        enc = encode_episodes(episodes)
+        self.episodes += enc.num_episodes
+        for code, n in zip(*np.unique(enc.win_conditions, return_counts=True)):
+            self.win_conditions[WIN_CONDITIONS[code] if code >= 0 else "unknown"] += int(n)
+        for code, n in zip(*np.unique(enc.action_branch, return_counts=True)):
+            self.branch_counts[enc.branch_names[code]] += int(n)
+
+        self.duration.update_many(enc.durations)
+        self.actions_per_episode.update_many(np.diff(enc.offsets))
+
+        masks, step_episode = joint_step_masks(enc)
+        self.events_per_episode.update_many(np.bincount(step_episode, minlength=enc.num_episodes))
+        unique, counts = np.unique(masks, return_counts=True)
+        self.joint_steps.update_counts(dict(zip(unique.tolist(), counts.tolist())))
+        self.distinct_steps.update_hashes(mix64(unique))
+
+        # k-step patterns of joint steps inside one episode
+        k = self.shingle_size
+        if len(masks) >= k:
+            count = len(masks) - k + 1
+            pattern = mix64(masks[:count])
+            for j in range(1, k):
+                pattern = mix64(pattern ^ masks[j:count + j].astype(np.uint64))
+            valid = step_episode[:count] == step_episode[k - 1:]
+            self.distinct_patterns.update_hashes(pattern[valid])
+
+    def merge(self, other: "CorpusSketches"):
+        self.episodes += other.episodes
+        self.win_conditions.update(other.win_conditions)
+        self.branch_counts.update(other.branch_counts)
+        self.duration.merge(other.duration)
+        self.actions_per_episode.merge(other.actions_per_episode)
+        self.events_per_episode.merge(other.events_per_episode)
+        self.joint_steps.merge(other.joint_steps)
+        self.distinct_steps.merge(other.distinct_steps)
+        self.distinct_patterns.merge(other.distinct_patterns)
+
+
+def sketch_files(filepaths: List[str], chunk_size: int = 500, **kwargs) -> CorpusSketches:
+    """Sketch a shard of episode files (runs in worker processes)"""
+    sketches = CorpusSketches(**kwargs)
+    chunk = []
+    for filepath in filepaths:
+        try:
+            chunk.append(load_episode(filepath))
+        except Exception as e:
+            print(f"Error loading {filepath}: {e}")
+        if len(chunk) >= chunk_size:
+            sketches.update(chunk)
+            chunk = []
+    sketches.update(chunk)
+    return sketches
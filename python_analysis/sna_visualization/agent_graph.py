@@ -0,0 +1,356 @@
+"""
+Agent-level SNA that keeps agent identities.
+
+The role-level extractors collapse every agent onto five roles via
+ROLE_MAP. That hides per-agent behaviour, and it mixes agents from parallel
+training arenas. Here every agent id stays a node.
+
+Ids are split into an arena prefix and a local name at the last separator
+("Arena 07/Party Member 1" -> arena "Arena 07", local "Party Member 1"; ids
+without a separator belong to arena ""). Each arena's actions are turned
+into a small dense-indexed tensor, in parallel across arenas. Arena jobs
+are built lazily and hold only that arena's agents and the episodes it
+occurs in, with a bounded number in flight. The results
+are stacked block-diagonally into one sparse agent x agent SNATensor, so
+memory grows with interactions, not with agents squared.
+
+Episodes with targetIds use the targeted rules of interaction_tensor.
+Episodes without them (EpisodeRecorder does not write targetId) use the
+placeholder rules that episode_sna and aggregate_episodes_sna use: boss
+attacks go to every party member of the arena, party attacks to the
+arena's boss, heals and threat boosts to per-arena "Heals" / "Threat"
+nodes ("Arena 07/Heals"). The agent tensor's layers are AGENT_LAYERS,
+LAYERS followed by the placeholder layers not already in it.
+
+Role-level graphs come from AgentGraph.role_tensor(), a group-by of the
+agent tensor's node codes. Roles come from ROLE_MAP on the local name,
+then the agent's most frequent recorded class, then the local name itself.
+
+Usage:
+    python agent_graph.py --input episodes.json --windows 5 --workers 4 --output agent_edges.csv
+    python agent_graph.py --input episodes.json --windows 5 --communities agent_communities.csv
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from communities import window_communities
+from sna_tensor import (LAYERS, PLACEHOLDER_LAYERS, PLACEHOLDER_NODES, ROLE_MAP, SNATensor, interaction_tensor,
+                        targeted_episodes)
+
+# episode_arrays lives one directory up (python_analysis/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from episode_arrays import (BOSS_CLASS, CLASS_NAMES, EncodedEpisodes, load_episodes, encode_episodes,  # noqa: E402
+                            is_boss, resolve_classes, window_index)
+
+ARENA_SEPARATOR = "/"
+
+# Targeted layers, then the placeholder layers (placeholder "threat" shares the targeted threat layer)
+AGENT_LAYERS = LAYERS + [name for name in PLACEHOLDER_LAYERS if name not in LAYERS]
+
+
+def split_arena(agent_id: str, separator: str = ARENA_SEPARATOR) -> Tuple[str, str]:
+    """(arena, local name) of an agent id; arena is "" when there is no prefix"""
+    arena, _, local = str(agent_id).rpartition(separator)
+    return arena, local
+
+
+def agent_role_names(enc: EncodedEpisodes, separator: str = ARENA_SEPARATOR,
+                     role_map: Optional[Dict[str, str]] = None) -> List[str]:
+    """Role of every encoded agent: role_map on the local name, else its most frequent class, else the local name"""
+    role_map = ROLE_MAP if role_map is None else role_map
+    classes = resolve_classes(enc)
+    roles = []
+    for a, name in enumerate(enc.agent_names):
+        local = split_arena(name, separator)[1]
+        if local in role_map:
+            roles.append(role_map[local])
+            continue
+        counts = np.bincount(classes[:, a][classes[:, a] >= 0], minlength=len(CLASS_NAMES))
+        counts[[CLASS_NAMES.index("None"), CLASS_NAMES.index("Unknown")]] = 0
+        if is_boss(local) or counts[BOSS_CLASS] > 0:
+            roles.append("Boss")
+        elif counts.any():
+            roles.append(CLASS_NAMES[int(counts.argmax())])
+        else:
+            roles.append(local)
+    return roles
+
+
+def _arena_actions(enc: EncodedEpisodes, rows: np.ndarray, agents: np.ndarray) -> Tuple[EncodedEpisodes, np.ndarray]:
+    """
+    Corpus restricted to the given action rows (kept in recording order),
+    the episodes they occur in and the given agents (renumbered in order).
+    Returns (sub corpus, original index of each kept episode).
+    """
+    episodes, action_episode = np.unique(enc.action_episode[rows], return_inverse=True)
+    action_episode = action_episode.ravel()
+    offsets = np.zeros(len(episodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(action_episode, minlength=len(episodes)), out=offsets[1:])
+    local = np.full(enc.num_agents, -1, dtype=np.int64)
+    local[agents] = np.arange(len(agents))
+    sub = EncodedEpisodes(
+        episode_numbers=enc.episode_numbers[episodes], win_conditions=enc.win_conditions[episodes],
+        durations=enc.durations[episodes], agent_classes=enc.agent_classes[np.ix_(episodes, agents)],
+        offsets=offsets, action_episode=action_episode.astype(enc.action_episode.dtype),
+        action_frame=enc.action_frame[rows], action_agent=local[enc.action_agent[rows]].astype(enc.action_agent.dtype),
+        action_branch=enc.action_branch[rows], action_value=enc.action_value[rows],
+        action_target=np.where(enc.action_target[rows] >= 0, local[enc.action_target[rows]], -1)
+        .astype(enc.action_target.dtype),
+        agent_names=[enc.agent_names[a] for a in agents], branch_names=enc.branch_names)
+    return sub, episodes
+
+
+def _arena_tensor(args) -> SNATensor:
+    """
+    Tensor of one arena over its own agents, plus prefix + PLACEHOLDER_NODES
+    when it has untargeted episodes (runs in a worker process). A placeholder
+    whose prefixed name is one of the arena's agents maps onto that agent.
+    Layers are AGENT_LAYERS.
+    """
+    sub, roles, targeted_window, fallback_window, num_windows, prefix = args
+    node_of_agent = np.arange(sub.num_agents)
+    nodes = list(sub.agent_names)
+    parts = [(interaction_tensor(sub, node_of_agent, nodes, targeted_window, num_windows, infer_taunt=False,
+                                 agent_role_names=roles), LAYERS)]
+    node_map = np.arange(len(nodes))
+    if (fallback_window >= 0).any():
+        # The rules look placeholders up by their plain names
+        rule_nodes = nodes + list(PLACEHOLDER_NODES)
+        parts.append((interaction_tensor(sub, node_of_agent, rule_nodes, fallback_window, num_windows,
+                                         agent_role_names=roles, rules="placeholder"), PLACEHOLDER_LAYERS))
+        index = {name: n for n, name in enumerate(nodes)}
+        extra = []
+        for name in PLACEHOLDER_NODES:
+            full = prefix + name
+            if full not in index:
+                index[full] = len(nodes) + len(extra)
+                extra.append(full)
+            node_map = np.append(node_map, index[full])
+        nodes += extra
+
+    columns = []
+    for tensor, layers in parts:
+        layer, src, tgt, window = tensor.coords()
+        code = np.array([AGENT_LAYERS.index(name) for name in layers], dtype=np.int64)
+        columns.append((code[layer], node_map[src], node_map[tgt], window, tensor.values))
+    layer, src, tgt, window, values = (np.concatenate(column) for column in zip(*columns))
+    return SNATensor.from_coo(layer, src, tgt, window, values, nodes, num_windows, AGENT_LAYERS)
+
+
+def _bounded_map(pool: ProcessPoolExecutor, fn, jobs: Iterator, in_flight: int) -> Iterator:
+    """pool.map that pulls jobs lazily, keeping at most in_flight submitted (results in order)"""
+    pending = deque()
+    for job in jobs:
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+        pending.append(pool.submit(fn, job))
+    while pending:
+        yield pending.popleft().result()
+
+
+@dataclass
+class AgentGraph:
+    """Agent-level tensor plus the arena and role of every node"""
+    tensor: SNATensor          # nodes are agent ids, grouped by arena
+    arena_of_node: np.ndarray  # (N,) int into arenas
+    arenas: List[str]
+    role_of_node: np.ndarray   # (N,) int into roles
+    roles: List[str]
+
+    @property
+    def nodes(self) -> List[str]:
+        return self.tensor.nodes
+
+    def role_tensor(self) -> SNATensor:
+        """Role-level tensor by group-by of the node codes (sums over agents and arenas)"""
+        layer, src, tgt, window = self.tensor.coords()
+        return SNATensor.from_coo(layer, self.role_of_node[src], self.role_of_node[tgt], window, self.tensor.values,
+                                  self.roles, self.tensor.num_windows, self.tensor.layers)
+
+    def arena_tensor(self, arena: str) -> SNATensor:
+        """Tensor restricted to one arena's agents (nodes renumbered)"""
+        members = np.flatnonzero(self.arena_of_node == self.arenas.index(arena))
+        local = np.full(len(self.nodes), -1, dtype=np.int64)
+        local[members] = np.arange(len(members))
+        layer, src, tgt, window = self.tensor.coords()
+        keep = (local[src] >= 0) & (local[tgt] >= 0)
+        return SNATensor.from_coo(layer[keep], local[src[keep]], local[tgt[keep]], window[keep],
+                                  self.tensor.values[keep], [self.nodes[m] for m in members],
+                                  self.tensor.num_windows, self.tensor.layers)
+
+    def to_networkx(self, layers=None, windows=None) -> nx.DiGraph:
+        """Agent DiGraph with arena and role node attributes"""
+        G = self.tensor.to_networkx(layers, windows)
+        for n, name in enumerate(self.nodes):
+            if name in G:
+                G.nodes[name]["arena"] = self.arenas[self.arena_of_node[n]]
+                G.nodes[name]["role"] = self.roles[self.role_of_node[n]]
+        return G
+
+    def edge_table(self) -> pd.DataFrame:
+        """One row per (arena, source, target, layer, window) with its weight"""
+        layer, src, tgt, window = self.tensor.coords()
+        names = np.array(self.nodes, dtype=object)
+        return pd.DataFrame({
+            "arena": np.array(self.arenas, dtype=object)[self.arena_of_node[src]],
+            "source": names[src],
+            "target": names[tgt],
+            "source_role": np.array(self.roles, dtype=object)[self.role_of_node[src]],
+            "target_role": np.array(self.roles, dtype=object)[self.role_of_node[tgt]],
+            "layer": np.array(self.tensor.layers, dtype=object)[layer],
+            "window": window,
+            "weight": self.tensor.values,
+        })
+
+    def community_table(self, **kwargs) -> pd.DataFrame:
+        """One row per (agent, window) with its community; labels are matched across windows"""
+        graphs = {w: self.to_networkx(windows=[w]) for w in range(self.tensor.num_windows)}
+        labels = window_communities(graphs, **kwargs)
+        arena = {name: self.arenas[a] for name, a in zip(self.nodes, self.arena_of_node)}
+        role = {name: self.roles[r] for name, r in zip(self.nodes, self.role_of_node)}
+        return pd.DataFrame([{"agent": n, "arena": arena[n], "role": role[n], "window": w, "community": c}
+                             for w, window_labels in labels.items() for n, c in window_labels.items()])
+
+
+def agent_graph(enc: EncodedEpisodes, episode_window: Optional[np.ndarray] = None, num_windows: int = 1,
+                separator: str = ARENA_SEPARATOR, role_map: Optional[Dict[str, str]] = None,
+                infer_taunt: bool = True, workers: int = 1) -> AgentGraph:
+    """
+    Agent-level damage/healing/threat/taunt tensor, built per arena.
+
+    Episodes with targetIds use the targeted rules; actions whose source and
+    target sit in different arenas are dropped. Episodes without targetIds
+    use the placeholder rules inside each arena (layers are AGENT_LAYERS).
+    With infer_taunt, an empty taunt layer (across all arenas) is filled with
+    half of the Tank -> Boss party damage, as in interaction_tensor.
+    """
+    if episode_window is None:
+        episode_window = np.zeros(enc.num_episodes, dtype=np.int64)
+    episode_window = np.asarray(episode_window, dtype=np.int64)
+    targeted = targeted_episodes(enc)
+    targeted_window = np.where(targeted, episode_window, -1)
+    fallback_window = np.where(targeted, -1, episode_window)
+
+    arenas, arena_of_agent = np.unique([split_arena(name, separator)[0] for name in enc.agent_names],
+                                       return_inverse=True)
+    arenas, arena_of_agent = [str(a) for a in arenas], arena_of_agent.ravel().astype(np.int64)
+    roles_of_agent = agent_role_names(enc, separator, role_map)
+    agent_order = np.argsort(arena_of_agent, kind="stable")
+    agent_bounds = np.searchsorted(arena_of_agent[agent_order], np.arange(len(arenas) + 1))
+
+    # One job per arena: its agents, the targeted rows that stay inside it and its untargeted rows
+    src_arena = arena_of_agent[enc.action_agent]
+    has_target = enc.action_target >= 0
+    tgt_arena = np.where(has_target, arena_of_agent[np.maximum(enc.action_target, 0)], -1)
+    inside = has_target & (targeted_window[enc.action_episode] >= 0) & (src_arena == tgt_arena)
+    inside |= fallback_window[enc.action_episode] >= 0
+    order = np.argsort(src_arena[inside], kind="stable")
+    rows = np.flatnonzero(inside)[order]
+    bounds = np.searchsorted(src_arena[rows], np.arange(len(arenas) + 1))
+
+    def arena_agents(k):
+        return agent_order[agent_bounds[k]:agent_bounds[k + 1]]
+
+    def jobs():
+        for k in range(len(arenas)):
+            agents = arena_agents(k)
+            sub, episodes = _arena_actions(enc, rows[bounds[k]:bounds[k + 1]], agents)
+            yield (sub, [roles_of_agent[a] for a in agents], targeted_window[episodes], fallback_window[episodes],
+                   num_windows, f"{arenas[k]}{separator}" if arenas[k] else "")
+
+    if workers > 1 and len(arenas) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tensors = list(_bounded_map(pool, _arena_tensor, jobs(), 2 * workers))
+    else:
+        tensors = [_arena_tensor(job) for job in jobs()]
+
+    # Stack arenas block-diagonally: node offset per arena; placeholder nodes take their local name as role
+    nodes, node_roles, arena_of_node, parts = [], [], [], []
+    for k, tensor in enumerate(tensors):
+        layer, src, tgt, window = tensor.coords()
+        parts.append((layer, src + len(nodes), tgt + len(nodes), window, tensor.values))
+        agents = arena_agents(k)
+        nodes.extend(tensor.nodes)
+        node_roles.extend(roles_of_agent[a] for a in agents)
+        node_roles.extend(split_arena(n, separator)[1] for n in tensor.nodes[len(agents):])
+        arena_of_node.extend([k] * len(tensor.nodes))
+    layer, src, tgt, window, values = (np.concatenate(column) for column in zip(*parts))
+
+    roles = list(dict.fromkeys(node_roles))
+    role_of_node = np.array([roles.index(r) for r in node_roles], dtype=np.int64)
+
+    taunt, party_damage = LAYERS.index("taunt"), LAYERS.index("party_damage")
+    if infer_taunt and not (layer == taunt).any():
+        role = np.array(node_roles, dtype=object)
+        tank = np.flatnonzero((layer == party_damage) & (role[src] == "Tank") & (role[tgt] == "Boss"))
+        layer = np.concatenate([layer, np.full(len(tank), taunt)])
+        src, tgt, window = np.concatenate([src, src[tank]]), np.concatenate([tgt, tgt[tank]]), np.concatenate([window, window[tank]])
+        values = np.concatenate([values, 0.5 * values[tank]])
+
+    tensor = SNATensor.from_coo(layer, src, tgt, window, values, nodes, num_windows, AGENT_LAYERS)
+    return AgentGraph(tensor, np.array(arena_of_node, dtype=np.int64), arenas, role_of_node, roles)
+
+
+def print_agent_summary(graph: AgentGraph, top: int = 10):
+    table = graph.edge_table()
+    print(f"\nAgents: {len(graph.nodes)} in {len(graph.arenas)} arena(s), "
+          f"{len(table)} (edge, layer, window) entries")
+    if table.empty:
+        return
+    per_arena = table.groupby("arena")["weight"].sum().sort_values(ascending=False)
+    print("\nInteraction weight per arena:")
+    for arena, weight in per_arena.head(top).items():
+        print(f"  {arena or '(no prefix)':<20} {weight:>10.1f}")
+    print("\nRole-level totals (group-by of the agent graph):")
+    role_table = table.groupby(["source_role", "target_role", "layer"])["weight"].sum()
+    for (src, tgt, layer), weight in role_table.sort_values(ascending=False).head(top).items():
+        print(f"  {src:>10} -> {tgt:<10} {layer:<13} {weight:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent-level SNA edges, partitioned by arena prefix")
+    parser.add_argument("--input", "-i", required=True, help="Episode directory or bundle JSON")
+    parser.add_argument("--output", "-o", default="agent_edges.csv", help="Output CSV edge list")
+    parser.add_argument("--windows", "-w", type=int, default=1, help="Number of training windows")
+    parser.add_argument("--separator", default=ARENA_SEPARATOR, help="Separator between arena prefix and agent name")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (one arena per task)")
+    parser.add_argument("--graphml", default=None, help="Also write the agent graph (all windows) as GraphML")
+    parser.add_argument("--communities", default=None, help="Also write per-window agent communities as CSV")
+    args = parser.parse_args()
+
+    episodes = load_episodes(args.input)
+    enc = encode_episodes(episodes)
+    print(f"Loaded {enc.num_episodes} episodes, {enc.num_agents} agents")
+    untargeted = enc.num_episodes - int(targeted_episodes(enc).sum())
+    if untargeted:
+        print(f"{untargeted} episodes without targetIds use the placeholder rules (as in episode_sna.py)")
+    graph = agent_graph(enc, window_index(enc.num_episodes, args.windows), args.windows,
+                        separator=args.separator, workers=args.workers)
+    print_agent_summary(graph)
+
+    graph.edge_table().to_csv(args.output, index=False)
+    print(f"\nSaved agent edge list: {args.output}")
+    if args.graphml:
+        G = graph.to_networkx()
+        for _, _, data in G.edges(data=True):
+            data["layers"] = ",".join(f"{k}={v:g}" for k, v in data["layers"].items())
+        nx.write_graphml(G, args.graphml)
+        print(f"Saved agent graph: {args.graphml}")
+    if args.communities:
+        communities = graph.community_table()
+        communities.to_csv(args.communities, index=False)
+        print(f"Saved {communities['community'].nunique()} communities: {args.communities}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,13 +6,22 @@ Shows frequency, linkages, and how coordination develops over time.
 import argparse
 import json
 import os
-from collections import defaultdict
 from typing import Dict, List, Tuple
 
 import networkx as nx
 import plotly.graph_objects as go
 import numpy as np
 
+from centrality import compute_centrality
+from edge_geometry import grouped_edge_paths
+from edge_occurrences import EpisodeOccurrences
+from layout_cache import cached_layout
+from sna_tensor import PLACEHOLDER_LAYERS, agent_nodes, encode_interactions, interaction_tensor
+from temporal_graph import TemporalGraph
+from webgl_render import RENDER_MODES, EdgeLOD, add_edge_trace, scatter_class, use_webgl, write_html
+
+EDGE_TYPES = PLACEHOLDER_LAYERS
+
 def load_episodes(path: str) -> List[dict]:
     """Load episodes from JSON file"""
     with open(path, "r", encoding="utf-8") as f:
@@ -25,103 +34,79 @@ def load_episodes(path: str) -> List[dict]:
     else:
         return [data]
 
-def aggregate_actions_from_episodes(episodes: List[dict]) -> Tuple[List[Tuple[str, str, float, str, int]], Dict[int, float]]:
+def aggregate_temporal_graph(episodes: List[dict]) -> Tuple[TemporalGraph, Dict[int, float]]:
+    """
+    Per-episode edge weights of the aggregate network as a TemporalGraph
+    (layers damage/heal/threat), so any episode range can be sliced without
+    re-reading actions. Edges come from the sparse SNA tensor's placeholder
+    rules with one window per episode; boss attacks are split over the party
+    in the weights and counted once per party member in the counts.
+    Returns: (temporal_graph, episode_weights)
+    """
+    episode_weights = {episode.get("episode", 0): episode.get("learningProgress", 0.0) for episode in episodes}
+    episode_numbers = [episode.get("episode", 0) for episode in episodes]
+
+    enc = encode_interactions(episodes)
+    node_of_agent, nodes, roles = agent_nodes(enc)
+    per_episode = np.arange(enc.num_episodes)
+    weights, counts = (interaction_tensor(enc, node_of_agent, nodes, per_episode, enc.num_episodes,
+                                          agent_role_names=roles, rules="placeholder", spread_boss_attacks=spread)
+                       for spread in (True, False))
+    temporal = TemporalGraph.from_tensor(weights, episode_numbers, count_tensor=counts)
+    return temporal, episode_weights
+
+def aggregate_actions_from_episodes(episodes: List[dict]) -> Tuple[List[Tuple[str, str, float, str, int, EpisodeOccurrences]], Dict[int, float]]:
     """
     Aggregate actions from all episodes.
     Returns: (edge_list, episode_weights)
-    edge_list: (source, target, weight, edge_type, first_seen_episode)
+    edge_list: (source, target, weight, edge_type, first_seen_episode, occurrences)
+    occurrences: EpisodeOccurrences with the episodes (and action counts) the edge appeared in
     episode_weights: {episode_num: learning_progress}
     """
-    edges = defaultdict(lambda: defaultdict(lambda: {"weight": 0.0, "first_seen": None, "episodes": []}))
-    episode_weights = {}
-    
-    agent_classes = {}
-    if episodes and "agentIds" in episodes[0] and "agentClassValues" in episodes[0]:
-        for a_id, a_cls in zip(episodes[0]["agentIds"], episodes[0]["agentClassValues"]):
-            agent_classes[a_id] = a_cls
-    
-    boss_ids = {aid for aid, cls in agent_classes.items() if str(cls).lower() == "boss"}
-    boss_id = next(iter(boss_ids), "Boss")
-    party_members = [aid for aid in agent_classes.keys() if aid not in boss_ids]
-    
-    for episode in episodes:
-        episode_num = episode.get("episode", 0)
-        learning_progress = episode.get("learningProgress", 0.0)
-        episode_weights[episode_num] = learning_progress
-        
-        actions = episode.get("actions", [])
-        
-        for act in actions:
-            branch = act.get("branch")
-            val = act.get("value", 0)
-            agent = act.get("agentId", "unknown")
-            
-            if branch == "attack" and val == 1:
-                if agent in boss_ids or agent.lower() == "boss":
-                    # Boss attacks party members - create individual edges to each party member
-                    # This shows which party members the boss targets most
-                    for pm in party_members:
-                        if edges[agent][pm]["first_seen"] is None:
-                            edges[agent][pm]["first_seen"] = episode_num
-                        # Distribute boss attacks, but weight by episode (later episodes = more coordinated)
-                        weight = 1.0 / len(party_members) if party_members else 1.0
-                        edges[agent][pm]["weight"] += weight
-                        edges[agent][pm]["episodes"].append(episode_num)
-                else:
-                    # Party member attacks boss - individual edges show DPS contribution
-                    tgt = boss_id
-                    if edges[agent][tgt]["first_seen"] is None:
-                        edges[agent][tgt]["first_seen"] = episode_num
-                    edges[agent][tgt]["weight"] += 1.0
-                    edges[agent][tgt]["episodes"].append(episode_num)
-            
-            elif branch == "threat_boost" and val == 1:
-                tgt = "Threat"
-                if edges[agent][tgt]["first_seen"] is None:
-                    edges[agent][tgt]["first_seen"] = episode_num
-                edges[agent][tgt]["weight"] += 1.0
-                edges[agent][tgt]["episodes"].append(episode_num)
-            
-            elif branch == "heal" and val == 1:
-                tgt = "Heals"
-                if edges[agent][tgt]["first_seen"] is None:
-                    edges[agent][tgt]["first_seen"] = episode_num
-                edges[agent][tgt]["weight"] += 1.0
-                edges[agent][tgt]["episodes"].append(episode_num)
-    
-    # Convert to edge list
+    temporal, episode_weights = aggregate_temporal_graph(episodes)
+    return temporal_edge_list(temporal), episode_weights
+
+def temporal_edge_list(temporal: TemporalGraph, start: int = 0, end: int = None) -> List[Tuple]:
+    """Aggregate edge list for an episode index range, read from the temporal graph"""
+    weights = temporal.range_weights(start, end)
+    occurrences = temporal.all_occurrences()
     edge_list = []
-    for src, tgts in edges.items():
-        for tgt, data in tgts.items():
-            edge_type = "heal" if tgt == "Heals" else "damage"
-            if tgt == "Threat":
-                edge_type = "threat"
-            edge_list.append((
-                src, tgt, data["weight"], edge_type, 
-                data["first_seen"], data["episodes"]
-            ))
+    for k, (src, tgt, edge_type) in enumerate(temporal.edge_names()):
+        if weights[k] == 0:
+            continue
+        occ = occurrences[k]
+        if start > 0 or end is not None:
+            numbers = temporal.episode_numbers[start:None if end is None else end + 1]
+            kept = np.isin(occ.episodes(), numbers)
+            occ = EpisodeOccurrences.from_arrays(occ.episodes()[kept], occ.counts[kept].astype(np.int64))
+        edge_list.append((src, tgt, float(weights[k]), edge_type, occ.first_seen, occ))
     
-    return edge_list, episode_weights
+    return edge_list
 
 def build_aggregate_graph(edge_list: List[Tuple]) -> nx.DiGraph:
     """Build NetworkX graph from aggregated edges"""
     G = nx.DiGraph()
     
-    for src, tgt, weight, ev_type, first_seen, episodes in edge_list:
+    for src, tgt, weight, ev_type, first_seen, occurrences in edge_list:
         if G.has_edge(src, tgt):
-            G[src][tgt]["weight"] += weight
-            G[src][tgt]["episodes"].extend(episodes)
-            if first_seen is not None and (G[src][tgt].get("first_seen") is None or first_seen < G[src][tgt]["first_seen"]):
-                G[src][tgt]["first_seen"] = first_seen
+            data = G[src][tgt]
+            data["weight"] += weight
+            data["occurrences"] = data["occurrences"].merge(occurrences)
+            data["first_seen"] = data["occurrences"].first_seen
+            data["last_seen"] = data["occurrences"].last_seen
         else:
-            G.add_edge(src, tgt, weight=weight, ev_type=ev_type, 
-                      first_seen=first_seen, episodes=episodes.copy())
+            G.add_edge(src, tgt, weight=weight, ev_type=ev_type, first_seen=first_seen,
+                       last_seen=occurrences.last_seen, occurrences=occurrences)
     
     return G
 
 def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float], 
-                                output_path: str, title: str):
-    """Create sophisticated visualization of aggregated network"""
+                                output_path: str, title: str, early_end: int = 500, late_start: int = 2000,
+                                betweenness_k="auto", render: str = "auto", use_layout_cache: bool = True):
+    """
+    Create sophisticated visualization of aggregated network.
+    Edges first seen before early_end count as early, after late_start as learned.
+    """
     
     # Compute metrics
     out_strength = {n: sum(d["weight"] for _, _, d in G.out_edges(n, data=True)) for n in G.nodes()}
@@ -134,19 +119,18 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
         first_seen = data.get("first_seen", 0)
         edge_formation[(u, v)] = first_seen
     
-    # Centrality metrics
-    try:
-        degree_centrality = nx.degree_centrality(G.to_undirected())
-        betweenness = nx.betweenness_centrality(G.to_undirected())
-    except:
-        degree_centrality = {n: 0.0 for n in G.nodes()}
-        betweenness = {n: 0.0 for n in G.nodes()}
+    # Centrality metrics (shared with episode_sna through the centrality cache)
+    centrality = compute_centrality(G, k=betweenness_k, closeness=False)
+    degree_centrality = centrality["degree"]
+    betweenness = centrality["betweenness"]
     
     # Layout
     try:
-        pos = nx.kamada_kawai_layout(G.to_undirected())
+        pos = cached_layout(G.to_undirected(), "kamada_kawai", kind="aggregate_episodes_sna",
+                            use_cache=use_layout_cache)
     except:
-        pos = nx.spring_layout(G, k=3, iterations=100, seed=42)
+        pos = cached_layout(G, "spring", k=3, iterations=100, seed=42, kind="aggregate_episodes_sna",
+                            use_cache=use_layout_cache)
     
     # Normalize positions
     if pos:
@@ -176,63 +160,32 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
     
     fig = go.Figure()
     
-    # Group edges by type and formation time
-    edge_traces = {"damage": [], "heal": [], "threat": []}
-    
-    for u, v, data in G.edges(data=True):
-        x0, y0 = pos[u]
-        x1, y1 = pos[v]
-        w = data.get("weight", 1.0)
-        ev_type = data.get("ev_type", "damage")
-        first_seen = data.get("first_seen", max_episode)
-        
-        # Normalize first_seen to 0-1 (0 = early, 1 = late)
-        formation_time = first_seen / max_episode if max_episode > 0 else 0.5
-        
-        # Curved edge
-        mid_x, mid_y = (x0 + x1) / 2, (y0 + y1) / 2
-        dx, dy = x1 - x0, y1 - y0
-        perp_x, perp_y = -dy * 0.3, dx * 0.3
-        curve_x = mid_x + perp_x
-        curve_y = mid_y + perp_y
-        
-        edge_traces[ev_type].append((x0, y0, curve_x, curve_y, x1, y1, w, formation_time))
+    # Curved edge paths (quadratic Bezier), one NaN-separated array per edge type
+    edge_paths = grouped_edge_paths(G, pos, curvature=0.3, num_points=20)
+    webgl = use_webgl(G.number_of_edges(), render)
+    lod = EdgeLOD()
     
     # Add edges with color intensity based on formation time
-    for ev_type, edges in edge_traces.items():
-        if not edges:
+    for ev_type in ["damage", "heal", "threat"]:
+        if ev_type not in edge_paths:
             continue
+        paths = edge_paths[ev_type]
+        edges = paths["edges"]
         
-        x_edges = []
-        y_edges = []
-        edge_hover = []
-        edge_colors = []
+        # The trace takes the formation colour of the group's last edge:
+        # early (random phase) = purple, learning = blue, learned = type colour
+        first_seen = edges[-1][2].get("first_seen", max_episode)
+        form_time = first_seen / max_episode if max_episode > 0 else 0.5
+        if form_time < 0.2:  # Early episodes (random)
+            base_color = "#9B59B6"  # Purple
+        elif form_time < 0.6:  # Learning phase
+            base_color = "#3498DB"  # Blue
+        else:  # Learned phase
+            base_color = "#51CF66" if ev_type == "heal" else ("#4DABF7" if ev_type == "threat" else "#FF6B6B")
         
-        for x0, y0, cx, cy, x1, y1, w, form_time in edges:
-            t_values = np.linspace(0, 1, 20)
-            for t in t_values:
-                x = (1-t)**2 * x0 + 2*(1-t)*t * cx + t**2 * x1
-                y = (1-t)**2 * y0 + 2*(1-t)*t * cy + t**2 * y1
-                x_edges.append(x)
-                y_edges.append(y)
-            x_edges.append(None)
-            y_edges.append(None)
-            
-            # Color based on formation: early = darker, late = lighter
-            # Early edges (random phase) = purple/blue
-            # Late edges (learned) = bright color
-            if form_time < 0.2:  # Early episodes (random)
-                base_color = "#9B59B6"  # Purple
-            elif form_time < 0.6:  # Learning phase
-                base_color = "#3498DB"  # Blue
-            else:  # Learned phase
-                base_color = "#51CF66" if ev_type == "heal" else ("#4DABF7" if ev_type == "threat" else "#FF6B6B")
-            
-            edge_hover.append(f"{ev_type.capitalize()}: {w:.1f}<br>First seen: Episode {int(form_time * max_episode)}")
-            edge_colors.append(base_color)
-        
-        fig.add_trace(go.Scatter(
-            x=x_edges, y=y_edges,
+        add_edge_trace(
+            fig, webgl, lod, paths["x"], paths["y"], num_points=20,
+            weights=[d.get("weight", 1.0) for _, _, d in edges],
             mode='lines',
             line=dict(width=3, color=base_color),
             hoverinfo='skip',
@@ -240,7 +193,7 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
             name=f"{ev_type.capitalize()} ({len(edges)} edges)",
             legendgroup=ev_type,
             opacity=0.7
-        ))
+        )
     
     # Add nodes
     node_x = [pos[node][0] for node in G.nodes()]
@@ -260,7 +213,7 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
         info += f"Betweenness: {betweenness.get(node, 0):.3f}"
         node_info.append(info)
     
-    fig.add_trace(go.Scatter(
+    fig.add_trace(scatter_class(webgl)(
         x=node_x, y=node_y,
         mode='markers+text',
         marker=dict(
@@ -280,14 +233,18 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
     
     # Statistics
     total_edges = len(G.edges())
-    early_edges = sum(1 for _, _, d in G.edges(data=True) if d.get("first_seen", 3000) < 500)
-    late_edges = sum(1 for _, _, d in G.edges(data=True) if d.get("first_seen", 0) > 2000)
+    early_edges = sum(1 for _, _, d in G.edges(data=True) if d.get("first_seen", late_start + 1) < early_end)
+    late_edges = sum(1 for _, _, d in G.edges(data=True) if d.get("first_seen", 0) > late_start)
+    # Edges still in use after late_start, answered on the run-length occurrence sets
+    persistent_edges = sum(1 for _, _, d in G.edges(data=True)
+                           if "occurrences" in d and d["occurrences"].active_in(late_start + 1, max_episode))
     
     annotations = [
         dict(
             text=f"<b>{title}</b><br>"
                  f"Episodes: 0-{max_episode} | Nodes: {len(G.nodes())} | Edges: {total_edges}<br>"
-                 f"Early (0-500): {early_edges} edges | Learned (2000+): {late_edges} edges",
+                 f"Early (0-{early_end}): {early_edges} edges | Learned ({late_start}+): {late_edges} new, "
+                 f"{persistent_edges} active",
             showarrow=False,
             xref="paper", yref="paper",
             x=0.02, y=0.98,
@@ -333,13 +290,20 @@ def draw_aggregate_graph_plotly(G: nx.DiGraph, episode_weights: Dict[int, float]
         height=900
     )
     
-    fig.write_html(output_path)
+    write_html(fig, output_path, lod)
 
 def main():
     parser = argparse.ArgumentParser(description="Aggregate episodes into SNA visualization")
     parser.add_argument("--input", "-i", required=True, help="Path to episodes JSON file")
     parser.add_argument("--output", "-o", default="aggregate_sna.html", help="Output HTML path")
     parser.add_argument("--title", "-t", default="Aggregate Episode SNA", help="Title")
+    parser.add_argument("--phases", default=None, help="Phases JSON from change_points.py for the early/learned split")
+    parser.add_argument("--betweenness-k", type=int, default=None,
+                        help="Sample k source nodes for approximate betweenness (default: exact on small graphs)")
+    parser.add_argument("--render", choices=RENDER_MODES, default="auto",
+                        help="Plotly renderer: svg, webgl, or auto (WebGL above a size threshold)")
+    parser.add_argument("--no-layout-cache", dest="layout_cache", action="store_false",
+                        help="Compute layouts from scratch instead of reusing/warm-starting cached ones (reproducible)")
     args = parser.parse_args()
     
     print(f"Loading episodes from {args.input}...")
@@ -355,7 +319,20 @@ def main():
     print(f"Graph: {len(G.nodes())} nodes, {len(G.edges())} edges")
     
     print(f"Generating visualization...")
-    draw_aggregate_graph_plotly(G, episode_weights, args.output, args.title)
+    early_end, late_start = 500, 2000
+    if args.phases:
+        with open(args.phases, "r", encoding="utf-8") as f:
+            phases = json.load(f)
+        if len(phases["ranges"]) < 2:
+            # One phase: early_range is late_range, so the split would be everything vs everything
+            print(f"{args.phases} has a single phase; using the default early/late split "
+                  f"(<{early_end}, >{late_start})")
+        else:
+            early_end, late_start = phases["early_range"][1] + 1, phases["late_range"][0] - 1
+    draw_aggregate_graph_plotly(G, episode_weights, args.output, args.title,
+                                early_end=early_end, late_start=late_start,
+                                betweenness_k=args.betweenness_k or "auto", render=args.render,
+                                use_layout_cache=args.layout_cache)
     
     print(f"✓ Generated {args.output}")
     print(f"  Nodes: {len(G.nodes())}")
@@ -0,0 +1,154 @@
+"""
+Cached, label-stable community detection for the SNA graphs.
+
+Communities are found on the weighted undirected adjacency: the weights
+of u -> v and v -> u are summed. The backend is Leiden (igraph + leidenalg)
+when installed, otherwise networkx's Louvain, otherwise greedy modularity
+on older networkx. Results are cached per graph content hash through
+graph_cache.GraphCache, so re-rendering a figure skips detection.
+
+Labels are canonical: communities are numbered by size, ties broken by
+their smallest node name. Successive windows can additionally be matched
+to the previous window's labels (greatest node overlap first), so the same
+group keeps its colour across windows. render_communities() does the same
+across renders of one figure: pass the previous render's labels, or let it
+read the labels of the figure's last render from the cache (only that
+render's nodes are kept). use_cache=False (the scripts' --no-layout-cache)
+neither reads nor writes them.
+"""
+
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional
+
+import networkx as nx
+
+from graph_cache import GraphCache, cache_key, graph_content_hash
+
+try:
+    import igraph
+    import leidenalg
+    HAS_LEIDEN = True
+except ImportError:
+    HAS_LEIDEN = False
+
+HAS_LOUVAIN = hasattr(nx.community, "louvain_communities")
+
+_default_cache = None
+
+
+def default_cache() -> GraphCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GraphCache()
+    return _default_cache
+
+
+def undirected_weighted(G: nx.Graph, weight: str = "weight") -> nx.Graph:
+    """Undirected graph whose edge weights sum both directions"""
+    U = nx.Graph()
+    U.add_nodes_from(G.nodes())
+    for u, v, data in G.edges(data=True):
+        w = float(data.get(weight, 1.0))
+        if U.has_edge(u, v):
+            U[u][v]["weight"] += w
+        else:
+            U.add_edge(u, v, weight=w)
+    return U
+
+
+def _leiden(U: nx.Graph, resolution: float, seed: int) -> List[set]:
+    nodes = list(U.nodes())
+    index = {n: i for i, n in enumerate(nodes)}
+    graph = igraph.Graph(n=len(nodes), edges=[(index[u], index[v]) for u, v in U.edges()])
+    graph.es["weight"] = [d["weight"] for _, _, d in U.edges(data=True)]
+    partition = leidenalg.find_partition(graph, leidenalg.RBConfigurationVertexPartition, weights="weight",
+                                         resolution_parameter=resolution, seed=seed)
+    return [{nodes[i] for i in members} for members in partition]
+
+
+def _detect(U: nx.Graph, method: str, resolution: float, seed: int) -> List[set]:
+    if method == "auto":
+        method = "leiden" if HAS_LEIDEN else ("louvain" if HAS_LOUVAIN else "greedy")
+    if method == "leiden":
+        return _leiden(U, resolution, seed)
+    if method == "louvain":
+        return [set(c) for c in nx.community.louvain_communities(U, weight="weight", resolution=resolution, seed=seed)]
+    if method == "greedy":
+        return [set(c) for c in nx.community.greedy_modularity_communities(U, weight="weight", resolution=resolution)]
+    raise ValueError(f"Unknown community method: {method}")
+
+
+def canonical_labels(communities: List[set]) -> Dict[Hashable, int]:
+    """{node: label}, labels ordered by community size then smallest node name"""
+    ordered = sorted(communities, key=lambda c: (-len(c), min(map(str, c))))
+    return {node: label for label, members in enumerate(ordered) for node in members}
+
+
+def detect_communities(G: nx.Graph, weight: str = "weight", method: str = "auto", resolution: float = 1.0,
+                       seed: int = 42, cache: Optional[GraphCache] = None) -> Dict[Hashable, int]:
+    """{node: community label} for G, cached by graph content"""
+    cache = cache or default_cache()
+    if G.number_of_nodes() == 0:
+        return {}
+    key = cache_key(graph_content_hash(G, weight), method=method, resolution=resolution, seed=seed)
+    labels = cache.get("communities", key)
+    if labels is None:
+        U = undirected_weighted(G, weight)
+        communities = _detect(U, method, resolution, seed) if U.number_of_edges() else [{n} for n in U]
+        labels = canonical_labels(communities)
+        cache.put("communities", key, labels)
+    return dict(labels)
+
+
+def match_labels(previous: Dict[Hashable, int], current: Dict[Hashable, int]) -> Dict[Hashable, int]:
+    """
+    Relabel current communities to agree with previous labels. Pairs with
+    the most shared nodes are matched first; unmatched communities get
+    fresh labels above every previous one (in canonical order).
+    """
+    overlap = defaultdict(int)
+    for node, label in current.items():
+        if node in previous:
+            overlap[(label, previous[node])] += 1
+    mapping, used = {}, set()
+    for (label, old), _ in sorted(overlap.items(), key=lambda item: (-item[1], item[0])):
+        if label not in mapping and old not in used:
+            mapping[label] = old
+            used.add(old)
+    next_label = max(list(previous.values()) + [-1]) + 1
+    for label in sorted(set(current.values())):
+        if label not in mapping:
+            mapping[label] = next_label
+            next_label += 1
+    return {node: mapping[label] for node, label in current.items()}
+
+
+def render_communities(G: nx.Graph, render: str, previous: Optional[Dict[Hashable, int]] = None,
+                       use_cache: bool = True, cache: Optional[GraphCache] = None,
+                       **kwargs) -> Dict[Hashable, int]:
+    """
+    detect_communities for the named figure, labels matched to previous
+    (default: the figure's last cached render, if use_cache)
+    """
+    cache = cache or default_cache()
+    labels = detect_communities(G, cache=cache, **kwargs)
+    if previous is None and use_cache:
+        previous = cache.get("community_render", render)
+    if previous:
+        labels = match_labels(previous, labels)
+    if use_cache:
+        cache.put("community_render", render, labels)
+    return labels
+
+
+def window_communities(graphs: Dict[str, nx.Graph], **kwargs) -> Dict[str, Dict[Hashable, int]]:
+    """Communities per window graph (in the given order), labels matched to the previous window"""
+    results, previous = {}, {}
+    for name, G in graphs.items():
+        labels = detect_communities(G, **kwargs)
+        if previous:
+            labels = match_labels(previous, labels)
+        results[name] = labels
+        # Nodes absent from this window keep their last label for later matches
+        previous = {**previous, **labels}
+    return results
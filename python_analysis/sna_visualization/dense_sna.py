@@ -10,12 +10,13 @@ from itertools import cycle
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 
-try:
-    from networkx.algorithms import community
-    HAS_COMMUNITY = True
-except ImportError:
-    HAS_COMMUNITY = False
+from communities import render_communities
+from layout_cache import cached_layout
+from temporal_graph import TemporalGraph
+
+DENSE_LAYERS = ["damage", "heal", "party_attacks"]
 
 def load_episodes(path: str):
     """Load episodes from JSON file"""
@@ -29,24 +30,96 @@ def load_episodes(path: str):
     else:
         return [data]
 
-def create_dense_network(episodes, num_windows=5):
+def load_phases(path: str):
+    """Load (start_idx, end_idx) windows from a change_points.py phases JSON"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [tuple(r) for r in data["ranges"]]
+
+def get_window_names(num_windows):
+    """Names for training windows (early, mid_early, ... or phase_N beyond five)"""
+    if num_windows <= 5:
+        return ["early", "mid_early", "mid", "mid_late", "late"][:num_windows]
+    return [f"phase_{i}" for i in range(num_windows)]
+
+def dense_temporal_graph(episodes, role_map, boss_ids):
+    """
+    Per-episode role interactions as a TemporalGraph with layers damage, heal
+    and party_attacks (role -> itself, attack counts used to infer boss damage)
+    """
+    node_index = {}
+    entries = defaultdict(float)  # (ep_idx, src, tgt, layer) -> weight
+    
+    def add(ep_idx, src, tgt, layer, weight):
+        key = (ep_idx, node_index.setdefault(src, len(node_index)), node_index.setdefault(tgt, len(node_index)), layer)
+        entries[key] += weight
+    
+    damage, heal, attacks = range(len(DENSE_LAYERS))
+    for ep_idx, episode in enumerate(episodes):
+        actions = episode.get("actions", [])
+        
+        for act in actions:
+            branch = act.get("branch")
+            val = act.get("value", 0)
+            agent = act.get("agentId", "unknown")
+            target = act.get("targetId")  # Use explicit target if available
+            agent_role = role_map.get(agent, agent)
+            
+            if branch == "attack" and val == 1:
+                if target:
+                    # Use explicit target
+                    target_role = role_map.get(target, target)
+                    amount = 10.0 if agent_role == "MeleeDPS" else (5.0 if agent_role == "RangedDPS" else (100.0 if agent_role == "Boss" else 2.0))
+                    add(ep_idx, agent_role, target_role, damage, amount)
+                    if agent_role != "Boss":
+                        add(ep_idx, agent_role, agent_role, attacks, 1.0)
+                else:
+                    # Fallback to inference if no explicit target
+                    agent_lower = agent.lower()
+                    is_boss = agent in boss_ids or agent_lower == "boss" or "boss" in agent_lower
+                    
+                    if not is_boss:
+                        # Party member attacks boss
+                        amount = 10.0 if agent_role == "MeleeDPS" else (5.0 if agent_role == "RangedDPS" else 2.0)
+                        add(ep_idx, agent_role, "Boss", damage, amount)
+                        add(ep_idx, agent_role, agent_role, attacks, 1.0)
+            
+            elif branch == "heal" and val == 1:
+                if target:
+                    # Use explicit target
+                    target_role = role_map.get(target, target)
+                    add(ep_idx, agent_role, target_role, heal, 10.0)
+                else:
+                    # Fallback to inference
+                    if agent_role == "Healer":
+                        add(ep_idx, "Healer", "Tank", heal, 10.0 * 0.5)
+                        add(ep_idx, "Healer", "MeleeDPS", heal, 10.0 * 0.3)
+                        add(ep_idx, "Healer", "RangedDPS", heal, 10.0 * 0.2)
+    
+    keys = np.array(list(entries.keys()), dtype=np.int64).reshape(-1, 4)
+    return TemporalGraph(keys[:, 0], keys[:, 1], keys[:, 2], keys[:, 3], list(entries.values()),
+                         list(node_index), DENSE_LAYERS, num_episodes=len(episodes))
+
+def create_dense_network(episodes, num_windows=5, windows=None):
     """
     Create dense network with nodes like Role_Window.
+    windows: optional explicit (start_idx, end_idx) ranges, e.g. from change_points.py
     Returns: NetworkX graph with role×window nodes
     """
     G = nx.DiGraph()
     
     # Define training windows using indices (safer than episode numbers)
     total_episodes = len(episodes)
-    window_size = max(1, total_episodes // num_windows)
-    
-    windows = []
-    for i in range(num_windows):
-        start_idx = i * window_size
-        end_idx = total_episodes - 1 if i == num_windows - 1 else min(total_episodes, (i + 1) * window_size) - 1
-        windows.append((start_idx, end_idx))
+    if windows is None:
+        window_size = max(1, total_episodes // num_windows)
+        
+        windows = []
+        for i in range(num_windows):
+            start_idx = i * window_size
+            end_idx = total_episodes - 1 if i == num_windows - 1 else min(total_episodes, (i + 1) * window_size) - 1
+            windows.append((start_idx, end_idx))
     
-    window_names = ["early", "mid_early", "mid", "mid_late", "late"][:num_windows]
+    window_names = get_window_names(len(windows))
     
     # Get agent roles
     agent_classes = {}
@@ -82,57 +155,30 @@ def create_dense_network(episodes, num_windows=5):
             else:
                 role_map[agent_id] = "RangedDPS"
     
-    # Aggregate interactions per window
+    # Per-episode interactions once, then slice every window from the temporal store
+    temporal = dense_temporal_graph(episodes, role_map, boss_ids)
+    damage, heal, attacks = range(len(DENSE_LAYERS))
+    
     # Structure: (role1, window1, role2, window2) -> {"damage": float, "heal": float}
     window_interactions = defaultdict(lambda: {"damage": 0.0, "heal": 0.0})
     
     for window_idx, (start_idx, end_idx) in enumerate(windows):
         window_name = window_names[window_idx]
+        weights = temporal.range_weights(start_idx, end_idx)
+        # Boss damage inference has always used the party attack counts of the window's last episode
+        last_weights = temporal.range_weights(end_idx, end_idx)
+        party_attack_counts = defaultdict(int)
         
-        for ep_idx, episode in enumerate(episodes):
-            if not (start_idx <= ep_idx <= end_idx):
-                continue
-            
-            actions = episode.get("actions", [])
-            party_attack_counts = defaultdict(int)
-            
-            for act in actions:
-                branch = act.get("branch")
-                val = act.get("value", 0)
-                agent = act.get("agentId", "unknown")
-                target = act.get("targetId")  # Use explicit target if available
-                agent_role = role_map.get(agent, agent)
-                
-                if branch == "attack" and val == 1:
-                    if target:
-                        # Use explicit target
-                        target_role = role_map.get(target, target)
-                        damage = 10.0 if agent_role == "MeleeDPS" else (5.0 if agent_role == "RangedDPS" else (100.0 if agent_role == "Boss" else 2.0))
-                        window_interactions[(agent_role, window_name, target_role, window_name)]["damage"] += damage
-                        if agent_role != "Boss":
-                            party_attack_counts[agent_role] += 1
-                    else:
-                        # Fallback to inference if no explicit target
-                        agent_lower = agent.lower()
-                        is_boss = agent in boss_ids or agent_lower == "boss" or "boss" in agent_lower
-                        
-                        if not is_boss:
-                            # Party member attacks boss
-                            damage = 10.0 if agent_role == "MeleeDPS" else (5.0 if agent_role == "RangedDPS" else 2.0)
-                            window_interactions[(agent_role, window_name, "Boss", window_name)]["damage"] += damage
-                            party_attack_counts[agent_role] += 1
-                
-                elif branch == "heal" and val == 1:
-                    if target:
-                        # Use explicit target
-                        target_role = role_map.get(target, target)
-                        window_interactions[(agent_role, window_name, target_role, window_name)]["heal"] += 10.0
-                    else:
-                        # Fallback to inference
-                        if agent_role == "Healer":
-                            window_interactions[("Healer", window_name, "Tank", window_name)]["heal"] += 10.0 * 0.5
-                            window_interactions[("Healer", window_name, "MeleeDPS", window_name)]["heal"] += 10.0 * 0.3
-                            window_interactions[("Healer", window_name, "RangedDPS", window_name)]["heal"] += 10.0 * 0.2
+        for k in np.flatnonzero(weights):
+            src = temporal.nodes[temporal.edge_src[k]]
+            tgt = temporal.nodes[temporal.edge_tgt[k]]
+            layer = temporal.edge_layer[k]
+            if layer == attacks:
+                if last_weights[k]:
+                    party_attack_counts[src] += int(round(last_weights[k]))
+            else:
+                kind = "damage" if layer == damage else "heal"
+                window_interactions[(src, window_name, tgt, window_name)][kind] += weights[k]
         
         # Infer boss attacks based on party activity (only if we don't have explicit boss attack targets)
         # Skip if we already have explicit Boss→Party edges from targetId
@@ -210,32 +256,21 @@ def create_dense_network(episodes, num_windows=5):
     
     return G, window_names
 
-def draw_dense_graph(G, window_names, output_path, title):
+def draw_dense_graph(G, window_names, output_path, title, use_layout_cache=True):
     """Draw dense network graph with community detection"""
     
-    # Convert to undirected for community detection
+    # Undirected view for degree centrality
     G_undir = G.to_undirected()
     
-    # Community detection
-    if HAS_COMMUNITY:
-        try:
-            communities = list(community.greedy_modularity_communities(G_undir))
-            community_map = {}
-            for i, comm in enumerate(communities):
-                for node in comm:
-                    community_map[node] = i
-            
-            color_cycle = cycle(["#FF6B6B", "#4ECDC4", "#556270", "#C7F464", "#C44D58", "#95A5A6"])
-            comm_color = {i: c for i, c in zip(range(len(communities)), color_cycle)}
-            node_colors = [comm_color.get(community_map.get(n, 0), "#95A5A6") for n in G.nodes()]
-        except:
-            # Fallback: color by role
-            role_colors = {
-                "Boss": "#FF6B6B", "Tank": "#4ECDC4", "Healer": "#51CF66",
-                "MeleeDPS": "#FFD93D", "RangedDPS": "#A78BFA"
-            }
-            node_colors = [role_colors.get(G.nodes[n].get("role", "Unknown"), "#95A5A6") for n in G.nodes()]
-    else:
+    # Community detection (cached per graph, labels matched to the previous dense render)
+    try:
+        community_map = render_communities(G, "dense_sna", use_cache=use_layout_cache)
+        color_cycle = cycle(["#FF6B6B", "#4ECDC4", "#556270", "#C7F464", "#C44D58", "#95A5A6"])
+        comm_color = {i: c for i, c in zip(range(max(community_map.values(), default=-1) + 1), color_cycle)}
+        node_colors = [comm_color.get(community_map.get(n, 0), "#95A5A6") for n in G.nodes()]
+    except Exception as e:
+        # Fallback: color by role
+        print(f"Community detection failed ({e}); coloring by role")
         role_colors = {
             "Boss": "#FF6B6B", "Tank": "#4ECDC4", "Healer": "#51CF66",
             "MeleeDPS": "#FFD93D", "RangedDPS": "#A78BFA"
@@ -256,7 +291,7 @@ def draw_dense_graph(G, window_names, output_path, title):
     }
     
     # Force-directed layout
-    pos = nx.spring_layout(G, k=1.2, iterations=200, seed=42)
+    pos = cached_layout(G, "spring", k=1.2, iterations=200, seed=42, kind="dense_sna", use_cache=use_layout_cache)
     
     # Create figure
     fig, ax = plt.subplots(figsize=(12, 10), facecolor='white')
@@ -313,17 +348,21 @@ def main():
     parser.add_argument("--output", "-o", default="dense_sna.png", help="Output PNG path")
     parser.add_argument("--title", "-t", default="Episode-level Damage Network Over Training", help="Title")
     parser.add_argument("--windows", "-w", type=int, default=5, help="Number of training windows")
+    parser.add_argument("--phases", default=None, help="Phases JSON from change_points.py (overrides --windows)")
+    parser.add_argument("--no-layout-cache", dest="layout_cache", action="store_false",
+                        help="Compute layouts and community labels from scratch instead of reusing/matching cached ones (reproducible)")
     args = parser.parse_args()
     
     print(f"Loading episodes from {args.input}...")
     episodes = load_episodes(args.input)
     print(f"Loaded {len(episodes)} episodes")
     
-    print(f"Creating dense network with {args.windows} windows...")
-    G, window_names = create_dense_network(episodes, num_windows=args.windows)
+    windows = load_phases(args.phases) if args.phases else None
+    print(f"Creating dense network with {len(windows) if windows else args.windows} windows...")
+    G, window_names = create_dense_network(episodes, num_windows=args.windows, windows=windows)
     
     print(f"Generating visualization...")
-    draw_dense_graph(G, window_names, args.output, args.title)
+    draw_dense_graph(G, window_names, args.output, args.title, use_layout_cache=args.layout_cache)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+"""
+Compact per-edge episode occurrence sets for the aggregate SNA scripts.
+
+Instead of appending the episode number to a list on every action, an edge
+records one (episode, count) pair per episode it appears in, and freezes
+them into run-length episode ranges plus a per-episode count array. A run
+covering thousands of consecutive episodes costs two integers, so long
+training runs shrink from hundreds of millions of ints to a few MB.
+First/last seen, counts within an episode range and merges all work on the
+compact form.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class EpisodeOccurrences:
+    """Episodes an edge occurred in, as sorted run-length ranges with per-episode action counts"""
+
+    def __init__(self):
+        self.starts = np.zeros(0, dtype=np.int64)    # (R,) first episode of each run
+        self.lengths = np.zeros(0, dtype=np.int64)   # (R,) consecutive episodes in each run
+        self.counts = np.zeros(0, dtype=np.uint32)   # (n,) actions per stored episode, in episode order
+        self._pending_episodes: List[int] = []
+        self._pending_counts: List[int] = []
+
+    def add(self, episode: int, count: int = 1):
+        """Record count actions in an episode (episodes may arrive in any order or repeat)"""
+        self._pending_episodes.append(int(episode))
+        self._pending_counts.append(int(count))
+
+    def _flush(self):
+        if not self._pending_episodes:
+            return
+        episodes = np.concatenate([self._expand(), np.asarray(self._pending_episodes, dtype=np.int64)])
+        counts = np.concatenate([self.counts.astype(np.int64), np.asarray(self._pending_counts, dtype=np.int64)])
+        self._pending_episodes, self._pending_counts = [], []
+        self._set(episodes, counts)
+
+    def _set(self, episodes: np.ndarray, counts: np.ndarray):
+        unique, inverse = np.unique(episodes, return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(unique)).astype(np.uint32)
+        breaks = np.flatnonzero(np.diff(unique) != 1) + 1
+        bounds = np.r_[0, breaks, len(unique)]
+        self.starts = unique[bounds[:-1]] if len(unique) else np.zeros(0, dtype=np.int64)
+        self.lengths = np.diff(bounds).astype(np.int64)
+
+    @classmethod
+    def from_arrays(cls, episodes, counts=None) -> "EpisodeOccurrences":
+        occ = cls()
+        episodes = np.asarray(episodes, dtype=np.int64)
+        counts = np.ones(len(episodes), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        occ._set(episodes, counts)
+        return occ
+
+    def episodes(self) -> np.ndarray:
+        """Distinct episode numbers (expanded from the runs)"""
+        self._flush()
+        return self._expand()
+
+    def _expand(self) -> np.ndarray:
+        if not len(self.starts):
+            return np.zeros(0, dtype=np.int64)
+        offsets = np.repeat(self.starts - np.r_[0, np.cumsum(self.lengths)[:-1]], self.lengths)
+        return offsets + np.arange(int(self.lengths.sum()))
+
+    def runs(self) -> List[Tuple[int, int]]:
+        """Inclusive (start, end) episode ranges"""
+        self._flush()
+        return [(int(s), int(s + n - 1)) for s, n in zip(self.starts, self.lengths)]
+
+    @property
+    def num_episodes(self) -> int:
+        self._flush()
+        return int(self.lengths.sum())
+
+    @property
+    def total(self) -> int:
+        self._flush()
+        return int(self.counts.sum())
+
+    @property
+    def first_seen(self) -> Optional[int]:
+        self._flush()
+        return int(self.starts[0]) if len(self.starts) else None
+
+    @property
+    def last_seen(self) -> Optional[int]:
+        self._flush()
+        return int(self.starts[-1] + self.lengths[-1] - 1) if len(self.starts) else None
+
+    def _rank(self, episode) -> np.ndarray:
+        """Number of stored episodes <= episode (vectorised over episode)"""
+        episode = np.asarray(episode, dtype=np.int64)
+        cum = np.r_[0, np.cumsum(self.lengths)]
+        run = np.searchsorted(self.starts, episode, side="right") - 1
+        inside = np.minimum(episode - self.starts[np.maximum(run, 0)] + 1, self.lengths[np.maximum(run, 0)])
+        return np.where(run >= 0, cum[np.maximum(run, 0)] + inside, 0)
+
+    def count_in(self, start: int, end: int) -> Tuple[int, int]:
+        """(episodes, actions) within the inclusive episode range"""
+        self._flush()
+        if not len(self.starts):
+            return 0, 0
+        lo, hi = self._rank([start - 1, end])
+        prefix = np.r_[0, np.cumsum(self.counts, dtype=np.int64)]
+        return int(hi - lo), int(prefix[hi] - prefix[lo])
+
+    def active_in(self, start: int, end: int) -> bool:
+        return self.count_in(start, end)[0] > 0
+
+    def merge(self, other: "EpisodeOccurrences") -> "EpisodeOccurrences":
+        """New occurrence set with both edges' episodes and summed counts"""
+        self._flush()
+        other._flush()
+        return EpisodeOccurrences.from_arrays(np.concatenate([self.episodes(), other.episodes()]),
+                                              np.concatenate([self.counts, other.counts]).astype(np.int64))
+
+    def copy(self) -> "EpisodeOccurrences":
+        self._flush()
+        return EpisodeOccurrences.from_arrays(self.episodes(), self.counts.astype(np.int64))
+
+    def __iter__(self) -> Iterator[int]:
+        self._flush()
+        return iter(self.episodes().tolist())
+
+    def __len__(self) -> int:
+        return self.num_episodes
+
+    @property
+    def nbytes(self) -> int:
+        return self.starts.nbytes + self.lengths.nbytes + self.counts.nbytes
+
+    def __repr__(self) -> str:
+        runs = self.runs()
+        shown = ", ".join(f"{s}-{e}" if s != e else str(s) for s, e in runs[:4])
+        more = ", ..." if len(runs) > 4 else ""
+        return f"EpisodeOccurrences({self.num_episodes} episodes in [{shown}{more}], {self.total} actions)"
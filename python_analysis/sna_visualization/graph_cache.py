@@ -0,0 +1,82 @@
+"""
+Content hashes and a small disk cache for derived graph data.
+
+graph_content_hash() covers nodes, edges and edge weights;
+topology_hash() covers nodes and edges only, for results that ignore
+weights (unweighted centrality, layouts seeded from topology). Cached
+values are pickled under <cache_dir>/<kind>/<key>.pkl, so re-rendering the
+same graph skips the expensive step. The cache directory defaults to
+$SNA_CACHE_DIR or .sna_cache in the working directory.
+"""
+
+import hashlib
+import os
+import pickle
+from typing import Any, Optional
+
+import networkx as nx
+
+DEFAULT_CACHE_DIR = os.environ.get("SNA_CACHE_DIR", ".sna_cache")
+
+
+def _digest(parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def topology_hash(G: nx.Graph) -> str:
+    """Hash of directedness, nodes and edges (weights ignored)"""
+    nodes = sorted(map(str, G.nodes()))
+    edges = sorted((str(u), str(v)) for u, v in G.edges())
+    return _digest([G.is_directed(), nodes, edges])
+
+
+def graph_content_hash(G: nx.Graph, weight: str = "weight") -> str:
+    """Hash of directedness, nodes, edges and edge weights (rounded to 9 significant digits)"""
+    nodes = sorted(map(str, G.nodes()))
+    edges = sorted((str(u), str(v), float(f"{float(d.get(weight, 1.0)):.9g}")) for u, v, d in G.edges(data=True))
+    return _digest([G.is_directed(), nodes, edges])
+
+
+class GraphCache:
+    """In-memory + on-disk cache keyed by (kind, key)"""
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._memory = {}
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.cache_dir, kind, f"{key}.pkl")
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        if (kind, key) in self._memory:
+            return self._memory[(kind, key)]
+        if self.cache_dir:
+            path = self._path(kind, key)
+            if os.path.exists(path):
+                try:
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+                except Exception:
+                    return None
+                self._memory[(kind, key)] = value
+                return value
+        return None
+
+    def put(self, kind: str, key: str, value: Any):
+        self._memory[(kind, key)] = value
+        if self.cache_dir:
+            path = self._path(kind, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f)
+            os.replace(tmp, path)
+
+
+def cache_key(graph_hash: str, **params) -> str:
+    """Key combining a graph hash with the parameters of the computation"""
+    return _digest([graph_hash] + sorted(params.items()))[:40]
@@ -4,13 +4,19 @@ Uses vis.js for full interactivity.
 """
 
 import argparse
+import base64
 import json
 import math
-from collections import defaultdict
 from typing import Dict, List, Tuple
 
 import networkx as nx
 
+import numpy as np
+
+from sna_tensor import (LAYERS, ROLE_MAP, agent_roles, encode_interactions, interaction_tensor, range_windows,
+                        targeted_episodes, class_selection_counts as class_selection_counts_for)
+from temporal_graph import TemporalGraph
+
 # Configuration
 TAUNT_COLOR = '#A78BFA'  # Purple color for taunt
 BOSS_DAMAGE_TO_MELEE_MULTIPLIER = 5.0  # Make boss→MeleeDPS damage line much thicker (late training)
@@ -29,80 +35,59 @@ def load_episodes(path: str) -> List[dict]:
     else:
         return [data]
 
-def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tuple[int, int] = None) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple], List[Tuple], Dict[str, int]]:
-    """Extract damage, healing, threat, and taunt edges from episodes."""
-    boss_damage_edges_dict = defaultdict(float)
-    party_damage_edges_dict = defaultdict(float)
-    healing_edges_dict = defaultdict(float)
-    threat_edges_dict = defaultdict(float)
-    taunt_edges_dict = defaultdict(float)
-    class_selection_counts = defaultdict(int)
-    
-    role_map = {
-        "Boss": "Boss",
-        "Party Member 1": "Tank",
-        "Party Member 2": "Healer",
-        "Party Member 3": "MeleeDPS",
-        "Party Member 4": "RangedDPS",
-    }
-    
-    seen_selections = set()
-    
-    for episode in episodes:
-        episode_num = episode.get("episode", 0)
-        if episode_range:
-            start, end = episode_range
-            if not (start <= episode_num <= end):
-                continue
-        
-        actions = episode.get("actions", [])
-        has_explicit_targets = any("targetId" in act for act in actions)
-        
-        if has_explicit_targets:
-            for act in actions:
-                branch = act.get("branch")
-                val = act.get("value", 0)
-                agent = act.get("agentId", "unknown")
-                target = act.get("targetId")
-                
-                if val == 1 and target:
-                    agent_role = role_map.get(agent, agent)
-                    target_role = role_map.get(target, target)
-                    
-                    if branch == "attack":
-                        if agent_role == "Boss" and target_role != "Boss":
-                            boss_damage_edges_dict[(agent_role, target_role)] += 1.0
-                        elif agent_role != "Boss" and target_role == "Boss":
-                            party_damage_edges_dict[(agent_role, target_role)] += 1.0
-                            threat_edges_dict[(agent_role, target_role)] += 1.0
-                    elif branch == "heal":
-                        if agent_role == "Healer" and target_role != "Boss":
-                            healing_edges_dict[(agent_role, target_role)] += 1.0
-                    elif branch == "threat_boost" or branch == "taunt":
-                        if agent_role == "Tank" and target_role == "Boss":
-                            taunt_edges_dict[(agent_role, target_role)] += 1.0
-                
-                if branch == "class_selection" and val >= 0:
-                    agent_role = role_map.get(agent, agent)
-                    episode_key = f"{episode_num}_{agent}"
-                    if episode_key not in seen_selections:
-                        seen_selections.add(episode_key)
-                        class_selection_counts[agent_role] += 1
+def build_temporal_graph(episodes: List[dict]) -> Tuple[TemporalGraph, Dict]:
+    """
+    Per-episode damage/healing/threat/taunt edges as a TemporalGraph, built
+    once so every episode range is a slice instead of a re-extraction.
+    Returns (temporal_graph, context) where context holds what class selection
+    counts need.
+    """
+    enc = encode_interactions(episodes)
+    node_of_agent, nodes = agent_roles(enc, ROLE_MAP)
+    targeted = targeted_episodes(enc)
+    episode_window = np.where(targeted, np.arange(enc.num_episodes), -1)
+    tensor = interaction_tensor(enc, node_of_agent, nodes, episode_window, enc.num_episodes, infer_taunt=False)
+    temporal = TemporalGraph.from_tensor(tensor, enc.episode_numbers)
+    return temporal, {"enc": enc, "node_of_agent": node_of_agent, "nodes": nodes, "targeted": targeted}
+
+def extract_range_edges(temporal: TemporalGraph, context: Dict, episode_range: Tuple[int, int] = None,
+                        index_range: Tuple[int, int] = None) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple], List[Tuple], Dict[str, int]]:
+    """Edges and class selection counts for an episode-number (or episode-index) range of a prebuilt temporal graph."""
+    if index_range:
+        weights = temporal.range_weights(*index_range)
+    elif episode_range:
+        weights = temporal.number_range_weights(*episode_range)
+    else:
+        weights = temporal.range_weights()
     
+    edges = {layer: [] for layer in LAYERS}
+    taunt_from_damage = []
+    min_weight = 1e-3
+    for k, (src, tgt, layer) in enumerate(temporal.edge_names()):
+        if weights[k] <= 0:
+            continue
+        edges[layer].append((src, tgt, max(float(weights[k]), min_weight)))
+        if layer == "party_damage" and src == "Tank" and tgt == "Boss":
+            taunt_from_damage.append((src, tgt, max(float(weights[k]) * 0.5, min_weight)))
     # Infer taunt from Tank attacks if no explicit taunt actions
-    if not taunt_edges_dict:
-        for (src, tgt), weight in party_damage_edges_dict.items():
-            if src == "Tank" and tgt == "Boss":
-                taunt_edges_dict[(src, tgt)] += weight * 0.5
+    if not edges["taunt"]:
+        edges["taunt"] = taunt_from_damage
     
-    min_weight = 1e-3
-    boss_damage_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in boss_damage_edges_dict.items() if weight > 0]
-    party_damage_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in party_damage_edges_dict.items() if weight > 0]
-    healing_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in healing_edges_dict.items() if weight > 0]
-    threat_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in threat_edges_dict.items() if weight > 0]
-    taunt_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in taunt_edges_dict.items() if weight > 0]
+    enc = context["enc"]
+    selected = context["targeted"].copy()
+    if index_range:
+        selected[:index_range[0]] = False
+        selected[index_range[1] + 1:] = False
+    elif episode_range:
+        selected &= range_windows(enc, [episode_range]) >= 0
+    class_selection_counts = class_selection_counts_for(enc, context["node_of_agent"], context["nodes"], selected)
     
-    return boss_damage_edges, party_damage_edges, healing_edges, threat_edges, taunt_edges, class_selection_counts
+    return tuple(edges[layer] for layer in LAYERS) + (class_selection_counts,)
+
+def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tuple[int, int] = None) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple], List[Tuple], Dict[str, int]]:
+    """Extract damage, healing, threat, and taunt edges from episodes."""
+    temporal, context = build_temporal_graph(episodes)
+    return extract_range_edges(temporal, context, episode_range)
 
 def create_raid_layout():
     """Create fixed raid-style layout positions"""
@@ -114,11 +99,10 @@ def create_raid_layout():
         "RangedDPS": (0.8, -0.2),
     }
 
-def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges: List[Tuple],
-                            healing_edges: List[Tuple], threat_edges: List[Tuple], taunt_edges: List[Tuple],
-                            class_selection_counts: Dict[str, int],
-                            output_path: str, title: str, is_early: bool = False):
-    """Create interactive HTML with vis.js for draggable nodes and adjustable edge thickness"""
+def window_vis_data(boss_damage_edges: List[Tuple], party_damage_edges: List[Tuple],
+                    healing_edges: List[Tuple], threat_edges: List[Tuple], taunt_edges: List[Tuple],
+                    class_selection_counts: Dict[str, int], is_early: bool = False) -> Tuple[List[dict], List[dict], Dict[str, str], Dict]:
+    """vis.js nodes, edges, edge types and reset positions for one set of edges"""
     
     # Build graph
     G = nx.DiGraph()
@@ -147,7 +131,8 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
         "MeleeDPS": "#FFD93D", "RangedDPS": "#A78BFA"
     }
     
-    # Prepare nodes data
+    # Prepare nodes data (degree centrality is the fallback size, computed once per graph)
+    degree_centrality = nx.degree_centrality(G.to_undirected(as_view=True))
     nodes_data = []
     for n in G.nodes():
         selection_count = class_selection_counts.get(n, 0)
@@ -157,12 +142,8 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
         elif selection_count > 0:
             size = 30
         else:
-            try:
-                centrality = nx.degree_centrality(G.to_undirected())
-                cent_val = centrality.get(n, 0.1)
-                size = 20 + 40 * math.log(1 + cent_val) / math.log(2)
-            except:
-                size = 20
+            cent_val = degree_centrality.get(n, 0.1)
+            size = 20 + 40 * math.log(1 + cent_val) / math.log(2)
         
         # Make MeleeDPS bigger for late training
         if n == "MeleeDPS" and not is_early:
@@ -312,8 +293,12 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
             })
             edge_types["heal_Healer_Healer"] = "heal"
     
-    # Generate HTML with vis.js
-    html_content = f"""<!DOCTYPE html>
+    return nodes_data, edges_data, edge_types, {n: pos[n] for n in G.nodes()}
+
+def render_interactive_html(nodes_data: List[dict], edges_data: List[dict], edge_types: Dict[str, str],
+                            reset_positions: Dict, title: str, timeline_html: str = "", timeline_script: str = "") -> str:
+    """The vis.js document; timeline_html/timeline_script add the window slider"""
+    return f"""<!DOCTYPE html>
 <html>
 <head>
     <title>{title}</title>
@@ -753,7 +738,7 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
             </div>
         </div>
         
-        <div class="canvas-panel">
+        <div class="canvas-panel">{timeline_html}
             <div id="mynetwork"></div>
         </div>
     </div>
@@ -1042,7 +1027,7 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
         
         function resetLayout() {{
             nodes.forEach(node => {{
-                const pos = {json.dumps({n: pos[n] for n in G.nodes()}, indent=16)};
+                const pos = {json.dumps(reset_positions, indent=16)};
                 if (pos[node.id]) {{
                     nodes.update({{
                         id: node.id,
@@ -1378,10 +1363,20 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
             }} catch (e) {{
                 alert('Error loading configuration: ' + e.message);
             }}
-        }}
+        }}{timeline_script}
     </script>
 </body>
 </html>"""
+
+def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges: List[Tuple],
+                            healing_edges: List[Tuple], threat_edges: List[Tuple], taunt_edges: List[Tuple],
+                            class_selection_counts: Dict[str, int],
+                            output_path: str, title: str, is_early: bool = False):
+    """Create interactive HTML with vis.js for draggable nodes and adjustable edge thickness"""
+    nodes_data, edges_data, edge_types, reset_positions = window_vis_data(
+        boss_damage_edges, party_damage_edges, healing_edges, threat_edges, taunt_edges,
+        class_selection_counts, is_early)
+    html_content = render_interactive_html(nodes_data, edges_data, edge_types, reset_positions, title)
     
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(html_content)
@@ -1394,6 +1389,135 @@ def create_interactive_html(boss_damage_edges: List[Tuple], party_damage_edges:
     print("  - Click 'Reset Node Positions' to restore original layout")
     print("  - Click 'Reset Edge Thickness' to restore original thickness")
 
+# Edge id prefix and hover title per layer, in LAYERS order (as built by window_vis_data)
+EDGE_ID_PREFIX = {"boss_damage": "boss", "party_damage": "party", "healing": "heal", "threat": "threat", "taunt": "taunt"}
+EDGE_TITLE = {"boss": "Boss Damage", "party": "Party Damage", "heal": "Healing", "threat": "Threat", "taunt": "Taunt"}
+
+TIMELINE_HTML = """
+            <div style="padding: 0 0 10px 0;">
+                <label for="timelineSlider"><strong>Training window:</strong></label>
+                <input type="range" id="timelineSlider" min="0" max="__MAX__" value="0" step="1" style="width: 60%; vertical-align: middle;">
+                <span id="timelineLabel">__LABEL__</span>
+            </div>"""
+
+TIMELINE_SCRIPT = """
+        
+        // Timeline: one base64 float32 payload per window ([edge widths, edge weights, node sizes]),
+        // decoded the first time the slider reaches it
+        const timelineLabels = __LABELS__;
+        const timelinePayload = __PAYLOAD__;
+        const timelineEdgeIds = __EDGE_IDS__;
+        const timelineNodeIds = __NODE_IDS__;
+        const decodedWindows = {};
+        
+        function decodeWindow(w) {
+            if (!decodedWindows[w]) {
+                const bytes = Uint8Array.from(atob(timelinePayload[w]), c => c.charCodeAt(0));
+                decodedWindows[w] = new Float32Array(bytes.buffer);
+            }
+            return decodedWindows[w];
+        }
+        
+        function showWindow(w) {
+            const values = decodeWindow(w);
+            const numEdges = timelineEdgeIds.length;
+            edges.update(timelineEdgeIds.map((id, k) => {
+                const width = values[k];
+                const weight = values[numEdges + k];
+                originalWidths[id] = width;
+                return {
+                    id: id,
+                    width: width,
+                    hidden: width === 0,
+                    title: weight > 0 ? edges.get(id).titlePrefix + ': ' + weight.toFixed(1) : 'Healer Self-Healing'
+                };
+            }));
+            nodes.update(timelineNodeIds.map((id, n) => {
+                originalNodeSizes[id] = values[2 * numEdges + n];
+                return { id: id, size: originalNodeSizes[id] };
+            }));
+            // Re-apply the per-agent size/thickness sliders on top of the new window's base values
+            document.querySelectorAll('.agent-control-box input[type=range]').forEach(slider => {
+                if (!slider.id.startsWith('curvature_')) {
+                    slider.dispatchEvent(new Event('input'));
+                }
+            });
+            document.getElementById('timelineLabel').textContent = timelineLabels[w];
+        }
+        
+        document.getElementById('timelineSlider').addEventListener('input', function(e) {
+            showWindow(parseInt(e.target.value));
+        });"""
+
+def create_timeline_html(temporal: TemporalGraph, context: Dict, windows: List[Tuple[int, int]], labels: List[str],
+                         output_path: str, title: str, by_number: bool = False, early_windows: int = 1):
+    """
+    One interactive document with a slider over many windows (episode-index
+    ranges, or episode-number ranges with by_number). Nodes and edges are the
+    union over all windows; each window only contributes a base64 float32
+    payload of edge widths, edge weights and node sizes, which the page
+    decodes lazily. The first early_windows windows get the early-training
+    styling.
+    """
+    per_window = []
+    for w, window in enumerate(windows):
+        edge_lists = extract_range_edges(temporal, context, episode_range=window) if by_number \
+            else extract_range_edges(temporal, context, index_range=window)
+        vis_data = window_vis_data(*edge_lists, is_early=w < early_windows)
+        weights = {f"{EDGE_ID_PREFIX[layer]}_{u}_{v}": wt
+                   for layer, edges in zip(LAYERS, edge_lists[:len(LAYERS)]) for u, v, wt in edges}
+        per_window.append(vis_data + (weights,))
+    
+    # Union of nodes and edges in first-appearance order; window 0 provides the initial state
+    nodes_by_id, edges_by_id, edge_types = {}, {}, {}
+    for nodes_data, edges_data, types, reset_positions, _ in per_window:
+        for node in nodes_data:
+            nodes_by_id.setdefault(node["id"], dict(node))
+        for edge in edges_data:
+            edges_by_id.setdefault(edge["id"], dict(edge, titlePrefix=EDGE_TITLE[edge["id"].split("_")[0]]))
+        edge_types.update(types)
+    node_ids, edge_ids = list(nodes_by_id), list(edges_by_id)
+    
+    payload = []
+    for nodes_data, edges_data, _, _, weights in per_window:
+        width = {edge["id"]: edge["width"] for edge in edges_data}
+        size = {node["id"]: node["size"] for node in nodes_data}
+        values = np.array([width.get(i, 0.0) for i in edge_ids] + [weights.get(i, 0.0) for i in edge_ids]
+                          + [size.get(i, 0.0) for i in node_ids], dtype="<f4")
+        payload.append(base64.b64encode(values.tobytes()).decode("ascii"))
+    
+    first_nodes, first_edges, _, reset_positions, _ = per_window[0]
+    first_width = {edge["id"]: edge for edge in first_edges}
+    first_size = {node["id"]: node["size"] for node in first_nodes}
+    nodes_data = [dict(node, size=first_size.get(i, node["size"])) for i, node in nodes_by_id.items()]
+    edges_data = [dict(first_width[i], titlePrefix=edge["titlePrefix"]) if i in first_width
+                  else dict(edge, width=0, hidden=True) for i, edge in edges_by_id.items()]
+    
+    timeline_html = TIMELINE_HTML.replace("__MAX__", str(len(windows) - 1)).replace("__LABEL__", labels[0])
+    timeline_script = (TIMELINE_SCRIPT.replace("__LABELS__", json.dumps(labels))
+                       .replace("__PAYLOAD__", json.dumps(payload))
+                       .replace("__EDGE_IDS__", json.dumps(edge_ids))
+                       .replace("__NODE_IDS__", json.dumps(node_ids)))
+    html_content = render_interactive_html(nodes_data, edges_data, edge_types, reset_positions, title,
+                                           timeline_html, timeline_script)
+    
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html_content)
+    
+    print(f"Saved interactive timeline ({len(windows)} windows): {output_path}")
+    print("Drag the 'Training window' slider to scrub through training")
+
+def equal_windows(num_episodes: int, num_windows: int) -> List[Tuple[int, int]]:
+    """num_windows contiguous (start_idx, end_idx) ranges covering all episodes, as in dense_sna.py"""
+    window_size = max(1, num_episodes // num_windows)
+    windows = []
+    for i in range(num_windows):
+        start_idx = i * window_size
+        end_idx = num_episodes - 1 if i == num_windows - 1 else min(num_episodes, (i + 1) * window_size) - 1
+        if start_idx <= end_idx:
+            windows.append((start_idx, end_idx))
+    return windows
+
 def main():
     parser = argparse.ArgumentParser(description="Generate interactive HTML SNA graph")
     parser.add_argument("--input", "-i", required=True, help="Path to episodes JSON file")
@@ -1401,20 +1525,41 @@ def main():
     parser.add_argument("--title", "-t", default="Interactive Damage & Healing Network", help="Title")
     parser.add_argument("--early-range", nargs=2, type=int, help="Early episodes range (e.g., 0 500)")
     parser.add_argument("--late-range", nargs=2, type=int, help="Late episodes range (e.g., 2500 3000)")
-    parser.add_argument("--compare", action="store_true", help="Generate side-by-side early vs late comparison")
+    parser.add_argument("--compare", action="store_true", help="Generate an early vs late comparison (one document with a window slider)")
+    parser.add_argument("--separate", action="store_true", help="With --compare, write separate _early/_late HTML files instead")
+    parser.add_argument("--timeline", type=int, default=None, help="One document with a slider over N equal training windows")
+    parser.add_argument("--phases", default=None, help="Phases JSON from change_points.py for the --timeline windows")
     args = parser.parse_args()
     
     print(f"Loading episodes from {args.input}...")
     episodes = load_episodes(args.input)
     print(f"Loaded {len(episodes)} episodes")
     
-    if args.compare and args.early_range and args.late_range:
+    if args.timeline or args.phases:
+        temporal, context = build_temporal_graph(episodes)
+        if args.phases:
+            with open(args.phases, "r", encoding="utf-8") as f:
+                windows = [tuple(r) for r in json.load(f)["ranges"]]
+        else:
+            windows = equal_windows(temporal.num_episodes, args.timeline)
+        numbers = temporal.episode_numbers
+        labels = [f"Episodes {numbers[start]}-{numbers[end]}" for start, end in windows]
+        create_timeline_html(temporal, context, windows, labels, args.output, args.title)
+    elif args.compare and args.early_range and args.late_range and not args.separate:
+        temporal, context = build_temporal_graph(episodes)
+        windows = [tuple(args.early_range), tuple(args.late_range)]
+        labels = [f"Early Training (Episodes {args.early_range[0]}-{args.early_range[1]})",
+                  f"Late Training (Episodes {args.late_range[0]}-{args.late_range[1]})"]
+        create_timeline_html(temporal, context, windows, labels, args.output, args.title, by_number=True)
+    elif args.compare and args.early_range and args.late_range:
+        temporal, context = build_temporal_graph(episodes)
+        
         print("\nExtracting early episodes...")
-        early_boss, early_party, early_heal, early_threat, early_taunt, early_class = extract_damage_healing_threat_edges(episodes, tuple(args.early_range))
+        early_boss, early_party, early_heal, early_threat, early_taunt, early_class = extract_range_edges(temporal, context, tuple(args.early_range))
         print(f"Early: {len(early_boss)} boss damage, {len(early_party)} party damage, {len(early_heal)} healing, {len(early_threat)} threat, {len(early_taunt)} taunt")
         
         print("\nExtracting late episodes...")
-        late_boss, late_party, late_heal, late_threat, late_taunt, late_class = extract_damage_healing_threat_edges(episodes, tuple(args.late_range))
+        late_boss, late_party, late_heal, late_threat, late_taunt, late_class = extract_range_edges(temporal, context, tuple(args.late_range))
         print(f"Late: {len(late_boss)} boss damage, {len(late_party)} party damage, {len(late_heal)} healing, {len(late_threat)} threat, {len(late_taunt)} taunt")
         
         # Create two separate HTML files
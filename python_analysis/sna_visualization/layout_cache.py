@@ -0,0 +1,125 @@
+"""
+Disk-cached, warm-started force layouts for the SNA scripts.
+
+cached_layout() looks a layout up in three steps:
+
+  1. exact hit: same nodes, edges, weights and parameters -> stored positions
+  2. same topology (only weights changed) -> warm start from those positions
+  3. similar graph of the same kind drawn earlier with the same
+     method/parameters (largest node overlap among the recent layouts) ->
+     warm start from its positions, new nodes placed at the centroid of
+     their already-placed neighbours
+
+A spring warm start runs only a fraction of the layout iterations.
+kamada_kawai_layout has no iteration count, so its warm start only seeds
+the optimiser with the earlier positions. Successive windows and
+re-renders therefore keep stable positions. Everything is stored through
+graph_cache.GraphCache.
+
+Warm starts make a layout depend on what was drawn before. The kind
+argument (the figure or script) keeps unrelated graphs from warm-starting
+each other. use_cache=False (the scripts' --no-layout-cache) computes a
+fresh layout from the seed alone, without reading or writing the cache.
+"""
+
+from typing import Dict, Optional
+
+import networkx as nx
+import numpy as np
+
+from graph_cache import GraphCache, cache_key, graph_content_hash, topology_hash
+
+# Recent layouts kept per kind/method/parameter family for warm starts
+MAX_RECENT = 16
+
+# Spring warm starts run this fraction of the requested iterations (at least MIN_WARM_ITERATIONS)
+WARM_FRACTION = 0.2
+MIN_WARM_ITERATIONS = 10
+
+_default_cache = None
+
+
+def default_cache() -> GraphCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GraphCache()
+    return _default_cache
+
+
+def _warm_positions(G: nx.Graph, known: Dict, seed: int) -> Optional[Dict]:
+    """Initial positions for every node of G from known positions, or None if nothing overlaps"""
+    placed = {n: np.asarray(known[n], dtype=float) for n in G.nodes() if n in known}
+    if not placed:
+        return None
+    rng = np.random.default_rng(seed)
+    spread = np.ptp(np.array(list(placed.values())), axis=0).max() if len(placed) > 1 else 1.0
+    init = dict(placed)
+    for n in G.nodes():
+        if n in init:
+            continue
+        neighbours = [init[m] for m in nx.all_neighbors(G, n) if m in init]
+        centre = np.mean(neighbours, axis=0) if neighbours else np.mean(list(placed.values()), axis=0)
+        init[n] = centre + rng.normal(scale=0.05 * (spread or 1.0), size=2)
+    return init
+
+
+def _run_layout(G: nx.Graph, method: str, init: Optional[Dict], iterations: int, params: Dict) -> Dict:
+    if method == "spring":
+        return nx.spring_layout(G, pos=init, iterations=iterations, **params)
+    if method == "kamada_kawai":
+        return nx.kamada_kawai_layout(G, pos=init, **params)
+    raise ValueError(f"Unsupported cached layout method: {method}")
+
+
+def cached_layout(G: nx.Graph, method: str = "spring", iterations: int = 50, seed: int = 42,
+                  cache: Optional[GraphCache] = None, warm_start: bool = True, kind: str = "",
+                  use_cache: bool = True, **params) -> Dict:
+    """
+    Force layout of G ("spring" or "kamada_kawai") through the layout cache.
+
+    kind names the figure or script; warm starts only come from the same kind.
+    use_cache=False skips the cache entirely (reproducible from seed alone).
+    Extra keyword arguments go to the networkx layout (k, weight, scale, ...).
+    Returns {node: np.array([x, y])}.
+    """
+    if G.number_of_nodes() == 0:
+        return {}
+    layout_params = dict(params)
+    if method == "spring":
+        layout_params["seed"] = seed
+    if not use_cache:
+        return _run_layout(G, method, None, iterations, layout_params)
+
+    cache = cache or default_cache()
+    family = cache_key(method, kind=kind, iterations=iterations, seed=seed, **params)
+    exact_key = cache_key(graph_content_hash(G, params.get("weight", "weight")), family=family)
+    topology_key = cache_key(topology_hash(G), family=family)
+
+    stored = cache.get("layout", exact_key)
+    if stored is not None:
+        return {n: np.asarray(p) for n, p in stored.items()}
+
+    init = None
+    if warm_start:
+        same_topology = cache.get("layout_topology", topology_key)
+        if same_topology is not None:
+            init = _warm_positions(G, same_topology, seed)
+        else:
+            recent = cache.get("layout_recent", family) or []
+            nodes = set(G.nodes())
+            best = max(recent, key=lambda entry: len(nodes & entry[0]) / len(nodes | entry[0]), default=None)
+            if best is not None and nodes & best[0]:
+                init = _warm_positions(G, best[1], seed)
+
+    run_iterations = iterations
+    if init is not None:
+        run_iterations = max(MIN_WARM_ITERATIONS, int(iterations * WARM_FRACTION))
+    pos = _run_layout(G, method, init, run_iterations, layout_params)
+
+    plain = {n: (float(p[0]), float(p[1])) for n, p in pos.items()}
+    cache.put("layout", exact_key, plain)
+    cache.put("layout_topology", topology_key, plain)
+    recent = [entry for entry in (cache.get("layout_recent", family) or []) if entry[0] != frozenset(plain)]
+    cache.put("layout_recent", family, ([(frozenset(plain), plain)] + recent)[:MAX_RECENT])
+    return pos
+
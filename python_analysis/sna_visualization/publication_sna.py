@@ -6,19 +6,17 @@ Shows damage and healing networks with fixed raid-style layout.
 import argparse
 import json
 import math
-from collections import defaultdict
 from itertools import cycle
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 
-try:
-    from networkx.algorithms import community
-    HAS_COMMUNITY = True
-except ImportError:
-    HAS_COMMUNITY = False
+from communities import render_communities
+from layout_cache import cached_layout
+from sna_tensor import (LAYERS, EncodedEpisodes, SNATensor, encode_interactions, interaction_tensor,
+                        targeted_episodes, class_selection_counts as class_selection_counts_for)
 
 # ============================================================================
 # VISUALIZATION CONFIGURATION - Modify these values to adjust appearance
@@ -58,15 +56,22 @@ def load_episodes(path: str) -> List[dict]:
     else:
         return [data]
 
-def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tuple[int, int] = None) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple], Dict[str, int]]:
+def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tuple[int, int] = None,
+                                        enc: Optional[EncodedEpisodes] = None) -> Tuple[List[Tuple], List[Tuple], List[Tuple], List[Tuple], List[Tuple], Dict[str, int]]:
     """
-    Extract damage, healing, and threat edges from episodes.
-    Returns: (boss_damage_edges, party_damage_edges, healing_edges, threat_edges, class_selection_counts)
+    Extract damage, healing, threat and taunt edges from episodes.
+    Returns: (boss_damage_edges, party_damage_edges, healing_edges, threat_edges, taunt_edges, class_selection_counts)
     boss_damage_edges: [(Boss, target, weight), ...] - Boss attacking party
     party_damage_edges: [(party, Boss, weight), ...] - Party attacking boss
     healing_edges: [(Healer, target, weight), ...] - Only Healer can heal
     threat_edges: [(party, Boss, weight), ...] - Threat generation
+    taunt_edges: [(Tank, Boss, weight), ...] - Taunts (inferred from Tank damage if none recorded)
     class_selection_counts: {role: count} - How often each class was selected
+    
+    Edges are built in the sparse SNA tensor (sna_tensor.interaction_tensor):
+    episodes with targetId use the "targeted" rules, the others the
+    "estimated" rules unless the corpus has explicit damage/heal events.
+    Pass enc (encode_interactions(episodes)) to reuse one encoding across ranges.
     """
     # First, check if episodes have explicit damage/heal events
     has_events = False
@@ -75,13 +80,6 @@ def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tup
         if "events" in first_ep or "combatLog" in first_ep:
             has_events = True
     
-    boss_damage_edges_dict = defaultdict(float)  # (Boss, tgt) -> total_damage
-    party_damage_edges_dict = defaultdict(float)  # (party, Boss) -> total_damage
-    healing_edges_dict = defaultdict(float)  # (Healer, tgt) -> total_healing
-    threat_edges_dict = defaultdict(float)  # (party, Boss) -> total_threat
-    taunt_edges_dict = defaultdict(float)  # (Tank, Boss) -> total_taunt
-    class_selection_counts = defaultdict(int)  # role -> count
-    
     agent_classes = {}
     if episodes and "agentIds" in episodes[0] and "agentClassValues" in episodes[0]:
         for a_id, a_cls in zip(episodes[0]["agentIds"], episodes[0]["agentClassValues"]):
@@ -117,181 +115,70 @@ def extract_damage_healing_threat_edges(episodes: List[dict], episode_range: Tup
             else:
                 role_map[agent_id] = "RangedDPS"
     
-    # Track party activity to infer boss attacks (only if using action-based inference)
-    party_attack_counts = defaultdict(int)  # role -> count
-    seen_selections = set()  # Track class selections per episode per agent
+    enc = enc if enc is not None else encode_interactions(episodes)
+    in_range = np.ones(enc.num_episodes, dtype=bool)
+    if episode_range:
+        in_range = (enc.episode_numbers >= episode_range[0]) & (enc.episode_numbers <= episode_range[1])
+    targeted = targeted_episodes(enc)
     
-    # Aggregate damage and healing
-    for episode in episodes:
-        episode_num = episode.get("episode", 0)
-        
-        # Filter by episode range if specified
-        if episode_range:
-            if not (episode_range[0] <= episode_num <= episode_range[1]):
+    # Nodes are roles; agents missing from the role map keep their id
+    agent_role = [role_map.get(name, name) for name in enc.agent_names]
+    nodes = list(dict.fromkeys(["Boss", "Tank", "Healer", "MeleeDPS", "RangedDPS"] + agent_role))
+    
+    # Explicit damage/heal events (amounts), mapped to roles
+    event_rows = {"layer": [], "src": [], "tgt": [], "weight": []}
+    if has_events:
+        for episode, keep in zip(episodes, in_range):
+            if not keep:
                 continue
-        
-        # Try to use explicit events first
-        if has_events:
-            events = episode.get("events", episode.get("combatLog", []))
-            for ev in events:
+            for ev in episode.get("events", episode.get("combatLog", [])):
                 ev_type = str(ev.get("type", "")).lower()
-                if ev_type in ("damage", "heal"):
-                    src = ev.get("source", "unknown")
-                    tgt = ev.get("target", "unknown")
-                    amt = float(ev.get("amount", 0))
-                    
-                    # Map to roles
-                    src_role = role_map.get(src, src)
-                    tgt_role = role_map.get(tgt, tgt)
-                    
-                    if ev_type == "damage":
-                        if src_role == "Boss":
-                            boss_damage_edges_dict[(src_role, tgt_role)] += amt
-                        elif tgt_role == "Boss":
-                            party_damage_edges_dict[(src_role, tgt_role)] += amt
-                        # Ignore party-to-party damage (not allowed)
-                    elif ev_type == "heal":
-                        # Only Healer can heal
-                        if src_role == "Healer":
-                            healing_edges_dict[(src_role, tgt_role)] += amt
-        
-        # Check for explicit targetId in actions (new format)
-        actions = episode.get("actions", [])
-        has_explicit_targets = any("targetId" in act for act in actions)
-        
-        if has_explicit_targets:
-            # Use explicit targets from actions
-            for act in actions:
-                branch = act.get("branch")
-                val = act.get("value", 0)
-                agent = act.get("agentId", "unknown")
-                target = act.get("targetId")
-                
-                if val == 1 and target:
-                    agent_role = role_map.get(agent, agent)
-                    target_role = role_map.get(target, target)
-                    
-                    if branch == "attack":
-                        # Only allow: Boss→Party or Party→Boss (no party-to-party damage)
-                        if agent_role == "Boss" and target_role != "Boss":
-                            boss_damage_edges_dict[(agent_role, target_role)] += 1.0
-                        elif agent_role != "Boss" and target_role == "Boss":
-                            party_damage_edges_dict[(agent_role, target_role)] += 1.0
-                            party_attack_counts[agent_role] += 1
-                            # Threat generation: damage = threat
-                            threat_edges_dict[(agent_role, target_role)] += 1.0
-                        # Ignore party-to-party attacks
-                    elif branch == "heal":
-                        # Only Healer can heal
-                        if agent_role == "Healer" and target_role != "Boss":
-                            healing_edges_dict[(agent_role, target_role)] += 1.0
-                        # Ignore non-Healer healing attempts
-                    elif branch == "threat_boost" or branch == "taunt":
-                        # Tank taunt/threat boost → Boss
-                        if agent_role == "Tank" and target_role == "Boss":
-                            # Taunt is separate from threat, we'll track it separately
-                            pass  # Will be handled below
-                
-                # Track class selection (count once per episode per agent)
-                if branch == "class_selection" and val >= 0:
-                    agent_role = role_map.get(agent, agent)
-                    # Only count once per episode per agent
-                    episode_key = f"{episode_num}_{agent}"
-                    if episode_key not in seen_selections:
-                        seen_selections.add(episode_key)
-                        class_selection_counts[agent_role] += 1
-        
-        # Fall back to action-based inference if no events and no explicit targets
-        if not has_events and not has_explicit_targets:
-            actions = episode.get("actions", [])
-            
-            for act in actions:
-                branch = act.get("branch")
-                val = act.get("value", 0)
-                agent = act.get("agentId", "unknown")
-                agent_role = role_map.get(agent, agent)
-                
-                if branch == "attack" and val == 1:
-                    # Damage: attacker -> target
-                    agent_lower = agent.lower()
-                    is_boss = agent in boss_ids or agent_lower == "boss" or "boss" in agent_lower
-                    
-                    if is_boss:
-                        # Boss attacks - distribute to party members based on threat/aggro
-                        # Tank takes most damage (aggro anchor), others take less
-                        for pm_id, pm_class in agent_classes.items():
-                            if pm_id not in boss_ids:
-                                pm_role = role_map.get(pm_id, pm_id)
-                                # Boss damage: Tank takes 60%, others 20% each
-                                if pm_role == "Tank":
-                                    damage = 100.0 * 0.6
-                                else:
-                                    damage = 100.0 * 0.2 / max(1, len([p for p in agent_classes.keys() if p not in boss_ids]) - 1)
-                                damage_edges_dict[("Boss", pm_role)] += damage
-                    else:
-                        # Party member attacks boss
-                        # Damage varies by class
-                        if agent_role == "MeleeDPS":
-                            damage = 10.0  # High DPS
-                        elif agent_role == "RangedDPS":
-                            damage = 5.0   # Medium DPS
-                        elif agent_role == "Tank":
-                            damage = 2.0   # Low DPS (tank role)
-                        else:
-                            damage = 1.0
-                        damage_edges_dict[(agent_role, "Boss")] += damage
-                        party_attack_counts[agent_role] += 1
-                
-                elif branch == "heal" and val == 1:
-                    # Healing: only Healer can heal
-                    if agent_role == "Healer":
-                        # Healers typically prioritize Tank (aggro), then DPS
-                        # Tank gets 50%, MeleeDPS 30%, RangedDPS 20%
-                        healing_edges_dict[(agent_role, "Tank")] += 10.0 * 0.5
-                        healing_edges_dict[(agent_role, "MeleeDPS")] += 10.0 * 0.3
-                        healing_edges_dict[(agent_role, "RangedDPS")] += 10.0 * 0.2
-                    # Ignore non-Healer healing attempts
-                
-                # Track class selection (count once per episode per agent)
-                if branch == "class_selection" and val >= 0:
-                    episode_key = f"{episode_num}_{agent}"
-                    if episode_key not in seen_selections:
-                        seen_selections.add(episode_key)
-                        class_selection_counts[agent_role] += 1
-        
-        # Infer boss attacks based on party damage dealt (only if using action-based inference and no explicit targets)
-        # Skip this if we already have explicit boss→party edges from targetId
-        if not has_explicit_targets:
-            total_party_damage = sum(w for (src, tgt), w in party_damage_edges_dict.items() if tgt == "Boss")
-            if total_party_damage > 0:
-                # Boss deals damage proportional to party damage (boss is strong)
-                # Tank takes most aggro (60%), others share the rest
-                for role in ["Tank", "MeleeDPS", "RangedDPS", "Healer"]:
-                    if role in party_attack_counts:
-                        # Boss damage proportional to party damage to boss
-                        party_damage = party_damage_edges_dict.get((role, "Boss"), 0)
-                        if party_damage > 0:
-                            # Boss deals ~10x more damage than party (boss is strong)
-                            if role == "Tank":
-                                boss_damage = party_damage * 0.1 * 0.6  # Tank takes 60% of boss damage
-                            else:
-                                boss_damage = party_damage * 0.1 * 0.4 / max(1, len([r for r in party_attack_counts.keys() if r != "Tank"]))
-                            boss_damage_edges_dict[("Boss", role)] += boss_damage
+                if ev_type not in ("damage", "heal"):
+                    continue
+                src_role = role_map.get(ev.get("source", "unknown"), ev.get("source", "unknown"))
+                tgt_role = role_map.get(ev.get("target", "unknown"), ev.get("target", "unknown"))
+                if ev_type == "damage" and src_role == "Boss":
+                    layer = "boss_damage"
+                elif ev_type == "damage" and tgt_role == "Boss":
+                    layer = "party_damage"
+                elif ev_type == "heal" and src_role == "Healer":
+                    layer = "healing"
+                else:
+                    # Party-to-party damage and non-Healer heals are not allowed
+                    continue
+                for name in (src_role, tgt_role):
+                    if name not in nodes:
+                        nodes.append(name)
+                event_rows["layer"].append(LAYERS.index(layer))
+                event_rows["src"].append(nodes.index(src_role))
+                event_rows["tgt"].append(nodes.index(tgt_role))
+                event_rows["weight"].append(float(ev.get("amount", 0)))
+    
+    node_of_agent = np.array([nodes.index(r) for r in agent_role], dtype=np.int64)
+    tensor = SNATensor.from_coo(np.array(event_rows["layer"], dtype=np.int64), np.array(event_rows["src"], dtype=np.int64),
+                                np.array(event_rows["tgt"], dtype=np.int64), 0, event_rows["weight"], nodes)
+    tensor = tensor.merge(interaction_tensor(enc, node_of_agent, nodes, np.where(in_range & targeted, 0, -1),
+                                             infer_taunt=False, agent_role_names=agent_role))
+    if not has_events:
+        # No events and no explicit targets: estimate damage and healing from action counts
+        tensor = tensor.merge(interaction_tensor(enc, node_of_agent, nodes, np.where(in_range & ~targeted, 0, -1),
+                                                 infer_taunt=False, agent_role_names=agent_role, rules="estimated"))
+    
+    # Class selections are counted once per episode per agent (not from event-only episodes)
+    class_selection_counts = class_selection_counts_for(enc, node_of_agent, nodes,
+                                                        in_range & (targeted | (not has_events)))
     
     # Convert to lists, with minimum weight threshold to prevent completely vanishing edges
     min_weight = 1e-3  # Minimum weight to show edge (prevents edges from completely disappearing)
-    boss_damage_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in boss_damage_edges_dict.items() if weight > 0]
-    party_damage_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in party_damage_edges_dict.items() if weight > 0]
-    healing_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in healing_edges_dict.items() if weight > 0]
-    threat_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in threat_edges_dict.items() if weight > 0]
-    taunt_edges = [(src, tgt, max(weight, min_weight)) for (src, tgt), weight in taunt_edges_dict.items() if weight > 0]
-    
-    # If no explicit taunt actions, infer taunt from Tank attacks (Tank generates taunt when attacking)
-    if not taunt_edges:
-        for (src, tgt), weight in party_damage_edges_dict.items():
-            if src == "Tank" and tgt == "Boss":
-                # Tank attacks generate taunt (proportional to damage)
-                taunt_edges.append((src, tgt, max(weight * 0.5, min_weight)))
+    boss_damage_edges = tensor.edges("boss_damage", min_weight=min_weight)
+    party_damage_edges = tensor.edges("party_damage", min_weight=min_weight)
+    healing_edges = tensor.edges("healing", min_weight=min_weight)
+    threat_edges = tensor.edges("threat", min_weight=min_weight)
+    
+    # Taunt is inferred from Tank attacks (Tank generates taunt when attacking, proportional to damage);
+    # recorded threat_boost taunts are not drawn in the publication figures
+    taunt_edges = [(src, tgt, max(weight * 0.5, min_weight)) for src, tgt, weight in tensor.edges("party_damage")
+                   if src == "Tank" and tgt == "Boss"]
     
     # Debug output
     print(f"  Boss damage edges: {len(boss_damage_edges)}")
@@ -320,7 +207,7 @@ def create_raid_layout():
     }
 
 def draw_publication_graph(damage_edges: List[Tuple], healing_edges: List[Tuple], 
-                          output_path: str, title: str, figsize=(8, 8), style="fixed"):
+                          output_path: str, title: str, figsize=(8, 8), style="fixed", use_layout_cache=True):
     """
     Create publication-ready network graph
     
@@ -403,31 +290,20 @@ def draw_publication_graph(damage_edges: List[Tuple], healing_edges: List[Tuple]
     
     if style == "organic":
         # Organic style with community detection and force-directed layout
-        # Convert to undirected for community detection
+        # Undirected view for degree centrality
         G_undir = G.to_undirected()
         
-        # Community detection for node colors
-        if HAS_COMMUNITY:
-            try:
-                communities = list(community.greedy_modularity_communities(G_undir))
-                community_map = {}
-                for i, comm in enumerate(communities):
-                    for node in comm:
-                        community_map[node] = i
-                
-                # Assign a color per community
-                color_cycle = cycle(["#FF6B6B", "#4ECDC4", "#556270", "#C7F464", "#C44D58"])
-                comm_color = {i: c for i, c in zip(range(len(communities)), color_cycle)}
-                node_colors = [comm_color.get(community_map.get(n, 0), "#95A5A6") for n in G.nodes()]
-            except:
-                # Fallback to role-based colors
-                role_color = {
-                    "Boss": "#FF6B6B", "Tank": "#4ECDC4", "Healer": "#51CF66",
-                    "MeleeDPS": "#FFD93D", "RangedDPS": "#A78BFA"
-                }
-                node_colors = [role_color.get(n, "#95A5A6") for n in G.nodes()]
-        else:
+        # Community detection for node colors (cached per graph, labels matched to the previous render)
+        try:
+            community_map = render_communities(G, "publication_sna", use_cache=use_layout_cache)
+            
+            # Assign a color per community
+            color_cycle = cycle(["#FF6B6B", "#4ECDC4", "#556270", "#C7F464", "#C44D58"])
+            comm_color = {i: c for i, c in zip(range(max(community_map.values(), default=-1) + 1), color_cycle)}
+            node_colors = [comm_color.get(community_map.get(n, 0), "#95A5A6") for n in G.nodes()]
+        except Exception as e:
             # Fallback to role-based colors
+            print(f"Community detection failed ({e}); coloring by role")
             role_color = {
                 "Boss": "#FF6B6B", "Tank": "#4ECDC4", "Healer": "#51CF66",
                 "MeleeDPS": "#FFD93D", "RangedDPS": "#A78BFA"
@@ -445,7 +321,8 @@ def draw_publication_graph(damage_edges: List[Tuple], healing_edges: List[Tuple]
             node_sizes.append(size)
         
         # Force-directed layout
-        pos = nx.spring_layout(G, k=0.8, iterations=200, seed=42)
+        pos = cached_layout(G, "spring", k=0.8, iterations=200, seed=42, kind="publication_sna",
+                            use_cache=use_layout_cache)
         
         # Edge widths from weights using logarithmic scaling (data-driven)
         weights = [G[u][v]["weight"] for u, v in G.edges()]
@@ -544,10 +421,7 @@ def draw_publication_graph(damage_edges: List[Tuple], healing_edges: List[Tuple]
         pos = {node: pos[node] for node in G.nodes() if node in pos}
         
         # Node sizes from centrality
-        try:
-            centrality = nx.degree_centrality(G.to_undirected())
-        except:
-            centrality = {n: 0.1 for n in G.nodes()}
+        centrality = nx.degree_centrality(G.to_undirected(as_view=True))
         
         node_sizes = [max(500, 3000 * centrality.get(n, 0.1)) for n in G.nodes()]
         
@@ -706,6 +580,8 @@ def main():
     parser.add_argument("--compare", action="store_true", help="Generate side-by-side early vs late comparison")
     parser.add_argument("--style", choices=["fixed", "organic"], default="fixed", help="Graph style: fixed (raid layout) or organic (force-directed)")
     parser.add_argument("--dense", action="store_true", help="Generate dense network using role × training window nodes")
+    parser.add_argument("--no-layout-cache", dest="layout_cache", action="store_false",
+                        help="Compute layouts and community labels from scratch instead of reusing/matching cached ones (reproducible)")
     args = parser.parse_args()
     
     print(f"Loading episodes from {args.input}...")
@@ -713,13 +589,14 @@ def main():
     print(f"Loaded {len(episodes)} episodes")
     
     if args.compare and args.early_range and args.late_range:
-        # Generate comparison figure
+        # Generate comparison figure (one encoding shared by both ranges)
+        enc = encode_interactions(episodes)
         print("\nExtracting early episodes...")
-        early_boss_damage, early_party_damage, early_healing, early_threat, early_taunt, early_class_counts = extract_damage_healing_threat_edges(episodes, tuple(args.early_range))
+        early_boss_damage, early_party_damage, early_healing, early_threat, early_taunt, early_class_counts = extract_damage_healing_threat_edges(episodes, tuple(args.early_range), enc)
         print(f"Early: {len(early_boss_damage)} boss damage, {len(early_party_damage)} party damage, {len(early_healing)} healing, {len(early_threat)} threat, {len(early_taunt)} taunt")
         
         print("\nExtracting late episodes...")
-        late_boss_damage, late_party_damage, late_healing, late_threat, late_taunt, late_class_counts = extract_damage_healing_threat_edges(episodes, tuple(args.late_range))
+        late_boss_damage, late_party_damage, late_healing, late_threat, late_taunt, late_class_counts = extract_damage_healing_threat_edges(episodes, tuple(args.late_range), enc)
         print(f"Late: {len(late_boss_damage)} boss damage, {len(late_party_damage)} party damage, {len(late_healing)} healing, {len(late_threat)} threat, {len(late_taunt)} taunt")
         
         # Create side-by-side comparison
@@ -792,6 +669,7 @@ def main():
             max_selection = max(all_selections) if all_selections else 1.0
             min_selection = min(all_selections) if all_selections else 0
             
+            degree_centrality = nx.degree_centrality(G.to_undirected(as_view=True))
             node_sizes = []
             for n in G.nodes():
                 selection_count = class_counts.get(n, 0)
@@ -803,12 +681,8 @@ def main():
                     size = 2000  # Default if all have same count
                 else:
                     # Fallback if no class selections recorded - use degree centrality
-                    try:
-                        centrality = nx.degree_centrality(G.to_undirected())
-                        cent_val = centrality.get(n, 0.1)
-                        size = 500 + 3000 * math.log(1 + cent_val) / math.log(2)  # Log scale for centrality too
-                    except:
-                        size = 500
+                    cent_val = degree_centrality.get(n, 0.1)
+                    size = 500 + 3000 * math.log(1 + cent_val) / math.log(2)  # Log scale for centrality too
                 
                 # Make MeleeDPS bigger for late training
                 if n == "MeleeDPS" and not is_early:
@@ -947,7 +821,7 @@ def main():
         try:
             from dense_sna import create_dense_network, draw_dense_graph
             G, window_names = create_dense_network(episodes, num_windows=5)
-            draw_dense_graph(G, window_names, args.output, args.title)
+            draw_dense_graph(G, window_names, args.output, args.title, use_layout_cache=args.layout_cache)
         except ImportError:
             # Fallback to subprocess if import fails
             import subprocess
@@ -956,7 +830,8 @@ def main():
             script_path = os.path.join(os.path.dirname(__file__), "dense_sna.py")
             result = subprocess.run([sys.executable, script_path,
                                    "--input", args.input, "--output", args.output,
-                                   "--title", args.title], capture_output=True, text=True)
+                                   "--title", args.title] + ([] if args.layout_cache else ["--no-layout-cache"]),
+                                  capture_output=True, text=True)
             print(result.stdout)
             if result.stderr:
                 print(result.stderr)
@@ -967,7 +842,7 @@ def main():
         print(f"Found {len(boss_damage)} boss damage edges, {len(party_damage)} party damage edges, {len(healing)} healing edges, {len(threat)} threat edges")
         
         draw_publication_graph(boss_damage, party_damage, healing, threat, taunt, class_counts, 
-                              args.output, args.title, style=args.style)
+                              args.output, args.title, style=args.style, use_layout_cache=args.layout_cache)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,367 @@
+"""
+Sparse multilayer adjacency tensor for the SNA scripts.
+
+Edges are stored as one sparse tensor over (layer x source x target x window)
+instead of parallel defaultdict(float) edge dicts. The tensor is built with a
+single scatter-add (bincount) over encoded actions, so extraction is O(actions)
+array work even for agent-level graphs with many windows. networkx graphs
+and edge lists are produced from it only at render time.
+
+Layers follow the interactive/publication extractors: boss_damage,
+party_damage, healing, threat, taunt. interaction_tensor() also holds the
+fallback rules of the other extractors (RULES): "estimated" for
+publication_sna on untargeted recordings and "placeholder" (layers
+damage/heal/threat) for episode_sna and aggregate_episodes_sna, so every
+extractor shares one encoding and one scatter-add.
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+
+# episode_arrays lives one directory up (python_analysis/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from episode_arrays import EncodedEpisodes, encode_episodes  # noqa: E402
+
+LAYERS = ["boss_damage", "party_damage", "healing", "threat", "taunt"]
+
+# Layers and extra nodes of the "placeholder" rules (episode_sna, aggregate_episodes_sna)
+PLACEHOLDER_LAYERS = ["damage", "heal", "threat"]
+PLACEHOLDER_NODES = ["Boss", "Heals", "Threat"]
+
+RULES = ["targeted", "estimated", "placeholder"]
+
+# Branches any rule reads; encode_interactions() skips the rest (movement, rotation, ...)
+SNA_BRANCHES = {"attack", "heal", "threat_boost", "taunt", "class_selection"}
+
+# "estimated" rules (publication_sna on untargeted recordings)
+ESTIMATED_ATTACK_DAMAGE = {"MeleeDPS": 10.0, "RangedDPS": 5.0, "Tank": 2.0}  # per party attack, 1.0 otherwise
+ESTIMATED_BOSS_HIT = 100.0
+ESTIMATED_HEAL_SPLIT = {"Tank": 5.0, "MeleeDPS": 3.0, "RangedDPS": 2.0}
+ESTIMATED_BOSS_RETURN = 0.1
+
+# Fixed agent -> role mapping used by interactive_sna.py
+ROLE_MAP = {
+    "Boss": "Boss",
+    "Party Member 1": "Tank",
+    "Party Member 2": "Healer",
+    "Party Member 3": "MeleeDPS",
+    "Party Member 4": "RangedDPS",
+}
+
+# Above this many cells the scatter-add goes through np.unique instead of a dense bincount
+_DENSE_LIMIT = 1 << 24
+
+
+@dataclass
+class SNATensor:
+    """
+    COO tensor: keys are flat ((layer * N + src) * N + tgt) * W + window
+    indices (sorted, unique), values the summed weights.
+    """
+    keys: np.ndarray      # (K,) int64
+    values: np.ndarray    # (K,) float64
+    nodes: List[str]
+    num_windows: int
+    layers: Sequence[str] = tuple(LAYERS)
+
+    @classmethod
+    def from_coo(cls, layer, src, tgt, window, weight, nodes: List[str], num_windows: int = 1,
+                 layers: Sequence[str] = tuple(LAYERS)) -> "SNATensor":
+        """Scatter-add weighted (layer, src, tgt, window) entries"""
+        num_nodes = len(nodes)
+        keys = ((np.asarray(layer, dtype=np.int64) * num_nodes + src) * num_nodes + tgt) * num_windows + window
+        weight = np.broadcast_to(np.asarray(weight, dtype=np.float64), keys.shape)
+        size = len(layers) * num_nodes * num_nodes * num_windows
+        if size <= _DENSE_LIMIT:
+            dense = np.bincount(keys, weights=weight, minlength=size)
+            flat = np.flatnonzero(dense)
+            return cls(flat.astype(np.int64), dense[flat], list(nodes), num_windows, tuple(layers))
+        flat, inverse = np.unique(keys, return_inverse=True)
+        values = np.bincount(inverse.ravel(), weights=weight, minlength=len(flat))
+        keep = values != 0
+        return cls(flat[keep], values[keep], list(nodes), num_windows, tuple(layers))
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def shape(self) -> Tuple[int, int, int, int]:
+        return len(self.layers), self.num_nodes, self.num_nodes, self.num_windows
+
+    def coords(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(layer, src, tgt, window) index arrays of the stored entries"""
+        rest, window = np.divmod(self.keys, self.num_windows)
+        rest, tgt = np.divmod(rest, self.num_nodes)
+        layer, src = np.divmod(rest, self.num_nodes)
+        return layer, src, tgt, window
+
+    def dense(self) -> np.ndarray:
+        out = np.zeros(self.shape, dtype=np.float64)
+        out.reshape(-1)[self.keys] = self.values
+        return out
+
+    def merge(self, other: "SNATensor") -> "SNATensor":
+        """Sum of two tensors over the same nodes, windows and layers"""
+        layer, src, tgt, window = (np.concatenate(pair) for pair in zip(self.coords(), other.coords()))
+        return SNATensor.from_coo(layer, src, tgt, window, np.concatenate([self.values, other.values]),
+                                  self.nodes, self.num_windows, self.layers)
+
+    def collapse_windows(self, windows: Optional[Sequence[int]] = None) -> "SNATensor":
+        """Single-window tensor summing the given windows (all by default)"""
+        layer, src, tgt, window = self.coords()
+        keep = np.ones(len(self.keys), dtype=bool) if windows is None else np.isin(window, windows)
+        return SNATensor.from_coo(layer[keep], src[keep], tgt[keep], 0, self.values[keep],
+                                  self.nodes, 1, self.layers)
+
+    def edges(self, layer: str, windows: Optional[Sequence[int]] = None,
+              min_weight: float = 0.0) -> List[Tuple[str, str, float]]:
+        """[(src, tgt, weight)] of one layer summed over windows, weights floored at min_weight"""
+        collapsed = self.collapse_windows(windows)
+        code, src, tgt, _ = collapsed.coords()
+        rows = np.flatnonzero((code == self.layers.index(layer)) & (collapsed.values > 0))
+        return [(self.nodes[src[i]], self.nodes[tgt[i]], max(float(collapsed.values[i]), min_weight)) for i in rows]
+
+    def window_edges(self, layer: str, window: int) -> List[Tuple[str, str, float]]:
+        return self.edges(layer, [window])
+
+    def edge_list(self, windows: Optional[Sequence[int]] = None) -> List[Tuple[str, str, float, str]]:
+        """[(src, tgt, weight, layer)] of every layer summed over windows"""
+        collapsed = self.collapse_windows(windows)
+        code, src, tgt, _ = collapsed.coords()
+        return [(self.nodes[src[i]], self.nodes[tgt[i]], float(collapsed.values[i]), self.layers[code[i]])
+                for i in np.flatnonzero(collapsed.values > 0)]
+
+    def to_networkx(self, layers: Optional[Sequence[str]] = None, windows: Optional[Sequence[int]] = None) -> nx.DiGraph:
+        """
+        DiGraph summing the selected layers and windows. Each edge carries the
+        total "weight", its per-layer weights in "layers" and the "ev_type" of
+        its heaviest layer.
+        """
+        collapsed = self.collapse_windows(windows)
+        code, src, tgt, _ = collapsed.coords()
+        selected = [self.layers.index(name) for name in (layers or self.layers)]
+        G = nx.DiGraph()
+        for i in np.flatnonzero(np.isin(code, selected)):
+            u, v, name, w = self.nodes[src[i]], self.nodes[tgt[i]], self.layers[code[i]], float(collapsed.values[i])
+            if G.has_edge(u, v):
+                data = G[u][v]
+                data["weight"] += w
+                data["layers"][name] = w
+                data["ev_type"] = max(data["layers"], key=data["layers"].get)
+            else:
+                G.add_edge(u, v, weight=w, layers={name: w}, ev_type=name)
+        return G
+
+
+def agent_roles(enc: EncodedEpisodes, role_map: Optional[Dict[str, str]] = None) -> Tuple[np.ndarray, List[str]]:
+    """(A,) node code per encoded agent and the node names; agents missing from role_map keep their id"""
+    role_map = ROLE_MAP if role_map is None else role_map
+    roles = [role_map.get(name, name) for name in enc.agent_names]
+    nodes = list(dict.fromkeys(roles))
+    return np.array([nodes.index(r) for r in roles], dtype=np.int64), nodes
+
+
+def encode_interactions(episodes: List[dict]) -> EncodedEpisodes:
+    """encode_episodes() keeping only the SNA_BRANCHES actions the extractors read"""
+    return encode_episodes(episodes, only_branches=SNA_BRANCHES)
+
+
+def agent_nodes(enc: EncodedEpisodes) -> Tuple[np.ndarray, List[str], List[str]]:
+    """
+    One node per agent id plus the PLACEHOLDER_NODES the placeholder rules
+    target. Returns (node_of_agent, nodes, agent_role_names) with bosses
+    (EncodedEpisodes.boss_mask) given the role "Boss".
+    """
+    nodes = list(enc.agent_names)
+    nodes += [n for n in PLACEHOLDER_NODES if n not in nodes]
+    roles = ["Boss" if boss else name for name, boss in zip(enc.agent_names, enc.boss_mask())]
+    return np.arange(enc.num_agents, dtype=np.int64), nodes, roles
+
+
+def _expand_to_party(episode: np.ndarray, party: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One copy of each entry per party agent of its episode (party: (E, A) bool).
+    Returns (entry index per copy, party agent per copy, party size per entry).
+    """
+    party_episode, party_agent = np.nonzero(party)
+    size = np.bincount(party_episode, minlength=len(party))
+    start = np.cumsum(size) - size
+    n = size[episode]
+    entry = np.repeat(np.arange(len(episode)), n)
+    offset = np.arange(len(entry)) - np.repeat(np.cumsum(n) - n, n)
+    return entry, party_agent[start[episode[entry]] + offset], n
+
+
+def interaction_tensor(enc: EncodedEpisodes, node_of_agent: np.ndarray, nodes: List[str],
+                       episode_window: Optional[np.ndarray] = None, num_windows: int = 1,
+                       infer_taunt: bool = True, agent_role_names: Optional[Sequence[str]] = None,
+                       rules: str = "targeted", spread_boss_attacks: bool = True) -> SNATensor:
+    """
+    Build an interaction tensor from actions with value 1. rules picks how
+    actions become edges (one of RULES):
+
+      targeted     actions with a targetId (interactive_sna, publication_sna):
+                   attack Boss -> non-boss is boss_damage, party -> Boss is party_damage and threat;
+                   heal Healer -> non-boss is healing; threat_boost Tank -> Boss is taunt
+      estimated    untargeted recordings in publication_sna: party attacks hit the Boss node
+                   for ESTIMATED_ATTACK_DAMAGE; boss attacks hit every party member of the
+                   episode (60% of ESTIMATED_BOSS_HIT to the Tank, 20% shared by the rest);
+                   Healer heals split over ESTIMATED_HEAL_SPLIT; plus boss_damage of
+                   ESTIMATED_BOSS_RETURN per unit of party damage, per window
+      placeholder  untargeted recordings in episode_sna and aggregate_episodes_sna
+                   (PLACEHOLDER_LAYERS damage/heal/threat): boss attacks go to every
+                   party member of the episode (1 / party size each with
+                   spread_boss_attacks), party attacks to the episode's boss, heals
+                   to "Heals" and threat_boosts to "Threat"
+
+    episode_window gives each episode's window (-1 excludes it). Rules only
+    look at the episodes the caller keeps: extractors send targeted episodes
+    (targeted_episodes) to the targeted rules and the rest to a fallback.
+    With infer_taunt, an empty taunt layer is filled with half of the
+    Tank -> Boss party damage (targeted and estimated). The rules look at
+    agent_role_names (one role per encoded agent, default: the agent's node
+    name), so nodes can stay agent ids while roles decide the layer. Party
+    membership comes from the agents listed in each episode.
+    """
+    if rules not in RULES:
+        raise ValueError(f"Unknown rules {rules!r}, expected one of {RULES}")
+    if episode_window is None:
+        episode_window = np.zeros(enc.num_episodes, dtype=np.int64)
+    episode_window = np.asarray(episode_window, dtype=np.int64)
+    node_of_agent = np.asarray(node_of_agent, dtype=np.int64)
+    if agent_role_names is None:
+        agent_role_names = [nodes[n] for n in node_of_agent]
+    role = np.array(agent_role_names, dtype=object)
+
+    rows = np.flatnonzero((enc.action_value == 1) & (episode_window[enc.action_episode] >= 0))
+    if rules == "targeted":
+        rows = rows[enc.action_target[rows] >= 0]
+    src_agent, episode = enc.action_agent[rows], enc.action_episode[rows]
+    src, window, branch = node_of_agent[src_agent], episode_window[episode], enc.action_branch[rows]
+    src_role = role[src_agent]
+    src_boss = src_role == "Boss"
+
+    def is_branch(*names):
+        codes = [enc.branch_code(n) for n in names if enc.branch_code(n) >= 0]
+        return np.isin(branch, codes)
+
+    attack = is_branch("attack")
+    parts = []      # (layer, src, tgt, window, weight)
+    tank_damage = None
+
+    def add(layer, layer_src, layer_tgt, layer_window, weight=1.0):
+        layer_src = np.asarray(layer_src, dtype=np.int64)
+        parts.append((np.full(len(layer_src), layer, dtype=np.int64), layer_src, np.asarray(layer_tgt, dtype=np.int64),
+                      np.asarray(layer_window, dtype=np.int64), np.broadcast_to(np.asarray(weight, dtype=np.float64),
+                                                                                 layer_src.shape)))
+
+    if rules == "targeted":
+        tgt_agent = enc.action_target[rows]
+        tgt, tgt_role = node_of_agent[tgt_agent], role[tgt_agent]
+        tgt_boss = tgt_role == "Boss"
+        party_attack = attack & ~src_boss & tgt_boss
+        for layer, mask in [("boss_damage", attack & src_boss & ~tgt_boss), ("party_damage", party_attack),
+                            ("threat", party_attack), ("healing", is_branch("heal") & (src_role == "Healer") & ~tgt_boss),
+                            ("taunt", is_branch("threat_boost", "taunt") & (src_role == "Tank") & tgt_boss)]:
+            add(LAYERS.index(layer), src[mask], tgt[mask], window[mask])
+        tank = party_attack & (src_role == "Tank")
+        tank_damage = (src[tank], tgt[tank], window[tank], np.ones(tank.sum()))
+
+    elif rules == "estimated":
+        party = (enc.agent_classes >= 0) & (role != "Boss")[None, :]
+        boss_node = nodes.index("Boss")
+        party_attack = attack & ~src_boss
+        damage = np.array([ESTIMATED_ATTACK_DAMAGE.get(r, 1.0) for r in src_role[party_attack]], dtype=np.float64)
+        add(LAYERS.index("party_damage"), src[party_attack], np.full(party_attack.sum(), boss_node),
+            window[party_attack], damage)
+        tank = src_role[party_attack] == "Tank"
+        tank_damage = (src[party_attack][tank], np.full(tank.sum(), boss_node), window[party_attack][tank], damage[tank])
+
+        boss_attack = np.flatnonzero(attack & src_boss)
+        entry, member, n = _expand_to_party(episode[boss_attack], party)
+        share = np.where(role[member] == "Tank", 0.6, 0.2 / np.maximum(1, n[entry] - 1)) * ESTIMATED_BOSS_HIT
+        add(LAYERS.index("boss_damage"), src[boss_attack][entry], node_of_agent[member], window[boss_attack][entry], share)
+
+        heal = np.flatnonzero(is_branch("heal") & (src_role == "Healer"))
+        for target, amount in ESTIMATED_HEAL_SPLIT.items():
+            add(LAYERS.index("healing"), src[heal], np.full(len(heal), nodes.index(target)), window[heal], amount)
+
+        # Boss damage proportional to the party damage each attacking role dealt in a window
+        totals = np.bincount(window[party_attack] * len(nodes) + src[party_attack], weights=damage,
+                             minlength=num_windows * len(nodes)).reshape(num_windows, len(nodes))
+        tank_nodes = np.zeros(len(nodes), dtype=bool)
+        tank_nodes[node_of_agent[role == "Tank"]] = True
+        others = np.maximum(1, ((totals > 0) & ~tank_nodes[None, :]).sum(axis=1, keepdims=True))
+        returned = totals * ESTIMATED_BOSS_RETURN * np.where(tank_nodes[None, :], 0.6, 0.4 / others)
+        win, node = np.nonzero(returned)
+        add(LAYERS.index("boss_damage"), np.full(len(node), boss_node), node, win, returned[win, node])
+
+    else:
+        party = (enc.agent_classes >= 0) & (role != "Boss")[None, :]
+        # Party attacks go to the first listed boss of the episode ("Boss" if none is listed)
+        bosses = (enc.agent_classes >= 0) & (role == "Boss")[None, :]
+        episode_boss = np.where(bosses.any(axis=1), node_of_agent[bosses.argmax(axis=1)],
+                                nodes.index("Boss") if "Boss" in nodes else -1)
+        boss_attack = np.flatnonzero(attack & src_boss)
+        entry, member, n = _expand_to_party(episode[boss_attack], party)
+        add(PLACEHOLDER_LAYERS.index("damage"), src[boss_attack][entry], node_of_agent[member],
+            window[boss_attack][entry], 1.0 / n[entry] if spread_boss_attacks else 1.0)
+        party_attack = attack & ~src_boss
+        add(PLACEHOLDER_LAYERS.index("damage"), src[party_attack], episode_boss[episode[party_attack]], window[party_attack])
+        for layer, names, target in [("heal", ("heal",), "Heals"), ("threat", ("threat_boost",), "Threat")]:
+            mask = is_branch(*names)
+            add(PLACEHOLDER_LAYERS.index(layer), src[mask], np.full(mask.sum(), nodes.index(target)), window[mask])
+
+    layer, layer_src, layer_tgt, layer_window, weight = (np.concatenate(column) for column in zip(*parts))
+    if infer_taunt and tank_damage is not None and not (layer == LAYERS.index("taunt")).any():
+        tank_src, tank_tgt, tank_window, tank_weight = tank_damage
+        layer = np.concatenate([layer, np.full(len(tank_src), LAYERS.index("taunt"), dtype=np.int64)])
+        layer_src, layer_tgt = np.concatenate([layer_src, tank_src]), np.concatenate([layer_tgt, tank_tgt])
+        layer_window, weight = np.concatenate([layer_window, tank_window]), np.concatenate([weight, 0.5 * tank_weight])
+
+    layers = PLACEHOLDER_LAYERS if rules == "placeholder" else LAYERS
+    return SNATensor.from_coo(layer, layer_src, layer_tgt, layer_window, weight, nodes, num_windows, layers)
+
+
+def class_selection_counts(enc: EncodedEpisodes, node_of_agent: np.ndarray, nodes: List[str],
+                           episode_mask: Optional[np.ndarray] = None) -> Dict[str, int]:
+    """Episodes in which each node made a class_selection (value >= 0), counted once per episode and agent"""
+    branch = enc.branch_code("class_selection")
+    if branch < 0:
+        return {}
+    keep = (enc.action_branch == branch) & (enc.action_value >= 0)
+    if episode_mask is not None:
+        keep &= np.asarray(episode_mask)[enc.action_episode]
+    rows = np.flatnonzero(keep)
+    pairs = np.unique(enc.action_episode[rows].astype(np.int64) * enc.num_agents + enc.action_agent[rows])
+    counts = np.bincount(np.asarray(node_of_agent)[pairs % enc.num_agents], minlength=len(nodes))
+    return {nodes[n]: int(counts[n]) for n in np.flatnonzero(counts)}
+
+
+def targeted_episodes(enc: EncodedEpisodes) -> np.ndarray:
+    """(E,) bool, True for episodes with at least one targetId row"""
+    return np.bincount(enc.action_episode[enc.action_target >= 0], minlength=enc.num_episodes) > 0
+
+
+def range_windows(enc: EncodedEpisodes, ranges: Sequence[Tuple[int, int]]) -> np.ndarray:
+    """(E,) window per episode from inclusive recorded-episode-number ranges (-1 outside all of them)"""
+    window = np.full(enc.num_episodes, -1, dtype=np.int64)
+    for w, (start, end) in enumerate(ranges):
+        window[(enc.episode_numbers >= start) & (enc.episode_numbers <= end) & (window < 0)] = w
+    return window
+
+
+def episode_tensor(episodes: List[dict], ranges: Optional[Sequence[Tuple[int, int]]] = None,
+                   role_map: Optional[Dict[str, str]] = None) -> Tuple[SNATensor, EncodedEpisodes]:
+    """Encode episodes and build the role-level tensor, one window per range (or one window overall)"""
+    enc = encode_interactions(episodes)
+    node_of_agent, nodes = agent_roles(enc, role_map)
+    window = range_windows(enc, ranges) if ranges else np.zeros(enc.num_episodes, dtype=np.int64)
+    window[~targeted_episodes(enc)] = -1
+    return interaction_tensor(enc, node_of_agent, nodes, window, len(ranges) if ranges else 1), enc
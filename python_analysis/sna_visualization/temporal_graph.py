@@ -0,0 +1,197 @@
+"""
+Temporal interaction graph: per-block snapshots plus per-episode deltas.
+
+Edge weights are kept as sparse per-episode deltas (episode, edge, weight,
+count) and as prefix-sum snapshots every block_size episodes. The total for
+any episode range is the difference of two snapshots plus the deltas in the
+partial blocks at either end. Slicing a range therefore costs O(edges +
+block_size) instead of re-aggregating raw actions. Window snapshots, first/
+last seen episodes and per-edge occurrence sets come from the same store.
+
+Episode ranges are given as episode indices (position in the corpus);
+number_range_weights() slices by recorded episode numbers instead.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+
+from edge_occurrences import EpisodeOccurrences
+
+
+class TemporalGraph:
+    """Edge weights over time for a fixed node/layer vocabulary"""
+
+    def __init__(self, episode, src, tgt, layer, weight, nodes: List[str], layers: List[str],
+                 episode_numbers: Optional[Sequence[int]] = None, num_episodes: Optional[int] = None,
+                 count=None, block_size: int = 256):
+        episode = np.asarray(episode, dtype=np.int64)
+        weight = np.broadcast_to(np.asarray(weight, dtype=np.float64), episode.shape)
+        count = np.ones(len(episode), dtype=np.int64) if count is None else np.broadcast_to(
+            np.asarray(count, dtype=np.int64), episode.shape)
+        self.nodes = list(nodes)
+        self.layers = list(layers)
+        if episode_numbers is None:
+            episode_numbers = np.arange(num_episodes if num_episodes is not None else int(episode.max(initial=-1)) + 1)
+        self.episode_numbers = np.asarray(episode_numbers, dtype=np.int64)
+        self.block_size = max(1, block_size)
+
+        # Edge vocabulary: unique (layer, src, tgt)
+        num_nodes = max(1, len(self.nodes))
+        code = (np.asarray(layer, dtype=np.int64) * num_nodes + src) * num_nodes + tgt
+        edge_codes, edge = np.unique(code, return_inverse=True)
+        edge = edge.ravel()
+        rest, self.edge_tgt = np.divmod(edge_codes, num_nodes)
+        self.edge_layer, self.edge_src = np.divmod(rest, num_nodes)
+
+        # Deltas: one row per (episode, edge), sorted by episode
+        key = episode * len(edge_codes) + edge
+        keys, inverse = np.unique(key, return_inverse=True)
+        self.delta_weight = np.bincount(inverse.ravel(), weights=weight, minlength=len(keys))
+        self.delta_count = np.bincount(inverse.ravel(), weights=count, minlength=len(keys)).astype(np.int64)
+        self.delta_episode, self.delta_edge = np.divmod(keys, max(1, len(edge_codes)))
+
+        # Snapshots: prefix sums at block boundaries, (num_blocks + 1, K)
+        num_blocks = -(-self.num_episodes // self.block_size)
+        block = self.delta_episode // self.block_size
+        flat = block * self.num_edges + self.delta_edge
+        size = num_blocks * self.num_edges
+        self.snapshot_weight = np.zeros((num_blocks + 1, self.num_edges))
+        self.snapshot_count = np.zeros((num_blocks + 1, self.num_edges), dtype=np.int64)
+        if size:
+            np.cumsum(np.bincount(flat, weights=self.delta_weight, minlength=size).reshape(num_blocks, -1),
+                      axis=0, out=self.snapshot_weight[1:])
+            np.cumsum(np.bincount(flat, weights=self.delta_count, minlength=size).reshape(num_blocks, -1)
+                      .astype(np.int64), axis=0, out=self.snapshot_count[1:])
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episode_numbers)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_src)
+
+    def edge_names(self) -> List[Tuple[str, str, str]]:
+        """(src, tgt, layer) of every edge, in edge-index order"""
+        return [(self.nodes[s], self.nodes[t], self.layers[l])
+                for s, t, l in zip(self.edge_src, self.edge_tgt, self.edge_layer)]
+
+    def index_range(self, start_number: int, end_number: int) -> Tuple[int, int]:
+        """Inclusive index range of episodes whose recorded numbers fall in [start_number, end_number]"""
+        inside = np.flatnonzero((self.episode_numbers >= start_number) & (self.episode_numbers <= end_number))
+        if not len(inside):
+            return 0, -1
+        if inside[-1] - inside[0] + 1 != len(inside):
+            raise ValueError("Episode numbers in this range are not contiguous; query by index instead")
+        return int(inside[0]), int(inside[-1])
+
+    def number_range_weights(self, start_number: int, end_number: int, counts: bool = False) -> np.ndarray:
+        """(K,) weights for recorded episode numbers in [start_number, end_number] (contiguous or not)"""
+        try:
+            start, end = self.index_range(start_number, end_number)
+        except ValueError:
+            numbers = self.episode_numbers[self.delta_episode]
+            rows = np.flatnonzero((numbers >= start_number) & (numbers <= end_number))
+            deltas = self.delta_count if counts else self.delta_weight
+            out = np.zeros(self.num_edges, dtype=deltas.dtype)
+            np.add.at(out, self.delta_edge[rows], deltas[rows])
+            return out
+        return self.range_weights(start, end, counts)
+
+    def _prefix(self, index: int, counts: bool = False) -> np.ndarray:
+        """Sum over episodes [0, index) from the nearest snapshot plus deltas"""
+        index = int(np.clip(index, 0, self.num_episodes))
+        snapshots, deltas = (self.snapshot_count, self.delta_count) if counts else (self.snapshot_weight, self.delta_weight)
+        block = index // self.block_size
+        out = snapshots[block].copy()
+        lo = np.searchsorted(self.delta_episode, block * self.block_size)
+        hi = np.searchsorted(self.delta_episode, index)
+        np.add.at(out, self.delta_edge[lo:hi], deltas[lo:hi])
+        return out
+
+    def range_weights(self, start: int = 0, end: Optional[int] = None, counts: bool = False) -> np.ndarray:
+        """
+        (K,) summed edge weights (or action counts) over the inclusive episode index range.
+        Edges without actions in the range are exactly 0, not a prefix-difference leftover.
+        """
+        end = self.num_episodes - 1 if end is None else end
+        if end < start:
+            return np.zeros(self.num_edges, dtype=np.int64 if counts else np.float64)
+        count = self._prefix(end + 1, True) - self._prefix(start, True)
+        if counts:
+            return count
+        weights = self._prefix(end + 1) - self._prefix(start)
+        weights[count == 0] = 0.0
+        return weights
+
+    def window_weights(self, windows: Sequence[Tuple[int, int]], counts: bool = False) -> np.ndarray:
+        """(W, K) edge weights per inclusive index window"""
+        return np.stack([self.range_weights(s, e, counts) for s, e in windows]) if len(windows) else \
+            np.zeros((0, self.num_edges))
+
+    def first_seen(self) -> np.ndarray:
+        """(K,) first episode index with a non-zero delta per edge (-1 if never)"""
+        out = np.full(self.num_edges, np.iinfo(np.int64).max)
+        np.minimum.at(out, self.delta_edge, self.delta_episode)
+        return np.where(out == np.iinfo(np.int64).max, -1, out)
+
+    def last_seen(self) -> np.ndarray:
+        out = np.full(self.num_edges, -1, dtype=np.int64)
+        np.maximum.at(out, self.delta_edge, self.delta_episode)
+        return out
+
+    def occurrences(self, edge: int) -> EpisodeOccurrences:
+        """Recorded episode numbers (and action counts) an edge occurred in"""
+        rows = np.flatnonzero(self.delta_edge == edge)
+        return EpisodeOccurrences.from_arrays(self.episode_numbers[self.delta_episode[rows]], self.delta_count[rows])
+
+    def all_occurrences(self) -> List[EpisodeOccurrences]:
+        order = np.argsort(self.delta_edge, kind="stable")
+        bounds = np.searchsorted(self.delta_edge[order], np.arange(self.num_edges + 1))
+        return [EpisodeOccurrences.from_arrays(self.episode_numbers[self.delta_episode[order[a:b]]],
+                                               self.delta_count[order[a:b]])
+                for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def edges(self, start: int = 0, end: Optional[int] = None,
+              layers: Optional[Sequence[str]] = None) -> List[Tuple[str, str, str, float]]:
+        """[(src, tgt, layer, weight)] with actions in the index range"""
+        weights = self.range_weights(start, end)
+        present = self.range_weights(start, end, counts=True) > 0
+        selected = np.isin(self.edge_layer, [self.layers.index(name) for name in (layers or self.layers)])
+        return [(self.nodes[self.edge_src[k]], self.nodes[self.edge_tgt[k]], self.layers[self.edge_layer[k]],
+                 float(weights[k])) for k in np.flatnonzero(selected & present)]
+
+    def layer_totals(self, start: int = 0, end: Optional[int] = None) -> Dict[Tuple[str, str, str], float]:
+        """{(src, tgt, layer): weight} over the index range"""
+        return {(s, t, l): w for s, t, l, w in self.edges(start, end)}
+
+    def to_networkx(self, start: int = 0, end: Optional[int] = None,
+                    layers: Optional[Sequence[str]] = None) -> nx.DiGraph:
+        """DiGraph of the range; parallel layers are summed, ev_type is the heaviest layer"""
+        G = nx.DiGraph()
+        for u, v, name, w in self.edges(start, end, layers):
+            if G.has_edge(u, v):
+                data = G[u][v]
+                data["weight"] += w
+                data["layers"][name] = w
+                data["ev_type"] = max(data["layers"], key=data["layers"].get)
+            else:
+                G.add_edge(u, v, weight=w, layers={name: w}, ev_type=name)
+        return G
+
+    @classmethod
+    def from_tensor(cls, tensor, episode_numbers: Sequence[int], block_size: int = 256,
+                    count_tensor=None) -> "TemporalGraph":
+        """
+        From an sna_tensor.SNATensor whose windows are episode indices.
+        count_tensor (same entries) gives the counts, default one per entry.
+        """
+        layer, src, tgt, window = tensor.coords()
+        count = None
+        if count_tensor is not None:
+            assert np.array_equal(count_tensor.keys, tensor.keys), "count_tensor must have the same entries"
+            count = np.rint(count_tensor.values).astype(np.int64)
+        return cls(window, src, tgt, layer, tensor.values, tensor.nodes, list(tensor.layers),
+                   episode_numbers=episode_numbers, count=count, block_size=block_size)
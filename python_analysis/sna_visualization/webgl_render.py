@@ -0,0 +1,143 @@
+"""
+WebGL rendering mode and zoom-dependent edge decimation for the plotly SNA
+scripts.
+
+SVG go.Scatter traces stop being usable once a graph has thousands of
+curved edges. use_webgl() switches the renderers to go.Scattergl above
+WEBGL_EDGE_THRESHOLD edges (or when forced with --render webgl).
+
+In WebGL mode an edge trace starts decimated: each curve keeps only
+COARSE_POINTS samples, and if the trace is still over MAX_COARSE_POINTS
+points only the heaviest edges are drawn. EdgeLOD stores the full and
+coarse arrays as base64 float32 data in the HTML. A small script restyles
+a trace to full detail when the x range is zoomed past ZOOM_THRESHOLD of
+the initial view, and back to coarse when zoomed out.
+"""
+
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Edge count above which "auto" rendering switches to WebGL
+WEBGL_EDGE_THRESHOLD = 1500
+
+# Decimated (zoomed-out) edge traces: samples per curve and point budget per trace
+COARSE_POINTS = 5
+MAX_COARSE_POINTS = 60000
+
+# Full detail is shown once the visible x span is below this fraction of the initial span
+ZOOM_THRESHOLD = 0.5
+
+RENDER_MODES = ["auto", "svg", "webgl"]
+
+_LOD_SCRIPT = """
+(function() {
+  var gd = document.getElementById('{plot_id}');
+  var lod = __LOD__;
+  var threshold = __THRESHOLD__;
+  function decode(s) {
+    var bytes = Uint8Array.from(atob(s), function(c) { return c.charCodeAt(0); });
+    return new Float32Array(bytes.buffer);
+  }
+  var cache = {};
+  function arrays(t, level) {
+    var key = t.index + ':' + level;
+    if (!cache[key]) cache[key] = [decode(t[level][0]), decode(t[level][1])];
+    return cache[key];
+  }
+  var range = gd.layout.xaxis.range || [-1, 1];
+  var initialSpan = range[1] - range[0];
+  var level = 'coarse';
+  gd.on('plotly_relayout', function() {
+    var r = gd.layout.xaxis.range;
+    var next = (r && (r[1] - r[0]) / initialSpan < threshold) ? 'full' : 'coarse';
+    if (next === level) return;
+    level = next;
+    var xs = [], ys = [], idx = [];
+    lod.forEach(function(t) {
+      var a = arrays(t, level);
+      xs.push(a[0]); ys.push(a[1]); idx.push(t.index);
+    });
+    Plotly.restyle(gd, {x: xs, y: ys}, idx);
+  });
+})();
+"""
+
+
+def use_webgl(num_edges: int, render: str = "auto", threshold: int = WEBGL_EDGE_THRESHOLD) -> bool:
+    if render not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render!r}, expected one of {RENDER_MODES}")
+    return render == "webgl" or (render == "auto" and num_edges > threshold)
+
+
+def scatter_class(webgl: bool):
+    """go.Scattergl in WebGL mode, go.Scatter otherwise"""
+    import plotly.graph_objects as go
+    return go.Scattergl if webgl else go.Scatter
+
+
+def decimate_paths(x: np.ndarray, y: np.ndarray, num_points: int, weights: Optional[np.ndarray] = None,
+                   coarse_points: int = COARSE_POINTS, max_points: int = MAX_COARSE_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coarse copy of NaN-separated curve arrays (num_points samples + NaN per
+    edge, as from edge_geometry.bezier_paths): coarse_points samples per
+    edge, keeping only the heaviest edges if over max_points.
+    """
+    stride = num_points + 1
+    x, y = np.asarray(x).reshape(-1, stride), np.asarray(y).reshape(-1, stride)
+    keep = np.arange(len(x))
+    budget = max(1, max_points // (coarse_points + 1))
+    if len(x) > budget:
+        weights = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=float)
+        keep = np.sort(np.argsort(-weights, kind="stable")[:budget])
+    samples = np.unique(np.linspace(0, num_points - 1, min(coarse_points, num_points)).round().astype(int))
+    columns = np.r_[samples, num_points]                     # samples plus the NaN separator
+    return x[keep][:, columns].ravel(), y[keep][:, columns].ravel()
+
+
+def _encode(values: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+class EdgeLOD:
+    """Full and decimated edge arrays per trace, switched by zoom level in the browser"""
+
+    def __init__(self, zoom_threshold: float = ZOOM_THRESHOLD):
+        self.zoom_threshold = zoom_threshold
+        self.traces: List[Dict] = []
+
+    def add(self, trace_index: int, full: Tuple[np.ndarray, np.ndarray], coarse: Tuple[np.ndarray, np.ndarray]):
+        self.traces.append({"index": trace_index, "full": [_encode(full[0]), _encode(full[1])],
+                            "coarse": [_encode(coarse[0]), _encode(coarse[1])]})
+
+    def __bool__(self) -> bool:
+        return bool(self.traces)
+
+    def script(self) -> str:
+        """post_script for fig.write_html ({plot_id} is filled in by plotly)"""
+        return _LOD_SCRIPT.replace("__LOD__", json.dumps(self.traces)).replace(
+            "__THRESHOLD__", json.dumps(self.zoom_threshold))
+
+
+def add_edge_trace(fig, webgl: bool, lod: EdgeLOD, x: np.ndarray, y: np.ndarray, num_points: int,
+                   weights: Optional[np.ndarray] = None, **trace_kwargs):
+    """
+    Add one edge trace. In WebGL mode it starts decimated and is registered
+    with lod for full detail on zoom-in; otherwise it is a plain go.Scatter.
+    """
+    if not webgl:
+        fig.add_trace(scatter_class(False)(x=x, y=y, **trace_kwargs))
+        return
+    coarse = decimate_paths(x, y, num_points, weights)
+    fig.add_trace(scatter_class(True)(x=coarse[0], y=coarse[1], **trace_kwargs))
+    if len(coarse[0]) < len(x):
+        lod.add(len(fig.data) - 1, (x, y), coarse)
+
+
+def write_html(fig, output_path: str, lod: Optional[EdgeLOD] = None):
+    if lod:
+        fig.write_html(output_path, post_script=lod.script())
+    else:
+        fig.write_html(output_path)
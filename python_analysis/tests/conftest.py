@@ -0,0 +1,12 @@
+"""
+The analysis scripts import their siblings directly, so put python_analysis
+and sna_visualization on sys.path the way running them from there would.
+"""
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (os.path.dirname(HERE), os.path.join(os.path.dirname(HERE), "sna_visualization")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
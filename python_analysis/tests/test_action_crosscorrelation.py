@@ -0,0 +1,45 @@
+"""Regression checks for lagged cross-correlation on episodes shorter than the lag window"""
+
+import numpy as np
+
+from action_crosscorrelation import batch_crosscorrelation
+
+
+def direct_correlation(x, y, lag):
+    """Pearson-normalised sum of x[t] * y[t + lag] over the overlapping frames"""
+    x, y = x - x.mean(), y - y.mean()
+    if lag >= 0:
+        raw = (x[:len(x) - lag] * y[lag:]).sum()
+    else:
+        raw = (x[-lag:] * y[:len(y) + lag]).sum()
+    return raw / (len(x) * x.std() * y.std())
+
+
+def test_short_episodes_match_direct_sums_at_every_lag():
+    lengths = np.array([10, 40])
+    series = np.zeros((2, 2, 40))
+    for b, length in enumerate(lengths):
+        frames = np.arange(length)
+        series[b, 0, :length] = frames % 3 == 0
+        series[b, 1, :length] = frames % 4 == 1
+    max_lag = 120
+
+    corr, active = batch_crosscorrelation(series, lengths, max_lag)
+    assert corr.shape == (2, 2, 2, 2 * max_lag + 1)
+    assert active.all()
+    for b, length in enumerate(lengths):
+        x, y = series[b, 0, :length], series[b, 1, :length]
+        for lag in range(-max_lag, max_lag + 1):
+            value = corr[b, 0, 1, lag + max_lag]
+            if abs(lag) < length:
+                assert np.isclose(value, direct_correlation(x, y, lag)), (b, lag)
+            else:
+                assert np.isnan(value), (b, lag)
+
+
+def test_batch_of_only_short_episodes_does_not_index_past_the_fft():
+    frames = np.arange(10)
+    series = np.stack([frames % 2 == 0, frames % 3 == 0]).astype(np.float64)[None]
+    corr, _ = batch_crosscorrelation(series, np.array([10]), 120)
+    assert np.isfinite(corr[0, 0, 1, 120 - 9:120 + 10]).all()
+    assert np.isnan(corr[0, 0, 1, :120 - 9]).all() and np.isnan(corr[0, 0, 1, 120 + 10:]).all()
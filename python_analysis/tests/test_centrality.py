@@ -0,0 +1,24 @@
+"""Regression checks for sampled centrality on large graphs"""
+
+import networkx as nx
+import numpy as np
+
+from centrality import EXACT_BETWEENNESS_NODES, compute_centrality, sampled_closeness
+from graph_cache import GraphCache
+
+
+def test_sampling_every_node_gives_exact_closeness():
+    # Disconnected, with an isolated node: the Wasserman-Faust scaling must match networkx
+    G = nx.disjoint_union(nx.path_graph(5), nx.cycle_graph(7))
+    G.add_node(99)
+    exact = nx.closeness_centrality(G)
+    sampled = sampled_closeness(G, G.number_of_nodes())
+    assert all(np.isclose(sampled[n], exact[n]) for n in G)
+
+
+def test_large_graphs_sample_closeness_too():
+    G = nx.barabasi_albert_graph(EXACT_BETWEENNESS_NODES + 100, 2, seed=1)
+    result = compute_centrality(G, cache=GraphCache(cache_dir=None))
+    assert result["k"] is not None
+    exact = nx.closeness_centrality(G)
+    assert max(abs(result["closeness"][n] - exact[n]) for n in G) < 0.02
@@ -0,0 +1,66 @@
+"""Regression checks for community labels staying stable across windows and renders"""
+
+import networkx as nx
+
+from communities import match_labels, render_communities, window_communities
+from graph_cache import GraphCache
+
+
+def two_cliques(left, right):
+    G = nx.Graph()
+    for members in (left, right):
+        G.add_edges_from(((u, v) for i, u in enumerate(members) for v in members[i + 1:]), weight=1.0)
+    G.add_edge(left[0], right[0], weight=0.1)
+    return G
+
+
+def test_match_labels_follows_overlap():
+    previous = {"a": 0, "b": 0, "c": 1, "d": 1}
+    current = {"a": 1, "b": 1, "c": 0, "d": 0, "e": 2}
+    assert match_labels(previous, current) == {"a": 0, "b": 0, "c": 1, "d": 1, "e": 2}
+
+
+def test_match_labels_gives_unmatched_communities_fresh_labels():
+    previous = {"a": 0, "b": 1}
+    current = {"a": 0, "x": 1, "y": 2}
+    assert match_labels(previous, current) == {"a": 0, "x": 2, "y": 3}
+
+
+def test_window_labels_survive_a_size_swap():
+    # Canonical labels order by size: the second window swaps which group is label 0
+    early = two_cliques(["a", "b", "c", "d"], ["w", "x", "y"])
+    late = two_cliques(["a", "b", "c"], ["w", "x", "y", "z", "v"])
+    labels = window_communities({"early": early, "late": late}, cache=GraphCache(cache_dir=None))
+    assert labels["early"]["a"] == labels["late"]["a"]
+    assert labels["early"]["w"] == labels["late"]["w"]
+    assert labels["late"]["z"] == labels["late"]["w"]
+
+
+def test_render_labels_match_the_previous_render(tmp_path):
+    early = two_cliques(["a", "b", "c", "d"], ["w", "x", "y"])
+    late = two_cliques(["a", "b", "c"], ["w", "x", "y", "z", "v"])
+    first = render_communities(early, "figure", cache=GraphCache(cache_dir=str(tmp_path)))
+    # A fresh process: only the on-disk cache remembers the earlier render
+    second = render_communities(late, "figure", cache=GraphCache(cache_dir=str(tmp_path)))
+    assert second["a"] == first["a"]
+    assert second["w"] == first["w"]
+    assert render_communities(late, "other", cache=GraphCache(cache_dir=str(tmp_path)))["a"] != first["a"]
+
+
+def test_render_labels_without_the_cache(tmp_path):
+    early = two_cliques(["a", "b", "c", "d"], ["w", "x", "y"])
+    late = two_cliques(["a", "b", "c"], ["w", "x", "y", "z", "v"])
+    cache = GraphCache(cache_dir=str(tmp_path))
+    first = render_communities(early, "figure", use_cache=False, cache=cache)
+    assert cache.get("community_render", "figure") is None
+    # Explicit previous labels match without touching the cache
+    second = render_communities(late, "figure", previous=first, use_cache=False, cache=cache)
+    assert second["a"] == first["a"] and second["w"] == first["w"]
+    assert render_communities(late, "figure", use_cache=False, cache=cache)["a"] != first["a"]
+
+
+def test_render_history_keeps_only_the_last_render(tmp_path):
+    cache = GraphCache(cache_dir=str(tmp_path))
+    render_communities(two_cliques(["a", "b"], ["c", "d"]), "figure", cache=cache)
+    render_communities(two_cliques(["e", "f"], ["g", "h"]), "figure", cache=cache)
+    assert set(cache.get("community_render", "figure")) == {"e", "f", "g", "h"}
@@ -0,0 +1,42 @@
+"""Regression checks for following an EpisodeData folder across sessions"""
+
+import json
+import os
+
+from entropy_tracker import EntropyTracker, ingest_directory
+
+
+def write_episode(directory, number, value, mtime):
+    path = os.path.join(directory, f"episode_{number}.json")
+    episode = {"episode": number, "winCondition": "party",
+               "actions": [{"frame": 0, "agentId": "Boss", "branch": "attack", "value": value}]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(episode, f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_new_session_overwriting_file_names_is_counted(tmp_path):
+    tracker = EntropyTracker(window_size=10)
+    write_episode(tmp_path, 0, 1, 1000)
+    write_episode(tmp_path, 1, 0, 1000)
+    assert ingest_directory(tracker, str(tmp_path)) == 2
+    assert ingest_directory(tracker, str(tmp_path)) == 0
+
+    # EpisodeRecorder restarts numbering: the next session rewrites episode_0.json
+    write_episode(tmp_path, 0, 2, 2000)
+    assert ingest_directory(tracker, str(tmp_path)) == 1
+    assert tracker.episodes_seen == 3
+
+
+def test_resumed_state_skips_touched_but_identical_files(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    tracker = EntropyTracker(window_size=10)
+    write_episode(data, 0, 1, 1000)
+    ingest_directory(tracker, str(data))
+    tracker.save(str(tmp_path / "state.json"))
+
+    resumed = EntropyTracker.load(str(tmp_path / "state.json"))
+    write_episode(data, 0, 1, 3000)
+    assert ingest_directory(resumed, str(data)) == 0
+    assert resumed.episodes_seen == 1
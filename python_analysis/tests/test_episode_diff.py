@@ -0,0 +1,24 @@
+"""Regression checks for pairing repeated actions between two recordings"""
+
+from episode_diff import diff_episodes
+
+
+def episode(values):
+    return {"episode": 0, "winCondition": "party", "agentIds": ["Party Member 1"], "agentClassValues": ["Tank"],
+            "actions": [{"frame": 0, "agentId": "Party Member 1", "branch": "movement", "value": v} for v in values]}
+
+
+def test_rows_beyond_64_repeats_keep_their_own_keys():
+    values = [0] * 100
+    changed = list(values)
+    changed[80] = 1
+    report = diff_episodes(episode(values), episode(changed))
+    assert report["value_mismatches"] == 1
+    assert report["matched"] == 99
+    assert report["only_in_a"] == report["only_in_b"] == 0
+
+
+def test_extra_repeat_is_reported_once():
+    report = diff_episodes(episode([0] * 70), episode([0] * 71))
+    assert report["matched"] == 70
+    assert report["only_in_b"] == 1
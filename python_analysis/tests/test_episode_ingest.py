@@ -0,0 +1,41 @@
+"""Regression checks for de-duplicating episode ingest"""
+
+import json
+import os
+
+from episode_ingest import ingest, iter_store_episodes, load_manifest
+
+
+def write_episode(directory, number, **fields):
+    os.makedirs(directory, exist_ok=True)
+    episode = {"episode": number, "winCondition": "boss_defeated", "actions": [], **fields}
+    path = os.path.join(directory, f"episode_{number}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(episode, f)
+    return path
+
+
+def test_same_payload_through_three_directories(tmp_path):
+    store = str(tmp_path / "store")
+    for name in ("a", "b", "c"):
+        write_episode(str(tmp_path / name), 0)
+        ingest([str(tmp_path / name)], store)
+
+    entries = load_manifest(store)["entries"]
+    unique = [e for e in entries if e["duplicate_of"] is None]
+    assert len(unique) == 1
+    assert [e["duplicate_of"] for e in entries[1:]] == [unique[0]["key"]] * 2
+
+    write_episode(str(tmp_path / "d"), 1)
+    stats = ingest([str(tmp_path / "d")], store)
+    assert stats["new"] == 1
+    assert [e["episode"] for e in iter_store_episodes(store)] == [0, 1]
+
+
+def test_reingest_skips_unchanged_files(tmp_path):
+    store = str(tmp_path / "store")
+    write_episode(str(tmp_path / "a"), 0)
+    write_episode(str(tmp_path / "a"), 1)
+    assert ingest([str(tmp_path / "a")], store)["new"] == 2
+    stats = ingest([str(tmp_path / "a")], store)
+    assert stats["unchanged"] == 2 and stats["new"] == 0
@@ -0,0 +1,31 @@
+"""Regression checks for layout warm starts staying within one kind of figure"""
+
+import networkx as nx
+import numpy as np
+
+from graph_cache import GraphCache
+from layout_cache import cached_layout
+
+
+def same_positions(a, b):
+    return a.keys() == b.keys() and all(np.allclose(a[n], b[n]) for n in a)
+
+
+def test_warm_start_only_from_the_same_kind():
+    G = nx.karate_club_graph()
+    H = G.copy()
+    H.add_edge(0, 33, weight=5.0)
+    fresh = cached_layout(H, "spring", seed=1, use_cache=False)
+
+    cache = GraphCache(cache_dir=None)
+    cached_layout(G, "spring", seed=1, cache=cache, kind="episode_sna")
+    assert same_positions(cached_layout(H, "spring", seed=1, cache=cache, kind="aggregate_episodes_sna"), fresh)
+    assert not same_positions(cached_layout(H, "spring", seed=1, cache=cache, kind="episode_sna"), fresh)
+
+
+def test_no_cache_ignores_and_leaves_the_cache(tmp_path):
+    G = nx.karate_club_graph()
+    cache = GraphCache(cache_dir=str(tmp_path))
+    first = cached_layout(G, "spring", seed=1, use_cache=False, cache=cache)
+    assert not any(tmp_path.iterdir())
+    assert same_positions(first, cached_layout(G, "spring", seed=1, use_cache=False, cache=cache))
@@ -0,0 +1,24 @@
+"""Regression checks for repaired corpora being readable by the loaders"""
+
+import json
+
+from episode_arrays import load_episodes
+from schema_validator import validate_corpus
+
+
+def test_repaired_folder_loads_in_corpus_order(tmp_path):
+    # Two sessions: episode numbers restart, and one row has an unknown branch
+    episodes = [{"episode": number, "winCondition": "party", "duration": 1.0,
+                 "agentIds": ["Boss", "Party Member 1"], "agentClassValues": ["Boss", "Tank"],
+                 "actions": [{"frame": 0, "agentId": "Party Member 1", "branch": "attack", "value": 1},
+                             {"frame": 1, "agentId": "Party Member 1", "branch": "dance", "value": 1}]}
+                for number in (0, 1, 0)]
+    bundle = tmp_path / "bundle.json"
+    bundle.write_text(json.dumps({"episodes": episodes}), encoding="utf-8")
+
+    report = validate_corpus(str(bundle), chunk_size=2, repair_dir=str(tmp_path / "repaired"))
+    assert len(report["repaired_files"]) == 3
+
+    repaired = load_episodes(str(tmp_path / "repaired"))
+    assert [e["episode"] for e in repaired] == [0, 1, 0]
+    assert all([a["branch"] for a in e["actions"]] == ["attack"] for e in repaired)
@@ -0,0 +1,22 @@
+"""Regression checks for n-gram hashes staying exact"""
+
+import numpy as np
+import pytest
+
+from sequence_patterns import decode_hash, ngram_hashes
+
+
+def test_hashes_round_trip_at_the_int64_limit():
+    # 2 ** 63 is the largest exact vocabulary ** n
+    tokens = np.ones(70, dtype=np.int64)
+    hashes, start = ngram_hashes(tokens, np.zeros(70, dtype=np.int64), 63, 2)
+    assert len(hashes) == 8
+    assert decode_hash(hashes[0], 63, 2) == [1] * 63
+
+
+def test_overflowing_vocabulary_is_rejected():
+    tokens = np.zeros(20, dtype=np.int64)
+    with pytest.raises(ValueError):
+        ngram_hashes(tokens, np.zeros(20, dtype=np.int64), 10, 90)
+    with pytest.raises(ValueError):
+        ngram_hashes(tokens, np.zeros(20, dtype=np.int64), 64, 2)
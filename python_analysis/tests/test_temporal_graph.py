@@ -0,0 +1,85 @@
+"""Regression checks for slicing episode ranges out of snapshots plus deltas"""
+
+import numpy as np
+import pytest
+
+from temporal_graph import TemporalGraph
+
+NODES = ["Boss", "Tank", "Healer"]
+LAYERS = ["damage", "heal"]
+
+
+def random_actions(num_actions=400, num_episodes=23, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "episode": rng.integers(0, num_episodes, num_actions),
+        "src": rng.integers(0, len(NODES), num_actions),
+        "tgt": rng.integers(0, len(NODES), num_actions),
+        "layer": rng.integers(0, len(LAYERS), num_actions),
+        "weight": rng.random(num_actions),
+    }
+
+
+def brute_force(actions, graph, episodes):
+    """(K,) weights and counts summed over the given episode indices"""
+    weights, counts = np.zeros(graph.num_edges), np.zeros(graph.num_edges, dtype=np.int64)
+    edge_index = {edge: k for k, edge in enumerate(zip(graph.edge_src, graph.edge_tgt, graph.edge_layer))}
+    for e, s, t, l, w in zip(actions["episode"], actions["src"], actions["tgt"], actions["layer"], actions["weight"]):
+        if e in episodes:
+            weights[edge_index[(s, t, l)]] += w
+            counts[edge_index[(s, t, l)]] += 1
+    return weights, counts
+
+
+@pytest.mark.parametrize("block_size", [1, 4, 7, 256])
+def test_every_index_range_matches_a_direct_sum(block_size):
+    actions = random_actions()
+    graph = TemporalGraph(actions["episode"], actions["src"], actions["tgt"], actions["layer"], actions["weight"],
+                          NODES, LAYERS, num_episodes=23, block_size=block_size)
+    for start in range(23):
+        for end in range(start, 23):
+            weights, counts = brute_force(actions, graph, set(range(start, end + 1)))
+            np.testing.assert_allclose(graph.range_weights(start, end), weights, atol=1e-9)
+            np.testing.assert_array_equal(graph.range_weights(start, end, counts=True), counts)
+    assert not graph.range_weights(5, 4).any()
+
+
+def test_number_ranges_with_gaps_fall_back_to_deltas():
+    actions = random_actions(num_episodes=10)
+    # Recorded numbers restart mid-corpus (two sessions), so 3..6 is not one contiguous index run
+    numbers = [0, 1, 2, 3, 4, 5, 6, 7, 3, 4]
+    graph = TemporalGraph(actions["episode"], actions["src"], actions["tgt"], actions["layer"], actions["weight"],
+                          NODES, LAYERS, episode_numbers=numbers, block_size=4)
+    with pytest.raises(ValueError):
+        graph.index_range(3, 6)
+    weights, counts = brute_force(actions, graph, {3, 4, 5, 6, 8, 9})
+    np.testing.assert_allclose(graph.number_range_weights(3, 6), weights, atol=1e-9)
+    np.testing.assert_array_equal(graph.number_range_weights(3, 6, counts=True), counts)
+
+    # A contiguous number range slices by index
+    assert graph.index_range(5, 7) == (5, 7)
+    weights, _ = brute_force(actions, graph, {5, 6, 7})
+    np.testing.assert_allclose(graph.number_range_weights(5, 7), weights, atol=1e-9)
+
+
+def test_edges_and_graph_agree_with_range_weights():
+    actions = random_actions()
+    graph = TemporalGraph(actions["episode"], actions["src"], actions["tgt"], actions["layer"], actions["weight"],
+                          NODES, LAYERS, num_episodes=23, block_size=4)
+    weights = graph.range_weights(3, 17)
+    edges = graph.edges(3, 17)
+    assert len(edges) == int((graph.range_weights(3, 17, counts=True) > 0).sum())
+    assert sum(w for *_, w in edges) == pytest.approx(weights.sum())
+    G = graph.to_networkx(3, 17)
+    assert sum(d["weight"] for _, _, d in G.edges(data=True)) == pytest.approx(weights.sum())
+
+
+def test_empty_ranges_are_exact_zeros():
+    # 0.1 + (0.2 + 0.3) from the snapshot differs from (0.1 + 0.2) + 0.3 from the deltas by 1e-16
+    graph = TemporalGraph([0, 4, 5, 6], [0, 0, 0, 1], [1, 1, 1, 2], [0, 0, 0, 1], [0.1, 0.2, 0.3, 0.4],
+                          NODES, LAYERS, num_episodes=8, block_size=4)
+    weights = graph.range_weights(6, 7)
+    assert weights[graph.edge_layer == 0].tolist() == [0.0]
+    assert graph.edges(6, 7) == [("Tank", "Healer", "heal", 0.4)]
+    assert graph.layer_totals(6, 7) == {("Tank", "Healer", "heal"): 0.4}
+    assert list(graph.to_networkx(6, 7).edges()) == [("Tank", "Healer")]
@@ -0,0 +1,144 @@
+"""
+Per-agent, per-branch Markov transition matrices over training windows.
+
+Counts value(t) -> value(t+1) transitions of every agent's action branches
+into one (window x agent x branch x k x k) tensor with a single np.add.at
+over encoded pair indices. The tensor is a compact behaviour fingerprint:
+it is saved to .npz together with its metadata so stickiness, switching
+rate and drift between windows can be inspected without reloading episodes.
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from episode_arrays import EncodedEpisodes, encode_episodes, load_episodes, window_index
+
+
+@dataclass
+class TransitionTensor:
+    """Transition counts plus the labels needed to read them"""
+    counts: np.ndarray          # (W, A, B, K, K) int64
+    value_offset: int           # value v is stored at index v - value_offset
+    window_bounds: np.ndarray   # (W, 2) first/last recorded episode number per window
+    agent_names: List[str]
+    branch_names: List[str]
+
+    @property
+    def values(self) -> np.ndarray:
+        """Action value of each k index"""
+        return np.arange(self.counts.shape[-1]) + self.value_offset
+
+    def probabilities(self) -> np.ndarray:
+        """Row-normalised transition probabilities (rows without data are 0)"""
+        totals = self.counts.sum(axis=-1, keepdims=True)
+        return np.divide(self.counts, totals, out=np.zeros(self.counts.shape), where=totals > 0)
+
+    def stickiness(self) -> np.ndarray:
+        """(W, A, B) fraction of steps that repeat the previous value"""
+        total = self.counts.sum(axis=(-2, -1))
+        repeats = np.trace(self.counts, axis1=-2, axis2=-1)
+        return np.divide(repeats, total, out=np.full(total.shape, np.nan), where=total > 0)
+
+    def switching_rate(self) -> np.ndarray:
+        """(W, A, B) fraction of steps that change value"""
+        return 1.0 - self.stickiness()
+
+    def value_distribution(self) -> np.ndarray:
+        """(W, A, B, K) marginal distribution of the source values"""
+        rows = self.counts.sum(axis=-1)
+        total = rows.sum(axis=-1, keepdims=True)
+        return np.divide(rows, total, out=np.zeros(rows.shape), where=total > 0)
+
+    def save(self, path: str):
+        np.savez_compressed(path, counts=self.counts, value_offset=self.value_offset,
+                            window_bounds=self.window_bounds,
+                            agent_names=np.array(self.agent_names, dtype=object),
+                            branch_names=np.array(self.branch_names, dtype=object))
+
+    @classmethod
+    def load(cls, path: str) -> "TransitionTensor":
+        data = np.load(path, allow_pickle=True)
+        return cls(counts=data["counts"], value_offset=int(data["value_offset"]),
+                   window_bounds=data["window_bounds"], agent_names=list(data["agent_names"]),
+                   branch_names=list(data["branch_names"]))
+
+
+def transition_tensor(enc: EncodedEpisodes, num_windows: int = 5) -> TransitionTensor:
+    """Count value transitions per (window, agent, branch)"""
+    num_windows = max(1, min(num_windows, max(1, enc.num_episodes)))
+    windows = window_index(enc.num_episodes, num_windows)
+    value_offset = int(enc.action_value.min()) if enc.num_actions else 0
+    k = int(enc.action_value.max()) - value_offset + 1 if enc.num_actions else 1
+    shape = (num_windows, enc.num_agents, len(enc.branch_names), k, k)
+    counts = np.zeros(int(np.prod(shape)), dtype=np.int64)
+
+    if enc.num_actions > 1:
+        # Group each (episode, agent, branch) stream in recording order
+        stream = (enc.action_episode.astype(np.int64) * enc.num_agents + enc.action_agent) \
+            * len(enc.branch_names) + enc.action_branch
+        order = np.lexsort((np.arange(enc.num_actions), enc.action_frame, stream))
+        stream = stream[order]
+        value = enc.action_value[order].astype(np.int64) - value_offset
+        same = stream[1:] == stream[:-1]
+
+        src = np.flatnonzero(same)
+        episode = enc.action_episode[order][src]
+        pair_index = np.ravel_multi_index(
+            (windows[episode], enc.action_agent[order][src], enc.action_branch[order][src],
+             value[src], value[src + 1]),
+            shape)
+        np.add.at(counts, pair_index, 1)
+
+    bounds = np.zeros((num_windows, 2), dtype=np.int64)
+    for w in range(num_windows):
+        numbers = enc.episode_numbers[windows == w]
+        if len(numbers):
+            bounds[w] = (numbers.min(), numbers.max())
+
+    return TransitionTensor(counts=counts.reshape(shape), value_offset=value_offset, window_bounds=bounds,
+                            agent_names=enc.agent_names, branch_names=enc.branch_names)
+
+
+def print_fingerprint(tensor: TransitionTensor):
+    """Print stickiness per agent/branch across windows"""
+    stickiness = tensor.stickiness()
+    labels = [f"{lo}-{hi}" for lo, hi in tensor.window_bounds]
+    print("\n=== Stickiness (P[value repeats]) by episode window ===")
+    print(f"{'agent / branch':<36}" + "".join(f"{label:>14}" for label in labels))
+    for a, agent in enumerate(tensor.agent_names):
+        for b, branch in enumerate(tensor.branch_names):
+            row = stickiness[:, a, b]
+            if np.all(np.isnan(row)):
+                continue
+            print(f"{agent + ' / ' + branch:<36}" + "".join(f"{v:>14.3f}" for v in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-agent action transition matrices by training window")
+    parser.add_argument("input", help="EpisodeData directory, episodes bundle JSON, or a saved .npz tensor")
+    parser.add_argument("--windows", "-w", type=int, default=5, help="Number of training windows")
+    parser.add_argument("--output", "-o", default=None, help="Save the tensor to this .npz file")
+    args = parser.parse_args()
+
+    if args.input.endswith(".npz"):
+        tensor = TransitionTensor.load(args.input)
+    else:
+        episodes = load_episodes(args.input)
+        if not episodes:
+            raise SystemExit(f"No episodes found in {args.input}")
+        print(f"Loaded {len(episodes)} episodes")
+        tensor = transition_tensor(encode_episodes(episodes), num_windows=args.windows)
+
+    print(f"Tensor shape (window x agent x branch x k x k): {tensor.counts.shape}")
+    print_fingerprint(tensor)
+
+    if args.output:
+        tensor.save(args.output)
+        print(f"\nSaved transition tensor to {args.output}")
+
+
+if __name__ == "__main__":
+    main()